@@ -0,0 +1,117 @@
+# app/db/audit.py
+
+"""
+Журнал действий над сессиями (таблица audit_events).
+
+События выводятся из тех же изменений сессий, что рассылает app.db.signals: по разнице снимков "до" и "после"
+понятно, что именно изменилось (ставка, время начала/конца, завершение, удаление). Кто это сделал - берётся из
+current_actor, который middleware выставляет на время обработки каждого апдейта.
+
+Запись в БД не происходит в самом обработчике: события копятся в буфере и пишутся одной пачкой (executemany)
+раз в FLUSH_INTERVAL секунд или при накоплении BATCH_SIZE событий. При остановке бота буфер дописывается.
+"""
+
+import asyncio
+from contextvars import ContextVar
+from datetime import datetime, UTC
+
+from sqlalchemy import insert
+
+from app.db import models, signals
+from app.db.facts import SessionFacts
+from app.misc.config import private_logger
+
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0  # Секунды
+
+# Telegram ID пользователя, чей апдейт сейчас обрабатывается (None - фоновые задачи и скрипты)
+current_actor: ContextVar[int | None] = ContextVar('current_actor', default=None)
+
+
+def _format_time(value: datetime | None) -> str | None:
+    return value.isoformat(sep=' ', timespec='seconds') if value else None
+
+
+def describe_change(old: SessionFacts | None, new: SessionFacts | None) -> list[tuple[str, str | None, str | None]]:
+    """
+    Действия, которые привели от old к new.
+    :return: Список (действие, старое значение, новое значение)
+    """
+    if old is None and new is not None:
+        return [('session_started', None, new.work_position)]
+    if new is None:
+        return [('session_deleted', f'{_format_time(old.started_at)} - {_format_time(old.ended_at)}', None)]
+
+    events = []
+    if old.hour_kopecks_rate != new.hour_kopecks_rate:
+        events.append(('rate_changed', _str_or_none(old.hour_kopecks_rate), _str_or_none(new.hour_kopecks_rate)))
+    if old.started_at != new.started_at:
+        events.append(('start_time_changed', _format_time(old.started_at), _format_time(new.started_at)))
+    if old.ended_at != new.ended_at or old.is_ended != new.is_ended:
+        action = 'session_ended' if not old.is_ended and new.is_ended else 'end_time_changed'
+        events.append((action, _format_time(old.ended_at), _format_time(new.ended_at)))
+    return events
+
+
+def _str_or_none(value) -> str | None:
+    return None if value is None else str(value)
+
+
+class AuditWriter:
+    def __init__(self):
+        self._buffer: list[dict] = []
+        self._flush_task: asyncio.Task | None = None
+        # Будит отложенную запись раньше срока: набралась пачка или бот останавливается
+        self._wakeup = asyncio.Event()
+
+    def on_session_changed(self, old: SessionFacts | None, new: SessionFacts | None):
+        facts = new or old
+        now = datetime.now(UTC).replace(tzinfo=None)
+        actor_id = current_actor.get()
+
+        for action, old_value, new_value in describe_change(old, new):
+            self._buffer.append({'created_at': now, 'actor_id': actor_id, 'target_user_id': facts.user_id,
+                                 'session_id': facts.id, 'action': action,
+                                 'old_value': old_value, 'new_value': new_value})
+        if len(self._buffer) >= BATCH_SIZE:
+            self._wakeup.set()
+        self._schedule()
+
+    def _schedule(self):
+        if not self._buffer or (self._flush_task is not None and not self._flush_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Вне event loop (скрипты): допишется при close()
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Ждём, пока наберётся пачка, но не дольше FLUSH_INTERVAL
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+        except TimeoutError:
+            pass
+        self._wakeup.clear()
+        await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer[:BATCH_SIZE], self._buffer[BATCH_SIZE:]
+            try:
+                async with models.session() as session:
+                    await session.execute(insert(models.AuditEvent), batch)
+                    await session.commit()
+            except Exception as e:
+                private_logger.error(f'Ошибка записи журнала действий ({len(batch)} событий): {e}')
+
+    async def close(self):
+        """Дописывает всё, что осталось в буфере (вызывается при остановке бота)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._wakeup.set()
+            await self._flush_task
+        await self.flush()
+
+
+audit_writer = AuditWriter()
+signals.subscribe(audit_writer.on_session_changed)
@@ -0,0 +1,241 @@
+# app/db/export.py
+
+"""
+Выгрузка истории сессий и пользователей в колоночный формат (Parquet или Arrow IPC) для офлайн-аналитики.
+
+Читаем одной транзакцией чтения (снимок БД), поэтому работающий бот не блокируется, а выгрузка остаётся
+согласованной. Сессии выгружаются только завершёнными. Администратор может править и завершённые сессии (время,
+ставку, ставку работника задним числом), поэтому инкрементальная выгрузка берёт новые сессии и сессии, изменённые
+после прошлой выгрузки (work_sessions.updated_at): файлы - upsert по session_id, строка из более позднего файла
+заменяет строки с тем же session_id из предыдущих. Незавершённая сессия попадёт в выгрузку, когда закончится:
+завершение тоже изменение.
+"""
+
+import json
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+from sqlalchemy import select, or_
+
+from app.db import models, rates
+from app.db.facts import SessionFacts
+
+CHUNK_SIZE = 10_000
+WATERMARK_FILE = 'watermark.json'
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+# Запас для updated_at: изменение, записанное до начала выгрузки, но закоммиченное после, попадёт в следующую
+UPDATED_MARGIN = timedelta(minutes=5)
+
+
+def _import_pyarrow():
+    # pyarrow тяжёлый и нужен только аналитикам, поэтому он необязателен для самого бота
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError('Для выгрузки необходим pyarrow: poetry install --extras analytics') from e
+    return pyarrow
+
+
+def _sessions_schema(pa):
+    timestamp = pa.timestamp('us', tz='UTC')
+    return pa.schema([
+        ('session_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('telegram_id', pa.int64()),
+        ('started_at', timestamp),
+        ('ended_at', timestamp),
+        ('hour_kopecks_rate', pa.int64()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('work_position', pa.string()),
+        ('duration_seconds', pa.int64()),
+        ('payment_kopecks', pa.int64()),
+    ])
+
+
+def _users_schema(pa):
+    return pa.schema([
+        ('user_id', pa.int64()),
+        ('telegram_id', pa.int64()),
+    ])
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # SQLite не хранит часовой пояс, а в БД всё записано в UTC
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=UTC)
+
+
+async def _batch_history(conn, rows) -> rates.History:
+    # Изменения ставок работников батча - одним запросом на батч
+    ended = [row.ended_date for row in rows if row.ended_date is not None]
+    if not ended:
+        return {}
+    return await rates.load_history(conn, {row.user_id for row in rows},
+                                    after=min(row.created_at for row in rows), before=max(ended))
+
+
+def _sessions_batch(pa, schema, rows, history: rates.History):
+    columns = {name: [] for name in schema.names}
+
+    for row in rows:
+        started_at, ended_at = _as_utc(row.created_at), _as_utc(row.ended_date)
+        rate = row.hour_kopecks_rate
+        # Сумма - через SessionFacts с изменениями ставки внутри сессии, как в отчётах бота и в итогах (rollups).
+        # У старых записей дата окончания может отсутствовать: такие строки оставляем без производных колонок
+        total_seconds = (ended_at - started_at).total_seconds() if ended_at else None
+
+        columns['session_id'].append(row.id)
+        columns['user_id'].append(row.user_id)
+        columns['telegram_id'].append(row.telegram_id)
+        columns['started_at'].append(started_at)
+        columns['ended_at'].append(ended_at)
+        columns['hour_kopecks_rate'].append(rate)
+        columns['latitude'].append(row.geolocation_latitude)
+        columns['longitude'].append(row.geolocation_longitude)
+        columns['work_position'].append(row.work_position)
+        if total_seconds is None:
+            columns['duration_seconds'].append(None)
+            columns['payment_kopecks'].append(None)
+        else:
+            columns['duration_seconds'].append(int(total_seconds))
+            facts = SessionFacts(id=row.id, user_id=row.user_id, started_at=started_at.replace(tzinfo=None),
+                                 ended_at=ended_at.replace(tzinfo=None), is_ended=True, hour_kopecks_rate=rate)
+            columns['payment_kopecks'].append(rates.with_rate_changes(facts, history).payment_kopecks())
+
+    return pa.record_batch([pa.array(columns[name], type=schema.field(name).type) for name in schema.names],
+                           schema=schema)
+
+
+def _users_batch(pa, schema, rows):
+    return pa.record_batch([pa.array([row.id for row in rows], type=pa.int64()),
+                            pa.array([row.telegram_id for row in rows], type=pa.int64())], schema=schema)
+
+
+class _Writer:
+    """Единый интерфейс записи батчей для Parquet и Arrow IPC."""
+
+    def __init__(self, pa, path: Path, schema, file_format: str):
+        if file_format == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self._writer = pa.ipc.new_file(path, schema)
+        self.rows = 0
+
+    def write(self, batch):
+        if batch.num_rows:
+            self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+
+
+def load_watermark(out_dir: Path) -> dict:
+    path = out_dir / WATERMARK_FILE
+    if not path.exists():
+        return {'last_session_id': 0, 'updated_since': None}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def _updated_since(watermark: dict) -> datetime | None:
+    # В watermark до появления updated_at его нет - берём момент той выгрузки
+    value = watermark.get('updated_since') or watermark.get('exported_at')
+    if value is None:
+        return None
+    value = datetime.fromisoformat(value)
+    return value.astimezone(UTC).replace(tzinfo=None) if value.tzinfo else value
+
+
+def _save_watermark(out_dir: Path, watermark: dict):
+    # Сначала пишем во временный файл, чтобы оборванная выгрузка не испортила watermark
+    tmp_path = out_dir / f'{WATERMARK_FILE}.tmp'
+    tmp_path.write_text(json.dumps(watermark, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_path.replace(out_dir / WATERMARK_FILE)
+
+
+async def export_history(out_dir: str | Path, file_format: str = 'parquet', full: bool = False,
+                         chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Выгружает таблицы users и work_sessions в out_dir.
+    :param out_dir: Папка для выгрузки (создаётся при необходимости)
+    :param file_format: 'parquet' или 'arrow'
+    :param full: Игнорировать watermark и выгрузить всю историю заново
+    :param chunk_size: Размер батча строк, читаемых из БД за раз
+    :return: Новый watermark и статистика выгрузки
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат выгрузки: {file_format}')
+
+    pa = _import_pyarrow()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    watermark = {'last_session_id': 0, 'updated_since': None} if full else load_watermark(out_dir)
+
+    suffix = FORMATS[file_format]
+    stamp = datetime.now(UTC).strftime('%Y%m%dT%H%M%SZ')
+    sessions_path = out_dir / f'work_sessions-{stamp}{suffix}'
+    users_path = out_dir / f'users{suffix}'
+
+    sessions_schema, users_schema = _sessions_schema(pa), _users_schema(pa)
+    last_session_id = watermark['last_session_id']
+    updated_since = _updated_since(watermark)
+    # Watermark до появления updated_at: незавершённые на тот момент сессии выгружаем по списку ID
+    pending_ids = set(watermark.get('pending_session_ids', ()))
+    started_at = datetime.now(UTC).replace(tzinfo=None)
+
+    async with models.engine.connect() as conn:
+        # Явная транзакция чтения: все SELECT ниже видят один и тот же снимок БД.
+        # Для остальных СУБД хватает уровня изоляции REPEATABLE READ
+        if conn.dialect.name == 'sqlite':
+            await conn.exec_driver_sql('BEGIN')
+        else:
+            await conn.execution_options(isolation_level='REPEATABLE READ')
+
+        ws = models.WorkSession
+        changed = [ws.id > last_session_id]
+        if updated_since is not None:
+            changed.append(ws.updated_at > updated_since)
+        if pending_ids:
+            changed.append(ws.id.in_(pending_ids))
+        stmt = (select(ws.id, ws.user_id, models.User.telegram_id, ws.created_at, ws.ended_date,
+                       ws.hour_kopecks_rate, ws.geolocation_latitude, ws.geolocation_longitude, ws.work_position)
+                .join(models.User, models.User.id == ws.user_id)
+                .where(ws.is_ended == True)
+                .where(or_(*changed))
+                .order_by(ws.id))
+
+        writer = _Writer(pa, sessions_path, sessions_schema, file_format)
+        try:
+            result = await conn.stream(stmt)
+            async for rows in result.partitions(chunk_size):
+                writer.write(_sessions_batch(pa, sessions_schema, rows, await _batch_history(conn, rows)))
+        finally:
+            writer.close()
+
+        max_id = (await conn.execute(select(ws.id).order_by(ws.id.desc()).limit(1))).scalar_one_or_none()
+
+        # Пользователей немного, поэтому выгружаем их целиком каждый раз
+        users_writer = _Writer(pa, users_path, users_schema, file_format)
+        try:
+            result = await conn.stream(select(models.User.id, models.User.telegram_id).order_by(models.User.id))
+            async for rows in result.partitions(chunk_size):
+                users_writer.write(_users_batch(pa, users_schema, rows))
+        finally:
+            users_writer.close()
+
+    if not writer.rows:
+        # Пустые файлы аналитикам ни к чему
+        sessions_path.unlink(missing_ok=True)
+
+    watermark = {
+        'last_session_id': max(max_id or 0, last_session_id),
+        'updated_since': (started_at - UPDATED_MARGIN).isoformat(sep=' '),
+        'exported_at': datetime.now(UTC).isoformat(),
+    }
+    _save_watermark(out_dir, watermark)
+
+    return {**watermark, 'sessions_exported': writer.rows, 'users_exported': users_writer.rows}
@@ -0,0 +1,73 @@
+# app/db/facts.py
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import inspect
+
+from app.db import models
+
+
+# Неизменяемый "снимок" сессии: его удобно сравнивать до/после изменения и передавать между модулями, не держа
+# открытой SQLAlchemy-сессию (и не рискуя словить ошибку ленивой загрузки)
+@dataclass(frozen=True, slots=True)
+class SessionFacts:
+    id: int
+    user_id: int
+    started_at: datetime  # UTC без tzinfo, как хранит SQLite
+    ended_at: datetime | None
+    is_ended: bool
+    hour_kopecks_rate: int | None
+    latitude: float | None = None
+    longitude: float | None = None
+    work_position: str | None = None
+    telegram_id: int | None = None  # Известен, только если работник был загружен вместе с сессией
+    # Изменения ставки работника внутри сессии: ((момент UTC, новая ставка), ...) по возрастанию (app.db.rates)
+    rate_changes: tuple[tuple[datetime, int], ...] = ()
+
+    @classmethod
+    def from_model(cls, obj: models.WorkSession) -> 'SessionFacts':
+        worker = None if 'worker' in inspect(obj).unloaded else obj.worker
+        return cls(id=obj.id, user_id=obj.user_id, started_at=_naive(obj.created_at), ended_at=_naive(obj.ended_date),
+                   is_ended=bool(obj.is_ended), hour_kopecks_rate=obj.hour_kopecks_rate,
+                   latitude=obj.geolocation_latitude, longitude=obj.geolocation_longitude,
+                   work_position=obj.work_position, telegram_id=worker.telegram_id if worker else None)
+
+    @property
+    def is_closed(self) -> bool:
+        """Сессия завершена и её время уже не растёт."""
+        return self.is_ended and self.ended_at is not None
+
+    def worked_time(self, now: datetime | None = None) -> timedelta:
+        """Длительность сессии: до даты окончания или, если её нет, до now (по умолчанию - текущий момент)."""
+        end = self.ended_at or _naive(now or datetime.now(UTC))
+        return end - self.started_at
+
+    def rate_segments(self, now: datetime | None = None) -> list[tuple[datetime, datetime, int | None]]:
+        """
+        Интервалы сессии со своей ставкой: ставка сессии действует до первого изменения ставки работника внутри
+        сессии, дальше - ставки из истории.
+        :return: [(начало, конец, ставка)]
+        """
+        end = self.ended_at or _naive(now or datetime.now(UTC))
+        segments, start, rate = [], self.started_at, self.hour_kopecks_rate
+        for moment, new_rate in self.rate_changes:
+            if start < moment < end:
+                segments.append((start, moment, rate))
+                start, rate = moment, new_rate
+        segments.append((start, end, rate))
+        return segments
+
+    def payment_kopecks(self, now: datetime | None = None) -> int:
+        """Сумма к выплате в копейках (0, если ставка не задана)."""
+        if not self.hour_kopecks_rate and not self.rate_changes:
+            return 0
+        return int(sum((rate or 0) * (end - start).total_seconds() for start, end, rate in self.rate_segments(now))
+                   / 3600)
+
+
+def _naive(value: datetime | None) -> datetime | None:
+    # В БД всё хранится в UTC, но после записи из кода tzinfo может остаться в объекте - приводим к одному виду
+    if value is None or value.tzinfo is None:
+        return value
+    return value.replace(tzinfo=None) - value.utcoffset()
@@ -1,18 +1,51 @@
-from datetime import datetime, UTC
+import time
+from datetime import datetime, date, UTC
 
-from sqlalchemy import BigInteger, DateTime, func, ForeignKey, String, Float, Boolean
+from sqlalchemy import BigInteger, DateTime, Date, func, ForeignKey, String, Float, Boolean, UniqueConstraint, event, \
+    Index, JSON, LargeBinary, inspect, text, select, insert, update, delete, false, bindparam, table, column
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.ext.asyncio import AsyncAttrs, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped, relationship
 
+from app.misc import geohash, metrics
 from app.misc.config import settings
 
 engine = create_async_engine(settings.DATABASE_URL)
 session = async_sessionmaker(engine)
 
+
+# WAL позволяет читателям (например, выгрузке для аналитики) не блокировать запись самого бота и наоборот
+@event.listens_for(engine.sync_engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+
+# Время и количество запросов: в гистограмму по типу запроса и в разбивку текущего апдейта (app.misc.metrics)
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    statement_type = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    metrics.record_phase('db', time.perf_counter() - context._query_started, metrics.db_query_duration,
+                         statement_type)
+
+
 # В UTC для независимого подсчёта времени
 utcnow = datetime.now(UTC)
 
 
+def _naive_utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     # "Integer" здесь необязателен, ибо поле, итак, по умолчанию byte-типа
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -23,7 +56,12 @@ class User(Base):
     __tablename__ = 'users'
 
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True)
-    # В копейках, так как Float не лучший выбор для вычислений, если None - то ставка берется из os (или не берётся etc)
+    # Ставка (в копейках за час, так как Float не лучший выбор для вычислений) хранится не здесь, а в истории
+    # ставок worker_rates (WorkerRate): при начале смены в сессию проставляется ставка, действующая на этот момент
+
+    # Время автоматического закрытия смены работника (минуты от полуночи по местному времени); важнее времени
+    # закрытия площадки, см. app.misc.sweeper
+    close_minute: Mapped[int | None] = mapped_column()
 
     work_sessions: Mapped['WorkSession | None'] = relationship(back_populates="worker", cascade="all, delete-orphan")
 
@@ -43,6 +81,10 @@ CASCADE позволяет удалять все связанные столбц
 # Сессии работников в виде отдельной таблицы для возможного масштабирования в будущем
 class WorkSession(Base):
     __tablename__ = 'work_sessions'
+    # Поиск активных сессий рядом с точкой (queries.get_sessions_near); по всей истории - индекс geohash.
+    # Сессии работника по времени начала - проверка пересечений (app.db.overlaps)
+    __table_args__ = (Index('ix_work_sessions_is_ended_geohash', 'is_ended', 'geohash'),
+                      Index('ix_work_sessions_user_id_created_at', 'user_id', 'created_at'))
 
     # Получаем время старта работы
     created_at: Mapped[datetime] = mapped_column(DateTime(True), server_default=func.now())
@@ -54,6 +96,8 @@ class WorkSession(Base):
 
     geolocation_latitude: Mapped[float] = mapped_column(Float)  # Широта
     geolocation_longitude: Mapped[float] = mapped_column(Float)  # Долгота
+    # Geohash координат (app.misc.geohash) для поиска сессий рядом с точкой, заполняется при добавлении
+    geohash: Mapped[str | None] = mapped_column(String(geohash.PRECISION), index=True)
 
     # 255 - разумное ограничение, которое навряд ли когда-либо нужно будет увеличивать
     work_position: Mapped[str] = mapped_column(String(255))
@@ -65,8 +109,237 @@ class WorkSession(Base):
     # Если ставки не было и нужно будет удалить сообщение
     old_message_id: Mapped[int] = mapped_column(nullable=True)
 
+    # Рабочая площадка, на которой начата смена, и отметка о начале вне всех площадок (см. app.misc.geofence)
+    site_id: Mapped[int | None] = mapped_column(ForeignKey("work_sites.id", ondelete='SET NULL'))
+    out_of_fence: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+
+    # Последнее изменение строки (UTC): по нему app.db.export находит сессии, которые нужно выгрузить заново.
+    # У сессий, созданных до появления столбца, - NULL
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, index=True, default=_naive_utcnow,
+                                                        onupdate=_naive_utcnow)
+
+
+@event.listens_for(WorkSession, 'before_insert')
+def _set_geohash(mapper, connection, target: WorkSession):
+    if target.geohash is None and target.geolocation_latitude is not None and target.geolocation_longitude is not None:
+        target.geohash = geohash.encode(target.geolocation_latitude, target.geolocation_longitude)
+
+
+# Рабочая площадка: многоугольник (polygon) или круг с центром (latitude, longitude).
+# radius_m - радиус круга или допустимое отклонение от границы многоугольника
+class WorkSite(Base):
+    __tablename__ = 'work_sites'
+
+    name: Mapped[str] = mapped_column(String(255))
+    latitude: Mapped[float] = mapped_column(Float)
+    longitude: Mapped[float] = mapped_column(Float)
+    radius_m: Mapped[float] = mapped_column(Float, default=0)
+    polygon: Mapped[list | None] = mapped_column(JSON)  # [[широта, долгота], ...] без повтора первой вершины
+    # Время автоматического закрытия смен на площадке (минуты от полуночи по местному времени)
+    close_minute: Mapped[int | None] = mapped_column()
+
+
+# Предрасчитанные итоги отработанного времени (rollup), чтобы отчёты не пересчитывали все сессии в Python.
+# Учитываются только завершённые сессии, обновляются инкрементально в app.db.rollups
+class WorkedTimeHourly(Base):
+    __tablename__ = 'worked_time_hourly'
+    __table_args__ = (UniqueConstraint('user_id', 'hour_start'),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete='CASCADE'))
+    hour_start: Mapped[datetime] = mapped_column(DateTime, index=True)  # Начало часа в UTC
+
+    worked_seconds: Mapped[int] = mapped_column(BigInteger, default=0)
+    # Ставка (коп./час) * секунды: хранится без деления на 3600, чтобы суммы не теряли точность при округлении
+    kopeck_seconds: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class WorkedTimeDaily(Base):
+    __tablename__ = 'worked_time_daily'
+    __table_args__ = (UniqueConstraint('user_id', 'day'),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete='CASCADE'))
+    day: Mapped[date] = mapped_column(Date, index=True)  # Локальная дата (см. settings.UTC_OFFSET_HOURS)
+
+    worked_seconds: Mapped[int] = mapped_column(BigInteger, default=0)
+    kopeck_seconds: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+# Маршрут смены по трансляции геопозиции (app.db.tracks): итоги, которые нужны для сводки, и последняя точка,
+# чтобы после перезапуска бота продолжить считать расстояние с неё
+class SessionTrack(Base):
+    __tablename__ = 'session_tracks'
+
+    session_id: Mapped[int] = mapped_column(ForeignKey("work_sessions.id", ondelete='CASCADE'), unique=True)
+    points: Mapped[int] = mapped_column(default=0)
+    distance_m: Mapped[float] = mapped_column(Float, default=0)
+    on_site_seconds: Mapped[int] = mapped_column(default=0)  # Время внутри рабочей площадки (app.misc.geofence)
+    first_at: Mapped[datetime] = mapped_column(DateTime)  # UTC
+    last_at: Mapped[datetime] = mapped_column(DateTime)
+    last_latitude: Mapped[float] = mapped_column(Float)
+    last_longitude: Mapped[float] = mapped_column(Float)
+    last_on_site: Mapped[bool] = mapped_column(Boolean, default=False)
+    chunks: Mapped[int] = mapped_column(default=0)
+    encoded_bytes: Mapped[int] = mapped_column(default=0)
+
+
+# Точки маршрута пачками: каждая пачка - дельта-кодированные (время, широта, долгота), см. app.db.tracks
+class TrackChunk(Base):
+    __tablename__ = 'track_chunks'
+
+    session_id: Mapped[int] = mapped_column(ForeignKey("work_sessions.id", ondelete='CASCADE'), index=True)
+    points: Mapped[int] = mapped_column()
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+
+
+# Журнал действий над сессиями (только добавление записей). Внешних ключей нет намеренно: история должна
+# переживать удаление сессии или работника. Пишется пачками в app.db.audit
+class AuditEvent(Base):
+    __tablename__ = 'audit_events'
+    # Составные индексы под постраничный просмотр истории "от новых к старым" по сессии / работнику
+    __table_args__ = (Index('ix_audit_events_session_id_id', 'session_id', 'id'),
+                      Index('ix_audit_events_target_user_id_id', 'target_user_id', 'id'))
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, index=True)  # UTC
+    actor_id: Mapped[int | None] = mapped_column(BigInteger, index=True)  # Telegram ID; None - система
+    target_user_id: Mapped[int | None] = mapped_column()  # users.id работника
+    session_id: Mapped[int | None] = mapped_column()
+    action: Mapped[str] = mapped_column(String(32))
+    old_value: Mapped[str | None] = mapped_column(String(255))
+    new_value: Mapped[str | None] = mapped_column(String(255))
+
+
+# История ставок работника: ставка действует с effective_from до следующей записи того же работника (app.db.rates).
+# Уникальный индекс (user_id, effective_from) обслуживает и поиск ставки на момент, и поиск изменений в интервале
+class WorkerRate(Base):
+    __tablename__ = 'worker_rates'
+    __table_args__ = (UniqueConstraint('user_id', 'effective_from'),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete='CASCADE'))
+    effective_from: Mapped[datetime] = mapped_column(DateTime)  # UTC
+    hour_kopecks_rate: Mapped[int] = mapped_column()
+
+
+# Смена по плану (составляется вне бота, загружается из CSV, см. app.db.planning). Пересечения смен одного работника
+# отклоняются при загрузке; уникальный индекс (user_id, starts_at) не даёт загрузить тот же план дважды
+class PlannedShift(Base):
+    __tablename__ = 'planned_shifts'
+    __table_args__ = (UniqueConstraint('user_id', 'starts_at'),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete='CASCADE'))
+    site_id: Mapped[int | None] = mapped_column(ForeignKey("work_sites.id", ondelete='SET NULL'))
+    starts_at: Mapped[datetime] = mapped_column(DateTime, index=True)  # UTC; индекс - выборка смен за период
+    ends_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+# Служебные значения (ключ -> строка): версия схемы, хэш зарегистрированных команд бота и т.п.
+class AppMeta(Base):
+    __tablename__ = 'app_meta'
+
+    key: Mapped[str] = mapped_column(String(64), unique=True)
+    value: Mapped[str] = mapped_column(String(255))
+
+
+# Аренда фоновой работы, которую должна выполнять только одна из запущенных копий бота (app.misc.sweeper):
+# копия продлевает аренду, пока работает, а после expires_at её может забрать другая
+class Lease(Base):
+    __tablename__ = 'leases'
+
+    name: Mapped[str] = mapped_column(String(64), unique=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)  # UTC
+
+
+# Версия схемы БД: увеличивается при каждом изменении моделей. Если изменение затрагивает уже существующие таблицы
+# (новый столбец, индекс), SQL для перехода на версию добавляется в MIGRATIONS - новые таблицы создаёт create_all.
+# Шаг миграции - SQL или функция (conn), если данные нужно пересчитать в Python
+SCHEMA_VERSION = 10
+
+
+def _backfill_geohash(conn, batch_size: int = 5_000):
+    # Не WorkSession.__table__: его UPDATE заполняет и updated_at (onupdate), которого в версии 3 ещё нет
+    sessions = table('work_sessions', column('id'), column('geolocation_latitude'), column('geolocation_longitude'),
+                     column('geohash'))
+    rows = conn.execute(select(sessions.c.id, sessions.c.geolocation_latitude, sessions.c.geolocation_longitude)
+                        .where(sessions.c.geohash.is_(None), sessions.c.geolocation_latitude.is_not(None),
+                               sessions.c.geolocation_longitude.is_not(None))).all()
+    for start in range(0, len(rows), batch_size):
+        conn.execute(update(sessions).where(sessions.c.id == bindparam('session_id')),
+                     [{'session_id': row.id, 'geohash': geohash.encode(row[1], row[2])}
+                      for row in rows[start:start + batch_size]])
+
+
+def _backfill_rollups(conn):
+    from app.db import rollups  # rollups сам импортирует models
+
+    rollups.backfill(conn)
+
+
+def _add_column(table: str, column: str):
+    # Для таблиц, появившихся в более поздней версии, чем та, с которой обновляется БД: create_all уже создал их
+    # с актуальными столбцами
+    def step(conn):
+        name = column.split()[0]
+        if name not in {info['name'] for info in inspect(conn).get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column}'))
+    return step
+
+
+MIGRATIONS: dict[int, tuple] = {
+    2: ('ALTER TABLE work_sessions ADD COLUMN site_id INTEGER REFERENCES work_sites (id) ON DELETE SET NULL',
+        'ALTER TABLE work_sessions ADD COLUMN out_of_fence BOOLEAN NOT NULL DEFAULT FALSE'),
+    3: ('ALTER TABLE work_sessions ADD COLUMN geohash VARCHAR(9)',
+        'CREATE INDEX ix_work_sessions_geohash ON work_sessions (geohash)',
+        'CREATE INDEX ix_work_sessions_is_ended_geohash ON work_sessions (is_ended, geohash)',
+        _backfill_geohash),
+    5: ('ALTER TABLE users ADD COLUMN close_minute INTEGER',
+        _add_column('work_sites', 'close_minute INTEGER')),
+    7: ('CREATE INDEX ix_work_sessions_user_id_created_at ON work_sessions (user_id, created_at)',),
+    # Итоги worked_time_hourly / worked_time_daily по сессиям, завершённым до их появления (или пока они
+    # не пересчитывались): раньше для этого нужно было вручную запускать manage.py rebuild-rollups
+    9: (_backfill_rollups,),
+    10: ('ALTER TABLE work_sessions ADD COLUMN updated_at TIMESTAMP',
+         'CREATE INDEX ix_work_sessions_updated_at ON work_sessions (updated_at)'),
+}
+
 
-# Обычно не используется, но добавил для удобства
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+
+def _upgrade_schema(conn, from_version: int):
+    """Создаёт недостающие таблицы и применяет миграции после from_version (синхронно, внутри run_sync)."""
+    # В новой БД create_all сразу создаёт актуальную схему, миграции к ней применять нельзя
+    is_new = not inspect(conn).has_table(User.__tablename__)
+    Base.metadata.create_all(conn)
+    if not is_new:
+        for version in range(from_version + 1, SCHEMA_VERSION + 1):
+            for step in MIGRATIONS.get(version, ()):
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+
+    meta = AppMeta.__table__
+    conn.execute(delete(meta).where(meta.c.key == 'schema_version'))
+    conn.execute(insert(meta).values(key='schema_version', value=str(SCHEMA_VERSION)))
+
+
+async def ensure_schema() -> bool:
+    """
+    Быстрая проверка схемы при запуске: один запрос к app_meta вместо create_all (который проверяет каждую таблицу).
+    Схема создаётся / обновляется, только если версия в БД отличается от SCHEMA_VERSION.
+    :return: True, если схему пришлось создать или обновить
+    """
+    async with engine.connect() as conn:
+        try:
+            stored = await conn.scalar(select(AppMeta.value).where(AppMeta.key == 'schema_version'))
+        except (OperationalError, ProgrammingError):  # app_meta ещё нет: новая БД или БД до появления версии схемы
+            stored = None
+        if stored is not None and int(stored) == SCHEMA_VERSION:
+            return False
+        await conn.rollback()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade_schema, int(stored or 0))
+    return True
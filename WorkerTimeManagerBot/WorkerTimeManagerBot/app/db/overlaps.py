@@ -0,0 +1,150 @@
+# app/db/overlaps.py
+
+"""
+Проверка сессий работника на пересечения по времени: пересекающиеся сессии дважды оплачивают одни и те же часы.
+
+- Одна сессия (правка времени, начало смены): два запроса по индексу (user_id, created_at) - сессии, начатые внутри
+  нового интервала, и последняя начатая до него (только она может заходить в интервал, если пересечений ещё нет).
+- Массовая правка: сессии затронутых работников в общем диапазоне читаются одним запросом, новые интервалы
+  проверяются по дереву интервалов (app.misc.intervals).
+- Сверка всей БД (python manage.py check-overlaps): сессии по порядку индекса и один проход заметающей прямой.
+
+Интервал сессии - [начало, конец); у идущей смены конец не ограничен. Завершённые сессии без даты окончания
+(старые записи) времени не занимают.
+"""
+
+from datetime import datetime
+from typing import AsyncIterator
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import models
+from app.db.facts import SessionFacts
+from app.misc.intervals import IntervalTree, sweep_overlaps
+
+
+class SessionTimeConflict(ValueError):
+    """Новое время сессии недопустимо: конец не позже начала или пересечение с другими сессиями работника."""
+
+    def __init__(self, message: str, session_id: int | None = None, conflicts: list[SessionFacts] = ()):
+        super().__init__(message)
+        self.session_id = session_id
+        self.conflicts = list(conflicts)
+
+
+def _interval(facts: SessionFacts) -> tuple[datetime, datetime | None]:
+    if facts.is_ended:
+        return facts.started_at, facts.ended_at or facts.started_at
+    return facts.started_at, None
+
+
+def _is_empty(start: datetime, end: datetime | None) -> bool:
+    return end is not None and end <= start
+
+
+def _intersects(facts: SessionFacts, start: datetime, end: datetime | None) -> bool:
+    other_start, other_end = _interval(facts)
+    if _is_empty(other_start, other_end):
+        return False
+    return (end is None or other_start < end) and (other_end is None or other_end > start)
+
+
+def check_length(session_id: int | None, start: datetime, end: datetime | None):
+    if _is_empty(start, end):
+        raise SessionTimeConflict('Конец сессии должен быть позже начала', session_id)
+
+
+async def find_conflicts(db_session: AsyncSession, user_id: int, start: datetime, end: datetime | None,
+                         exclude_id: int | None = None) -> list[SessionFacts]:
+    """
+    Сессии работника, пересекающиеся с [start, end).
+    :param end: None - интервал не закончен (идущая смена)
+    :param exclude_id: Сама проверяемая сессия
+    """
+    ws = models.WorkSession
+    conditions = [ws.user_id == user_id]
+    if exclude_id is not None:
+        conditions.append(ws.id != exclude_id)
+
+    inside = select(ws).where(*conditions, ws.created_at >= start)
+    if end is not None:
+        inside = inside.where(ws.created_at < end)
+    previous = select(ws).where(*conditions, ws.created_at < start).order_by(ws.created_at.desc()).limit(1)
+
+    candidates = [*await db_session.scalars(previous), *await db_session.scalars(inside)]
+    return [facts for facts in map(SessionFacts.from_model, candidates) if _intersects(facts, start, end)]
+
+
+async def check_interval(db_session: AsyncSession, user_id: int, start: datetime, end: datetime | None,
+                         session_id: int | None = None):
+    """:raise SessionTimeConflict: Интервал пустой или пересекается с другими сессиями работника."""
+    check_length(session_id, start, end)
+    conflicts = await find_conflicts(db_session, user_id, start, end, session_id)
+    if conflicts:
+        raise SessionTimeConflict('Сессия пересекается с другими сессиями работника', session_id, conflicts)
+
+
+async def check_session(db_session: AsyncSession, facts: SessionFacts):
+    """check_interval для снимка сессии с новым временем."""
+    check_length(facts.id, facts.started_at, facts.ended_at)
+    if not _is_empty(*_interval(facts)):
+        await check_interval(db_session, facts.user_id, *_interval(facts), facts.id)
+
+
+async def check_moved(db_session: AsyncSession, moved: list[SessionFacts]):
+    """
+    Проверяет новые интервалы сразу нескольких сессий (в том числе друг с другом).
+    :param moved: Снимки сессий с новым временем
+    :raise SessionTimeConflict: На первой сессии с пустым интервалом или пересечением
+    """
+    if not moved:
+        return
+    for facts in moved:
+        check_length(facts.id, facts.started_at, facts.ended_at)
+
+    ws = models.WorkSession
+    lo = min(facts.started_at for facts in moved)
+    ends = [_interval(facts)[1] for facts in moved]
+    query = select(ws).where(ws.user_id.in_({facts.user_id for facts in moved}), ws.id.not_in([f.id for f in moved]),
+                             or_(ws.ended_date > lo, ws.ended_date.is_(None)))
+    if None not in ends:
+        query = query.where(ws.created_at < max(ends))
+
+    by_user: dict[int, list[SessionFacts]] = {}
+    for facts in [*map(SessionFacts.from_model, await db_session.scalars(query)), *moved]:
+        by_user.setdefault(facts.user_id, []).append(facts)
+    trees = {user_id: IntervalTree((*_interval(facts), facts) for facts in sessions
+                                   if not _is_empty(*_interval(facts)))
+             for user_id, sessions in by_user.items()}
+
+    for facts in moved:
+        if _is_empty(*_interval(facts)):
+            continue
+        conflicts = [other for other in trees[facts.user_id].overlaps(*_interval(facts)) if other.id != facts.id]
+        if conflicts:
+            raise SessionTimeConflict('Сессия пересекается с другими сессиями работника', facts.id, conflicts)
+
+
+async def scan(db_session: AsyncSession) -> AsyncIterator[tuple[str, int, int | None]]:
+    """
+    Сверка всех сессий: O(n log n) на сортировку (её делает индекс (user_id, created_at)) и один проход.
+    :return: Асинхронный итератор (вид, ID сессии, ID сессии, с которой она пересекается): вид 'negative' -
+             конец раньше начала, 'overlap' - пересечение с более ранней сессией того же работника
+    """
+    ws = models.WorkSession
+    result = await db_session.stream_scalars(select(ws).order_by(ws.user_id, ws.created_at))
+    user_id, intervals = None, []
+    async for obj in result:
+        if obj.user_id != user_id:
+            for session_id, other_id in sweep_overlaps(intervals):
+                yield 'overlap', session_id, other_id
+            user_id, intervals = obj.user_id, []
+
+        start, end = _interval(SessionFacts.from_model(obj))
+        if end is not None and end < start:
+            yield 'negative', obj.id, None
+        elif not _is_empty(start, end):  # Пустые интервалы ни с чем не пересекаются
+            intervals.append((start, end, obj.id))
+    for session_id, other_id in sweep_overlaps(intervals):
+        yield 'overlap', session_id, other_id
@@ -0,0 +1,284 @@
+# app/db/planning.py
+
+"""
+Смены по плану (таблица planned_shifts) и сверка их с фактическими сессиями.
+
+План составляется вне бота и загружается из CSV (python manage.py import-shifts): столбцы telegram_id, start, end
+(местное время "YYYY-MM-DD HH:MM") и необязательный site (ID площадки). Загрузка - всё или ничего: строки
+с ошибками, неизвестными работниками или пересечениями (в файле и с уже загруженными сменами, проверка - проход
+заметающей прямой по сменам работника) отклоняют весь файл.
+
+Сверка за период (python manage.py reconcile-shifts) читает смены и сессии двумя запросами, отсортированными
+по (работник, начало), и для каждого работника проходит оба списка одновременно, как при слиянии: указатель
+по сессиям только движется вперёд, поэтому опоздания, ранние уходы, неявки и работа вне плана считаются за один
+проход - O(n log n) вместе с сортировкой, что и на десятках тысяч смен укладывается в доли секунды.
+
+- Опоздание - первая сессия в смене начата позже начала смены больше чем на grace.
+- Ранний уход - последняя сессия в смене закончена раньше конца смены больше чем на grace.
+- Неявка - со сменой не пересекается ни одна сессия.
+- Работа вне плана - время сессий, не покрытое ни одной сменой.
+
+Смены относятся к периоду по началу, работа вне плана - по началу сессии. Будущие смены (ещё не начались) в итоги
+не входят, у идущих смен ранний уход не считается, идущая сессия считается до текущего момента.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta, UTC
+from itertools import groupby
+from typing import Iterable
+
+from sqlalchemy import select, insert
+
+from app.db import models
+from app.db.rollups import local_offset
+from app.misc.intervals import sweep_overlaps
+
+MAX_SHIFT = timedelta(hours=24)
+# Сессии и смены читаются с запасом в MAX_SHIFT по обе стороны периода: этого хватает, чтобы найти всё,
+# что пересекается со сменами и сессиями периода (сессии дольше суток закрывает app.misc.sweeper)
+MARGIN = MAX_SHIFT
+INSERT_BATCH = 10_000
+LOCAL_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class PlanImportError(ValueError):
+    """План не загружен: errors - описания ошибок по строкам файла."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__(f'Ошибок в плане: {len(errors)}')
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class PlanRow:
+    line: int
+    telegram_id: int
+    site_id: int | None
+    starts_at: datetime  # UTC
+    ends_at: datetime
+
+
+@dataclass(slots=True)
+class ShiftResult:
+    shift_id: int
+    user_id: int
+    telegram_id: int
+    starts_at: datetime
+    ends_at: datetime
+    worked_seconds: int = 0  # Время сессий внутри смены
+    late_seconds: int = 0
+    early_leave_seconds: int = 0
+    no_show: bool = False
+
+
+@dataclass(slots=True)
+class WorkerSummary:
+    user_id: int
+    telegram_id: int
+    shifts: int = 0
+    planned_seconds: int = 0
+    worked_seconds: int = 0
+    late: int = 0
+    late_seconds: int = 0
+    early_leaves: int = 0
+    early_leave_seconds: int = 0
+    no_shows: int = 0
+    unplanned_seconds: int = 0
+    results: list[ShiftResult] = field(default_factory=list, repr=False)
+
+
+def _parse_local(value: str) -> datetime:
+    return datetime.strptime(value.strip(), LOCAL_FORMAT) - local_offset()
+
+
+def parse_rows(lines: Iterable[str]) -> list[PlanRow]:
+    """
+    Строки CSV (с заголовком) -> смены по плану.
+    :raise PlanImportError: Нет нужных столбцов или в строках ошибки
+    """
+    reader = csv.DictReader(lines)
+    missing = {'telegram_id', 'start', 'end'} - set(reader.fieldnames or ())
+    if missing:
+        raise PlanImportError([f'Нет столбцов: {", ".join(sorted(missing))}'])
+
+    rows, errors = [], []
+    for record in reader:
+        line = reader.line_num
+        try:
+            site = (record.get('site') or '').strip()
+            row = PlanRow(line, int(record['telegram_id']), int(site) if site else None,
+                          _parse_local(record['start']), _parse_local(record['end']))
+        except (TypeError, ValueError):
+            errors.append(f'Строка {line}: нужны telegram_id, start и end (YYYY-MM-DD HH:MM), site - число')
+            continue
+        if not row.starts_at < row.ends_at <= row.starts_at + MAX_SHIFT:
+            errors.append(f'Строка {line}: конец смены должен быть позже начала, но не больше чем на {MAX_SHIFT}')
+            continue
+        rows.append(row)
+
+    if errors:
+        raise PlanImportError(errors)
+    return rows
+
+
+async def import_shifts(rows: list[PlanRow]) -> int:
+    """
+    Загружает смены одной транзакцией.
+    :return: Количество загруженных смен
+    :raise PlanImportError: Неизвестные работники / площадки или пересечения смен работника
+    """
+    if not rows:
+        return 0
+    shifts, users, sites = models.PlannedShift, models.User, models.WorkSite
+
+    async with models.session() as db_session:
+        user_ids = dict((await db_session.execute(
+            select(users.telegram_id, users.id).where(users.telegram_id.in_({row.telegram_id for row in rows}))
+        )).all())
+        site_ids = {row.site_id for row in rows if row.site_id is not None}
+        known_sites = set(await db_session.scalars(select(sites.id).where(sites.id.in_(site_ids)))) if site_ids \
+            else set()
+
+        errors = [f'Строка {row.line}: работник {row.telegram_id} не найден' for row in rows
+                  if row.telegram_id not in user_ids]
+        errors += [f'Строка {row.line}: площадка {row.site_id} не найдена' for row in rows
+                   if row.site_id is not None and row.site_id not in known_sites]
+        if errors:
+            raise PlanImportError(errors)
+
+        # Уже загруженные смены тех же работников в том же диапазоне - для проверки пересечений вместе с новыми
+        existing = await db_session.execute(
+            select(shifts.user_id, shifts.starts_at, shifts.ends_at, shifts.id)
+            .where(shifts.user_id.in_(set(user_ids.values())),
+                   shifts.starts_at < max(row.ends_at for row in rows),
+                   shifts.starts_at >= min(row.starts_at for row in rows) - MAX_SHIFT)
+        )
+        intervals = [(user_id, start, end, f'смена №{shift_id} из БД') for user_id, start, end, shift_id in existing]
+        intervals += [(user_ids[row.telegram_id], row.starts_at, row.ends_at, f'строка {row.line}') for row in rows]
+        intervals.sort(key=lambda item: (item[0], item[1]))
+        for _, group in groupby(intervals, key=lambda item: item[0]):
+            errors += [f'{key[:1].upper()}{key[1:]} пересекается: {other}'
+                       for key, other in sweep_overlaps(item[1:] for item in group)]
+        if errors:
+            raise PlanImportError(errors)
+
+        values = [{'user_id': user_ids[row.telegram_id], 'site_id': row.site_id, 'starts_at': row.starts_at,
+                   'ends_at': row.ends_at} for row in rows]
+        for start in range(0, len(values), INSERT_BATCH):
+            await db_session.execute(insert(shifts), values[start:start + INSERT_BATCH])
+        await db_session.commit()
+    return len(rows)
+
+
+def _seconds(value: timedelta) -> int:
+    return int(value.total_seconds())
+
+
+def _naive(value: datetime | None) -> datetime | None:
+    # created_at - DateTime(True): вне SQLite приходит с часовым поясом, а смены и now - UTC без tzinfo
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+def reconcile_worker(summary: WorkerSummary, plans: list[tuple], sessions: list[tuple[datetime, datetime]],
+                     period: tuple[datetime, datetime], grace: timedelta, now: datetime):
+    """
+    Один проход по сменам и сессиям работника, оба списка отсортированы по началу.
+    :param plans: [(ID смены, начало, конец)]
+    :param sessions: [(начало, конец)] - конец идущей сессии равен now
+    :param period: Начало и конец периода (UTC): по началу смены и сессии решается, входят ли они в отчёт
+    """
+    period_start, period_end = period
+    covered = [timedelta()] * len(sessions)
+    first = 0  # Первая сессия, которая может пересечься с текущей или следующими сменами
+
+    for shift_id, starts_at, ends_at in plans:
+        while first < len(sessions) and sessions[first][1] <= starts_at:
+            first += 1
+
+        worked, came, left = timedelta(), None, None
+        index = first
+        while index < len(sessions) and sessions[index][0] < ends_at:
+            start, end = max(sessions[index][0], starts_at), min(sessions[index][1], ends_at)
+            if end > start:
+                worked += end - start
+                covered[index] += end - start
+                came = came or start
+                left = max(left or end, end)
+            index += 1
+
+        if not period_start <= starts_at < period_end or starts_at >= now:
+            continue  # Смена вне периода нужна только для подсчёта работы вне плана
+        result = ShiftResult(shift_id, summary.user_id, summary.telegram_id, starts_at, ends_at, _seconds(worked))
+        if came is None:
+            result.no_show = starts_at + grace < now
+        else:
+            if came - starts_at > grace:
+                result.late_seconds = _seconds(came - starts_at)
+            if ends_at <= now and ends_at - left > grace:
+                result.early_leave_seconds = _seconds(ends_at - left)
+
+        summary.results.append(result)
+        summary.shifts += 1
+        summary.planned_seconds += _seconds(ends_at - starts_at)
+        summary.worked_seconds += result.worked_seconds
+        summary.late += bool(result.late_seconds)
+        summary.late_seconds += result.late_seconds
+        summary.early_leaves += bool(result.early_leave_seconds)
+        summary.early_leave_seconds += result.early_leave_seconds
+        summary.no_shows += result.no_show
+
+    summary.unplanned_seconds += sum(_seconds(end - start - cover) for (start, end), cover in zip(sessions, covered)
+                                     if period_start <= start < period_end)
+
+
+async def reconcile(first_day: date, last_day: date, grace: timedelta = timedelta(minutes=5),
+                    now: datetime | None = None) -> list[WorkerSummary]:
+    """
+    Сверка плана с сессиями за период.
+    :param first_day: Первый день периода (локальная дата)
+    :param last_day: Последний день периода включительно
+    :param grace: Допустимое опоздание / ранний уход
+    :return: Итоги по работникам, у которых в периоде есть смены или работа вне плана (с результатами по сменам)
+    """
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    period_start = datetime.combine(first_day, datetime.min.time()) - local_offset()
+    period_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time()) - local_offset()
+    shifts, ws = models.PlannedShift, models.WorkSession
+
+    async with models.session() as db_session:
+        plans = (await db_session.execute(
+            select(shifts.user_id, shifts.id, shifts.starts_at, shifts.ends_at)
+            .where(shifts.starts_at >= period_start - MARGIN, shifts.starts_at < period_end + MARGIN)
+            .order_by(shifts.user_id, shifts.starts_at)
+        )).all()
+        # Завершённые сессии без даты окончания (старые записи) времени не занимают
+        sessions = (await db_session.execute(
+            select(ws.user_id, ws.created_at, ws.ended_date, ws.is_ended)
+            .where(ws.created_at >= period_start - MARGIN, ws.created_at < period_end + MARGIN,
+                   (ws.is_ended == False) | ws.ended_date.is_not(None))
+            .order_by(ws.user_id, ws.created_at)
+        )).all()
+        telegram_ids = dict((await db_session.execute(
+            select(models.User.id, models.User.telegram_id)
+            .where(models.User.id.in_({row[0] for row in plans} | {row[0] for row in sessions}))
+        )).all())
+
+    plans_by_user = {user_id: [row[1:] for row in group] for user_id, group in groupby(plans, key=lambda r: r[0])}
+    sessions = [(user_id, _naive(start), _naive(end), is_ended) for user_id, start, end, is_ended in sessions]
+    sessions_by_user = {
+        user_id: [(start, end if is_ended else max(now, start)) for _, start, end, is_ended in group
+                  if not is_ended or end > start]
+        for user_id, group in groupby(sessions, key=lambda row: row[0])
+    }
+
+    summaries = []
+    for user_id in sorted(plans_by_user.keys() | sessions_by_user.keys()):
+        summary = WorkerSummary(user_id, telegram_ids.get(user_id))
+        reconcile_worker(summary, plans_by_user.get(user_id, []), sessions_by_user.get(user_id, []),
+                         (period_start, period_end), grace, now)
+        if summary.shifts or summary.unplanned_seconds:
+            summaries.append(summary)
+    return summaries
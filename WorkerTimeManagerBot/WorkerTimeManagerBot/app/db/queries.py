@@ -1,14 +1,19 @@
 # app/db/queries.py
 
-from datetime import datetime, timedelta, UTC
-from typing import List
-
-import pytz
-from sqlalchemy import select, update, func
+import heapq
+from dataclasses import replace
+from datetime import datetime, date, timedelta, UTC
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import select, update, delete, func, or_, and_, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, selectinload
 
-from app.db import models
-from app.misc.config import private_logger
+from app.db import models, overlaps, rates, rollups, signals
+from app.db.facts import SessionFacts
+from app.misc import geohash
+from app.misc.config import private_logger, settings
 
 
 async def set_user(telegram_id: int) -> models.User | None:
@@ -76,9 +81,14 @@ async def end_worker_active_session(worker_primary_key_id: int, ended_date: date
                                                   .where(models.WorkSession.user_id == worker_primary_key_id)
                                                   .where(models.WorkSession.is_ended == False))
             if worker_session:
+                old_facts = SessionFacts.from_model(worker_session)
                 worker_session.is_ended = True
                 worker_session.ended_date = ended_date
+                new_facts = SessionFacts.from_model(worker_session)
+
+                old_facts, new_facts = await rollups.apply_session_change(session, old_facts, new_facts)
                 await session.commit()
+                signals.session_changed(old_facts, new_facts)
     except Exception as e:
         private_logger.error(f'Ошибка завершения сессии пользователя PRIMARY_KEY={worker_primary_key_id}: {e}')
 
@@ -87,7 +97,9 @@ async def add_worker_session(
         telegram_id: int,
         latitude: float,
         longitude: float,
-        work_position: str
+        work_position: str,
+        site_id: int | None = None,
+        out_of_fence: bool = False
 ) -> models.WorkSession | None:
     """
     Добавляем сессию пользователя. Проверяем нет ли сессии и добавляем её
@@ -95,6 +107,8 @@ async def add_worker_session(
     :param latitude: Широта геолокации
     :param longitude: Долгота геолокации
     :param work_position: Введённая вручную работников позиция на должности
+    :param site_id: Рабочая площадка, на которой находится работник (см. app.misc.geofence)
+    :param out_of_fence: Смена начата вне всех рабочих площадок
     :return: models WorkerSession type (для масштабирования в будущем)
     """
 
@@ -104,18 +118,32 @@ async def add_worker_session(
 
         async with models.session() as session:
             worker_session = await get_active_worker_session(user.id)
-
-            if not worker_session:
+            is_created = not worker_session
+
+            if is_created:
+                # Смена не должна начинаться внутри другой (например, если администратор перенёс конец в будущее)
+                now = datetime.now(UTC).replace(tzinfo=None)
+                await overlaps.check_interval(session, user.id, now, None)
+                # Ставка работника, действующая на момент начала смены (app.db.rates)
+                rate = await rates.rate_at(session, user.id, now)
                 worker_session = models.WorkSession(user_id=user.id, geolocation_latitude=latitude,
-                                                    geolocation_longitude=longitude, work_position=work_position)
+                                                    geolocation_longitude=longitude, work_position=work_position,
+                                                    site_id=site_id, out_of_fence=out_of_fence, hour_kopecks_rate=rate)
                 session.add(worker_session)
 
                 await session.commit()
                 # Refresh позволяет обновить информацию о поле в таблице согласно текущей установке
                 await session.refresh(worker_session)
 
-            return await session.scalar(select(models.WorkSession).where(models.WorkSession.id == worker_session.id)
-                                        .options(selectinload(models.WorkSession.worker)))
+            worker_session = await session.scalar(select(models.WorkSession)
+                                                  .where(models.WorkSession.id == worker_session.id)
+                                                  .options(selectinload(models.WorkSession.worker)))
+            if is_created:
+                signals.session_changed(None, SessionFacts.from_model(worker_session))
+
+            return worker_session
+    except overlaps.SessionTimeConflict:
+        raise
     except Exception as e:
         private_logger.error(f'Ошибка при установке сессии работника {telegram_id}, Долгота: {longitude},'
                              f'Широта: {latitude}, Позиция: {work_position}: {e}')
@@ -160,12 +188,20 @@ async def update_user_session_rate(session_id: int, rate: int):
     """
     try:
         async with models.session() as session:
-            user = await session.execute(
+            old_facts = await _get_session_facts(session, session_id)
+            await session.execute(
                 update(models.WorkSession)
                 .where(models.WorkSession.id == session_id)
                 .values(hour_kopecks_rate=rate)
             )
+
+            new_facts = replace(old_facts, hour_kopecks_rate=rate) if old_facts else None
+            if old_facts:
+                old_facts, new_facts = await rollups.apply_session_change(session, old_facts, new_facts)
             await session.commit()
+
+            if old_facts:
+                signals.session_changed(old_facts, new_facts)
     except Exception as e:
         private_logger.error(f'Ошибка при обновлении ставки сессии {session}: {e}')
 
@@ -228,26 +264,12 @@ async def get_all_users_count() -> int:
 
 async def get_session_payment(session: models.WorkSession) -> int:
     """
-    Рассчитывает сумму к выплате за сессию.
+    Рассчитывает сумму к выплате за сессию (с изменениями ставки работника внутри неё, как в отчётах и итогах).
     :param session: Объект WorkSession.
     :return: Сумма к выплате в копейках.
     """
     try:
-        user = session.worker
-        rate = session.hour_kopecks_rate
-
-        if rate is None:
-            # Если ставка не установлена, возвращаем 0 или другое значение по умолчанию
-            return 0
-
-        # Используем provided пример кода
-        current_date = pytz.utc.localize(session.ended_date) if session.ended_date else datetime.now(UTC)
-        work_time: timedelta = current_date - pytz.utc.localize(session.created_at)
-
-        total_seconds = work_time.total_seconds()
-        payment = (rate * total_seconds) / 3600
-
-        return int(payment)
+        return (await with_rate_changes(SessionFacts.from_model(session))).payment_kopecks()
     except Exception as e:
         private_logger.error(f"Ошибка при расчете выплаты за сессию {session.id}: {e}")
         return 0
@@ -260,19 +282,13 @@ async def get_session_time(session: models.WorkSession) -> tuple[int, int, int,
         :return: Время.
         """
     try:
-        user = session.worker
-
-        # Используем provided пример кода
-        current_date = pytz.utc.localize(session.ended_date) if session.ended_date else datetime.now(UTC)
-        work_time: timedelta = current_date - pytz.utc.localize(session.created_at)
+        work_time: timedelta = SessionFacts.from_model(session).worked_time()
 
         # Извлечение компонентов с использованием divmod
         days = work_time.days
         hours, rem = divmod(work_time.seconds, 3600)
         minutes, seconds = divmod(rem, 60)
 
-        total_seconds = work_time.total_seconds()
-
         return int(days), int(hours), int(minutes), int(seconds)
     except Exception as e:
         private_logger.error(f"Ошибка при расчете времени за сессию {session.id}: {e}")
@@ -338,33 +354,56 @@ async def get_all_sessions(page: int | None = 1, per_page: int | None = 15) -> L
         return []
 
 
+async def _get_session_facts(session, session_id: int) -> SessionFacts | None:
+    # Только внутри queries: состояние сессии "до" изменения в рамках той же транзакции
+    session_obj = await session.scalar(select(models.WorkSession).where(models.WorkSession.id == session_id)
+                                       .options(selectinload(models.WorkSession.worker)))
+    return SessionFacts.from_model(session_obj) if session_obj else None
+
+
+def _parse_admin_time(value: str) -> datetime:
+    # 'YYYY-MM-DD HH:MM' - местное время (так его вводит администратор), 'YYYY-MM-DD HH:MM:SS' - уже UTC
+    try:
+        return datetime.strptime(f'{value}:00', "%Y-%m-%d %H:%M:%S") - timedelta(hours=settings.UTC_OFFSET_HOURS)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
 async def update_session_start_time(session_id: int, new_start_time: str):
-    """Обновляет время начала сессии."""
-    async with models.session() as session:
-        try:
-            date_object = datetime.strptime(f'{new_start_time}:00', "%Y-%m-%d %H:%M:%S")
-            date_object = date_object - timedelta(hours=3) # MSC to UTC
-        except Exception:
-            date_object = datetime.strptime(f'{new_start_time}', "%Y-%m-%d %H:%M:%S")
-        await session.execute(
-            update(models.WorkSession)
-            .where(models.WorkSession.id == session_id)
-            .values(created_at=date_object)
-        )
-        await session.commit()
+    """
+    Обновляет время начала сессии.
+    :raise SessionTimeConflict: Начало не раньше конца или сессия пересечётся с другими сессиями работника
+    """
+    await _update_session_time(session_id, started_at=_parse_admin_time(new_start_time))
 
 
 async def update_session_end_time(session_id: int, new_end_time: str):
-    """Обновляет время конца сессии."""
+    """
+    Обновляет время конца сессии.
+    :raise SessionTimeConflict: Конец не позже начала или сессия пересечётся с другими сессиями работника
+    """
+    await _update_session_time(session_id, ended_at=_parse_admin_time(new_end_time))
+
+
+async def _update_session_time(session_id: int, **changes: datetime):
+    columns = {'started_at': 'created_at', 'ended_at': 'ended_date'}
     async with models.session() as session:
-        date_object = datetime.strptime(new_end_time, "%Y-%m-%d %H:%M:%S")
+        old_facts = await _get_session_facts(session, session_id)
+        if not old_facts:
+            return
+        new_facts = replace(old_facts, **changes)
+        await overlaps.check_session(session, new_facts)
+
         await session.execute(
             update(models.WorkSession)
             .where(models.WorkSession.id == session_id)
-            .values(ended_date=date_object)
+            .values({columns[name]: value for name, value in changes.items()})
         )
+        old_facts, new_facts = await rollups.apply_session_change(session, old_facts, new_facts)
         await session.commit()
 
+    signals.session_changed(old_facts, new_facts)
+
 
 async def delete_session(session_id: int):
     """Удаляет сессию."""
@@ -373,9 +412,17 @@ async def delete_session(session_id: int):
             select(models.WorkSession)
             .where(models.WorkSession.id == session_id)
         )
+
+        old_facts = SessionFacts.from_model(sis)
+        old_facts, _ = await rollups.apply_session_change(session, old_facts, None)
+        # Внешние ключи в SQLite по умолчанию не проверяются: маршрут удаляем сами
+        await session.execute(delete(models.TrackChunk).where(models.TrackChunk.session_id == session_id))
+        await session.execute(delete(models.SessionTrack).where(models.SessionTrack.session_id == session_id))
         await session.delete(sis)
         await session.commit()
 
+        signals.session_changed(old_facts, None)
+
 
 async def set_old_message_id_to_session(session_id: int, message_id: int):
     async with models.session() as session:
@@ -388,5 +435,536 @@ async def set_old_message_id_to_session(session_id: int, message_id: int):
         await session.commit()
 
 
-async def get_sessions_count():
-    return len(await get_all_sessions(None, None))
+async def get_sessions_count() -> int:
+    """
+    Получение общего количества сессий (COUNT на стороне БД, а не загрузка всех строк).
+    :return: Количество сессий.
+    """
+    try:
+        async with models.session() as session:
+            return (await session.execute(select(func.count(models.WorkSession.id)))).scalar_one()
+    except Exception as e:
+        private_logger.error(f'Ошибка при получении количества сессий: {e}')
+        return 0
+
+
+async def get_worked_time_by_days(first_day: date, last_day: date, user_id: int | None = None)\
+        -> List[tuple[date, int, int]]:
+    """
+    Итоги отработанного времени по локальным дням (читаются из rollup-таблицы, а не из сессий).
+    :param first_day: Первый день периода (включительно).
+    :param last_day: Последний день периода (включительно).
+    :param user_id: ID пользователя (НЕ Telegram) или None - по всем работникам.
+    :return: Список (дата, отработано секунд, заработано копеек).
+    """
+    try:
+        async with models.session() as session:
+            daily = models.WorkedTimeDaily
+            stmt = (select(daily.day, func.sum(daily.worked_seconds), func.sum(daily.kopeck_seconds))
+                    .where(daily.day.between(first_day, last_day))
+                    .group_by(daily.day)
+                    .order_by(daily.day))
+            if user_id is not None:
+                stmt = stmt.where(daily.user_id == user_id)
+
+            return [(day, int(seconds), int(kopeck_seconds) // 3600)
+                    for day, seconds, kopeck_seconds in await session.execute(stmt)]
+    except Exception as e:
+        private_logger.error(f'Ошибка при получении итогов по дням {first_day} - {last_day}: {e}')
+        return []
+
+
+async def get_active_sessions() -> List[models.WorkSession]:
+    """
+    Получение всех незавершённых сессий (вместе с работниками).
+    :return: Список объектов WorkSession.
+    """
+    try:
+        async with models.session() as session:
+            result = await session.execute(
+                select(models.WorkSession)
+                .where(models.WorkSession.is_ended == False)
+                .options(selectinload(models.WorkSession.worker))
+            )
+            return result.scalars().all()
+    except Exception as e:
+        private_logger.error(f'Ошибка при получении активных сессий: {e}')
+        return []
+
+
+async def get_sessions_near(latitude: float, longitude: float, radius_km: float, active_only: bool = True,
+                            limit: int = 50) -> List[tuple[models.WorkSession, float]]:
+    """
+    Сессии, начатые не дальше radius_km от точки, от ближних к дальним.
+    Кандидаты отбираются по индексу geohash (диапазоны ячеек, накрывающих круг), затем проверяется точное расстояние;
+    целиком (вместе с работниками) загружаются только попавшие в limit.
+    :param active_only: Только незавершённые сессии (иначе - вся история)
+    :return: Список (сессия, расстояние в км)
+    """
+    try:
+        column = models.WorkSession.geohash
+        # Условие на is_ended повторяется в каждом диапазоне, чтобы SQLite читал их по составному индексу
+        status = (models.WorkSession.is_ended == False,) if active_only else ()
+        query = (select(models.WorkSession.id, models.WorkSession.geolocation_latitude,
+                        models.WorkSession.geolocation_longitude)
+                 .where(or_(*(and_(*status, column >= cell, column < cell + geohash.RANGE_END)
+                              for cell in geohash.cover(latitude, longitude, radius_km)))))
+
+        async with models.session() as session:
+            distances = ((geohash.haversine_km(latitude, longitude, lat, lon), session_id)
+                         for session_id, lat, lon in await session.execute(query))
+            nearest = heapq.nsmallest(limit, ((distance, session_id) for distance, session_id in distances
+                                              if distance <= radius_km))
+            if not nearest:
+                return []
+
+            objects = {obj.id: obj for obj in await session.scalars(
+                select(models.WorkSession)
+                .where(models.WorkSession.id.in_([session_id for _, session_id in nearest]))
+                .options(selectinload(models.WorkSession.worker)))}
+            return [(objects[session_id], distance) for distance, session_id in nearest]
+    except Exception as e:
+        private_logger.error(f'Ошибка поиска сессий в радиусе {radius_km} км от {latitude}, {longitude}: {e}')
+        return []
+
+
+async def get_audit_events(session_id: int | None = None, user_id: int | None = None, before_id: int | None = None,
+                           limit: int = 10) -> List[models.AuditEvent]:
+    """
+    История действий по сессии или работнику, от новых к старым, с постраничным выводом по ключу (keyset):
+    следующая страница начинается с событий, у которых id меньше последнего показанного, без OFFSET.
+    :param session_id: ID сессии (если указан)
+    :param user_id: Worker ID (НЕ Telegram), если указан
+    :param before_id: id последнего события предыдущей страницы (None - первая страница)
+    :param limit: Количество событий на странице
+    :return: Список объектов AuditEvent.
+    """
+    try:
+        async with models.session() as session:
+            query = select(models.AuditEvent).order_by(models.AuditEvent.id.desc()).limit(limit)
+            if session_id is not None:
+                query = query.where(models.AuditEvent.session_id == session_id)
+            if user_id is not None:
+                query = query.where(models.AuditEvent.target_user_id == user_id)
+            if before_id is not None:
+                query = query.where(models.AuditEvent.id < before_id)
+
+            return (await session.execute(query)).scalars().all()
+    except Exception as e:
+        private_logger.error(f'Ошибка получения журнала действий (сессия {session_id}, работник {user_id}): {e}')
+        return []
+
+
+async def get_meta(key: str) -> str | None:
+    """
+    Служебное значение из app_meta.
+    :param key: Ключ (например, 'bot_commands_hash')
+    :return: Значение или None, если не задано
+    """
+    try:
+        async with models.session() as session:
+            return await session.scalar(select(models.AppMeta.value).where(models.AppMeta.key == key))
+    except Exception as e:
+        private_logger.error(f'Ошибка получения служебного значения {key}: {e}')
+        return None
+
+
+async def set_meta(key: str, value: str):
+    try:
+        async with models.session() as session:
+            meta = await session.scalar(select(models.AppMeta).where(models.AppMeta.key == key))
+            if meta is None:
+                session.add(models.AppMeta(key=key, value=value))
+            else:
+                meta.value = value
+            await session.commit()
+    except Exception as e:
+        private_logger.error(f'Ошибка сохранения служебного значения {key}: {e}')
+
+
+async def get_work_sites() -> List[models.WorkSite]:
+    try:
+        async with models.session() as session:
+            return list(await session.scalars(select(models.WorkSite).order_by(models.WorkSite.id)))
+    except Exception as e:
+        private_logger.error(f'Ошибка получения рабочих площадок: {e}')
+        return []
+
+
+async def add_work_sites(sites: list[dict]) -> List[models.WorkSite]:
+    """
+    Добавляет рабочие площадки.
+    :param sites: Поля models.WorkSite (см. app.misc.geofence.sites_from_geojson)
+    :return: Добавленные площадки
+    """
+    try:
+        async with models.session() as session:
+            objects = [models.WorkSite(**site) for site in sites]
+            session.add_all(objects)
+            await session.commit()
+            return objects
+    except Exception as e:
+        private_logger.error(f'Ошибка добавления рабочих площадок: {e}')
+        return []
+
+
+async def delete_work_site(site_id: int) -> bool:
+    """Удаляет площадку; у её сессий site_id становится NULL. :return: True, если площадка была"""
+    try:
+        async with models.session() as session:
+            site = await session.get(models.WorkSite, site_id)
+            if site is None:
+                return False
+            # Внешние ключи в SQLite по умолчанию не проверяются, поэтому ON DELETE SET NULL делаем сами
+            await session.execute(update(models.WorkSession).where(models.WorkSession.site_id == site_id)
+                                  .values(site_id=None))
+            await session.execute(update(models.PlannedShift).where(models.PlannedShift.site_id == site_id)
+                                  .values(site_id=None))
+            await session.delete(site)
+            await session.commit()
+            return True
+    except Exception as e:
+        private_logger.error(f'Ошибка удаления рабочей площадки {site_id}: {e}')
+        return False
+
+
+async def get_track_target(telegram_id: int) -> tuple[int, int | None, models.SessionTrack | None] | None:
+    """
+    Активная сессия работника для записи маршрута.
+    :param telegram_id: Внутренний Telegram ID пользователя со стороны серверов Telegram
+    :return: (ID сессии, ID площадки, уже записанный маршрут) или None, если работник не на смене
+    """
+    try:
+        async with models.session() as session:
+            row = (await session.execute(
+                select(models.WorkSession.id, models.WorkSession.site_id)
+                .join(models.User, models.User.id == models.WorkSession.user_id)
+                .where(models.User.telegram_id == telegram_id, models.WorkSession.is_ended == False)
+            )).first()
+            if row is None:
+                return None
+            track = await session.scalar(select(models.SessionTrack).where(models.SessionTrack.session_id == row.id))
+            return row.id, row.site_id, track
+    except Exception as e:
+        private_logger.error(f'Ошибка получения сессии для маршрута работника {telegram_id}: {e}')
+        return None
+
+
+async def get_session_track(session_id: int) -> models.SessionTrack | None:
+    try:
+        async with models.session() as session:
+            return await session.scalar(select(models.SessionTrack).where(models.SessionTrack.session_id == session_id))
+    except Exception as e:
+        private_logger.error(f'Ошибка получения маршрута сессии {session_id}: {e}')
+        return None
+
+
+async def get_sweep_candidates(with_max_shift: bool) -> list[tuple[SessionFacts, int | None]]:
+    """
+    Активные сессии, которые может понадобиться закрыть автоматически (app.misc.sweeper).
+    :param with_max_shift: Задан MAX_SHIFT_HOURS - нужны все активные сессии, иначе только с временем закрытия
+    :return: [(снимок сессии, время закрытия в минутах от полуночи: работника, иначе площадки)]
+    """
+    close_minute = func.coalesce(models.User.close_minute, models.WorkSite.close_minute)
+    query = (select(models.WorkSession, close_minute)
+             .join(models.User, models.User.id == models.WorkSession.user_id)
+             .outerjoin(models.WorkSite, models.WorkSite.id == models.WorkSession.site_id)
+             .where(models.WorkSession.is_ended == False))
+    if not with_max_shift:
+        query = query.where(close_minute.is_not(None))
+    try:
+        async with models.session() as session:
+            return [(SessionFacts.from_model(obj), minute) for obj, minute in await session.execute(query)]
+    except Exception as e:
+        private_logger.error(f'Ошибка получения сессий для автоматического закрытия: {e}')
+        return []
+
+
+async def _update_sessions(conditions: list, values: dict,
+                           restore: Callable[[SessionFacts], SessionFacts] | None = None,
+                           check: Callable[[AsyncSession, list[SessionFacts]], Awaitable] | None = None) \
+        -> list[tuple[SessionFacts, int | None]]:
+    """
+    Массовое изменение сессий одним UPDATE ... RETURNING, итоги rollup - одним upsert на таблицу, затем сигналы.
+    :param conditions: Условия WHERE для work_sessions
+    :param values: Новые значения столбцов (можно SQL-выражения от старых)
+    :param restore: Новый снимок -> снимок до изменения. RETURNING отдаёт только новые значения, поэтому без restore
+                    сессии перед UPDATE читаются ещё одним запросом
+    :param check: Проверка снимков до изменения перед UPDATE (только без restore), может прервать изменение
+    :return: [(новый снимок с telegram_id, ID сообщения о начале смены)]
+    """
+    async with models.session() as session:
+        before = {}
+        if restore is None:
+            before = {obj.id: SessionFacts.from_model(obj)
+                      for obj in await session.scalars(select(models.WorkSession).where(*conditions))}
+            session.expunge_all()  # Иначе RETURNING вернёт те же объекты со старыми значениями
+            if check is not None:
+                await check(session, list(before.values()))
+        updated = list(await session.scalars(
+            update(models.WorkSession)
+            .where(*conditions)
+            .values(**values)
+            .returning(models.WorkSession)
+            .execution_options(synchronize_session=False)
+        ))
+        telegram_ids = dict((await session.execute(
+            select(models.User.id, models.User.telegram_id)
+            .where(models.User.id.in_({obj.user_id for obj in updated}))
+        )).all())
+
+        changes = []
+        for obj in updated:
+            new_facts = replace(SessionFacts.from_model(obj), telegram_id=telegram_ids.get(obj.user_id))
+            old_facts = restore(new_facts) if restore else replace(before[obj.id], telegram_id=new_facts.telegram_id)
+            changes.append((old_facts, new_facts))
+        changes = await rollups.apply_session_changes(session, changes)
+        message_ids = [obj.old_message_id for obj in updated]  # После commit объекты истекают
+        await session.commit()
+
+    for old_facts, new_facts in changes:
+        signals.session_changed(old_facts, new_facts)
+    return [(new_facts, message_id) for (_, new_facts), message_id in zip(changes, message_ids)]
+
+
+def _reopened(facts: SessionFacts) -> SessionFacts:
+    return replace(facts, is_ended=False, ended_at=None)
+
+
+async def close_overdue_sessions(deadlines: dict[int, datetime]) -> list[tuple[SessionFacts, int | None]]:
+    """
+    Закрывает сессии одним UPDATE ... RETURNING: время окончания каждой - её крайний срок, а не текущий момент.
+    Сессии, которые успели завершить иначе (работник, администратор), не затрагиваются.
+    :param deadlines: ID сессии -> время окончания (UTC)
+    :return: [(снимок закрытой сессии с telegram_id, ID сообщения о начале смены)]
+    """
+    if not deadlines:
+        return []
+    try:
+        return await _update_sessions(
+            [models.WorkSession.id.in_(deadlines), models.WorkSession.is_ended == False],
+            {'is_ended': True, 'ended_date': case(deadlines, value=models.WorkSession.id)}, _reopened)
+    except Exception as e:
+        private_logger.error(f'Ошибка автоматического закрытия сессий {sorted(deadlines)}: {e}')
+        return []
+
+
+async def end_sessions(session_ids: list[int] | None, ended_at: datetime) -> list[tuple[SessionFacts, int | None]]:
+    """
+    Завершает активные сессии.
+    :param session_ids: ID сессий (уже завершённые пропускаются), None - все активные
+    :return: [(снимок завершённой сессии с telegram_id, ID сообщения о начале смены)]
+    """
+    conditions = [models.WorkSession.is_ended == False]
+    if session_ids is not None:
+        conditions.append(models.WorkSession.id.in_(session_ids))
+    try:
+        return await _update_sessions(conditions, {'is_ended': True, 'ended_date': ended_at}, _reopened)
+    except Exception as e:
+        private_logger.error(f'Ошибка массового завершения сессий: {e}')
+        return []
+
+
+async def set_sessions_rate(rate: int, session_ids: list[int] | None = None, user_id: int | None = None,
+                            first_day: date | None = None, last_day: date | None = None) \
+        -> list[tuple[SessionFacts, int | None]]:
+    """
+    Ставка для нескольких сессий: выбранных (session_ids) или сессий работника без ставки за период.
+    :param rate: Ставка в копейках за час
+    :param user_id: Работник (id в БД, не Telegram ID) - тогда меняются только сессии без ставки
+    :param first_day: Первый день периода (локальная дата), None - без ограничения
+    :param last_day: Последний день периода включительно
+    """
+    if session_ids is None and user_id is None:
+        return []  # Ставку всем сессиям сразу не меняем
+    conditions = []
+    if session_ids is not None:
+        conditions.append(models.WorkSession.id.in_(session_ids))
+    if user_id is not None:
+        conditions += [models.WorkSession.user_id == user_id, models.WorkSession.hour_kopecks_rate.is_(None)]
+    if first_day is not None:
+        conditions.append(models.WorkSession.created_at >= _local_day_start(first_day))
+    if last_day is not None:
+        conditions.append(models.WorkSession.created_at < _local_day_start(last_day + timedelta(days=1)))
+    try:
+        return await _update_sessions(conditions, {'hour_kopecks_rate': rate})
+    except Exception as e:
+        private_logger.error(f'Ошибка массового изменения ставки на {rate}: {e}')
+        return []
+
+
+async def shift_sessions(session_ids: list[int], minutes: int) -> list[tuple[SessionFacts, int | None]]:
+    """
+    Сдвигает начало и конец (если есть) выбранных сессий на minutes минут (отрицательное - назад).
+    :raise SessionTimeConflict: После сдвига сессии пересекутся с другими сессиями работников (ничего не меняется)
+    """
+    delta = timedelta(minutes=minutes)
+
+    async def check(session: AsyncSession, before: list[SessionFacts]):
+        await overlaps.check_moved(session, [replace(facts, started_at=facts.started_at + delta,
+                                                     ended_at=facts.ended_at and facts.ended_at + delta)
+                                             for facts in before])
+
+    try:
+        return await _update_sessions([models.WorkSession.id.in_(session_ids)],
+                                      {'created_at': _shifted(models.WorkSession.created_at, minutes),
+                                       'ended_date': _shifted(models.WorkSession.ended_date, minutes)},
+                                      check=check)
+    except overlaps.SessionTimeConflict:
+        raise
+    except Exception as e:
+        private_logger.error(f'Ошибка сдвига времени сессий {sorted(session_ids)} на {minutes} мин: {e}')
+        return []
+
+
+def _shifted(column, minutes: int):
+    if models.engine.dialect.name == 'sqlite':
+        # Даты в SQLite - строки: сдвигает сама БД (от NULL - NULL, доли секунды отбрасываются)
+        return func.datetime(column, f'{minutes:+d} minutes')
+    return column + timedelta(minutes=minutes)
+
+
+def _local_day_start(day: date) -> datetime:
+    # Начало локальных суток в UTC, как хранится в БД
+    return datetime.combine(day, datetime.min.time()) - rollups.local_offset()
+
+
+async def set_close_minute(minute: int | None, site_id: int | None = None, telegram_id: int | None = None) -> bool:
+    """
+    Время автоматического закрытия смен площадки или работника.
+    :param minute: Минуты от полуночи по местному времени, None - не закрывать
+    :return: True, если площадка / работник найдены
+    """
+    if site_id is not None:
+        query = update(models.WorkSite).where(models.WorkSite.id == site_id)
+    else:
+        query = update(models.User).where(models.User.telegram_id == telegram_id)
+    try:
+        async with models.session() as session:
+            result = await session.execute(query.values(close_minute=minute))
+            await session.commit()
+            return result.rowcount > 0
+    except Exception as e:
+        private_logger.error(f'Ошибка установки времени закрытия (площадка {site_id}, работник {telegram_id}): {e}')
+        return False
+
+
+async def set_worker_rate(user_id: int, rate: int, effective_from: datetime) -> list[SessionFacts] | None:
+    """
+    Добавляет ставку в историю работника (ставка с тем же effective_from заменяется).
+    Сессиям, начатым с effective_from до следующей записи истории, проставляется новая ставка (она теперь действует
+    на момент их начала), у сессий, которые идут через effective_from, время после него оплачивается по новой ставке.
+    Для тех и других пересчитываются итоги rollup и отправляются сигналы.
+    :param user_id: Работник (id в БД, не Telegram ID)
+    :param effective_from: С какого момента действует ставка (UTC)
+    :return: Новые снимки затронутых сессий; None - ошибка
+    """
+    ws, worker_rates = models.WorkSession, models.WorkerRate
+    try:
+        async with models.session() as session:
+            next_from = await session.scalar(select(func.min(worker_rates.effective_from))
+                                             .where(worker_rates.user_id == user_id,
+                                                    worker_rates.effective_from > effective_from))
+            started = ws.created_at >= effective_from
+            if next_from is not None:
+                started = and_(started, ws.created_at < next_from)
+            crossing = and_(ws.created_at < effective_from, or_(ws.ended_date > effective_from, ws.is_ended == False))
+
+            affected = [SessionFacts.from_model(obj) for obj in await session.scalars(
+                select(ws).where(ws.user_id == user_id, or_(started, crossing))
+            )]
+            before = await rates.attach_rate_changes(session, affected)
+            await session.execute(delete(worker_rates).where(worker_rates.user_id == user_id,
+                                                             worker_rates.effective_from == effective_from))
+            session.add(models.WorkerRate(user_id=user_id, effective_from=effective_from, hour_kopecks_rate=rate))
+            await session.execute(update(ws).where(ws.user_id == user_id, started).values(hour_kopecks_rate=rate)
+                                  .execution_options(synchronize_session=False))
+            await session.flush()
+            after = await rates.attach_rate_changes(session, [
+                replace(facts, hour_kopecks_rate=rate) if facts.started_at >= effective_from else facts
+                for facts in affected
+            ])
+
+            changes = [(old, new) for old, new in zip(before, after) if old != new]
+            await rollups.apply_session_changes(session, changes, attach_rates=False)
+            # У сессий, идущих через effective_from, строка не менялась, а сумма - да: отмечаем их для выгрузки
+            await session.execute(update(ws).where(ws.id.in_([new.id for _, new in changes]))
+                                  .values(updated_at=datetime.now(UTC).replace(tzinfo=None))
+                                  .execution_options(synchronize_session=False))
+            await session.commit()
+
+        for old_facts, new_facts in changes:
+            signals.session_changed(old_facts, new_facts)
+        return [new_facts for _, new_facts in changes]
+    except Exception as e:
+        private_logger.error(f'Ошибка установки ставки работника PRIMARY_KEY={user_id}: {e}')
+        return None
+
+
+async def get_worker_rates(user_id: int, limit: int = 5) -> list[models.WorkerRate]:
+    """Последние записи истории ставок работника, от новых к старым."""
+    try:
+        async with models.session() as session:
+            return list(await session.scalars(select(models.WorkerRate)
+                                              .where(models.WorkerRate.user_id == user_id)
+                                              .order_by(models.WorkerRate.effective_from.desc())
+                                              .limit(limit)))
+    except Exception as e:
+        private_logger.error(f'Ошибка получения ставок работника PRIMARY_KEY={user_id}: {e}')
+        return []
+
+
+async def with_rate_changes(facts: SessionFacts) -> SessionFacts:
+    """Снимок сессии с изменениями ставки работника внутри неё - для отчёта, который строится до записи в БД."""
+    try:
+        async with models.session() as session:
+            return (await rates.attach_rate_changes(session, [facts]))[0]
+    except Exception as e:
+        private_logger.error(f'Ошибка получения изменений ставки для сессии {facts.id}: {e}')
+        return facts
+
+
+async def attach_rate_changes(facts_list: list[SessionFacts]) -> list[SessionFacts]:
+    """with_rate_changes для нескольких снимков (например, всех активных сессий при запуске) одним запросом."""
+    try:
+        async with models.session() as session:
+            return await rates.attach_rate_changes(session, facts_list)
+    except Exception as e:
+        private_logger.error(f'Ошибка получения изменений ставки для {len(facts_list)} сессий: {e}')
+        return facts_list
+
+
+async def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """
+    Берёт или продлевает аренду name: удаётся, если она свободна, истекла или уже принадлежит holder.
+    :return: True, если аренда у holder до now + ttl_seconds
+    """
+    now = datetime.now(UTC).replace(tzinfo=None)
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    try:
+        async with models.session() as session:
+            result = await session.execute(
+                update(models.Lease)
+                .where(models.Lease.name == name, or_(models.Lease.holder == holder, models.Lease.expires_at < now))
+                .values(holder=holder, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                if await session.scalar(select(models.Lease.id).where(models.Lease.name == name)) is not None:
+                    return False  # Аренда действует у другой копии бота
+                session.add(models.Lease(name=name, holder=holder, expires_at=expires_at))
+            await session.commit()
+            return True
+    except IntegrityError:
+        return False  # Другая копия одновременно создала ту же аренду
+    except Exception as e:
+        private_logger.error(f'Ошибка получения аренды {name}: {e}')
+        return False
+
+
+async def release_lease(name: str, holder: str):
+    try:
+        async with models.session() as session:
+            await session.execute(delete(models.Lease).where(models.Lease.name == name, models.Lease.holder == holder))
+            await session.commit()
+    except Exception as e:
+        private_logger.error(f'Ошибка освобождения аренды {name}: {e}')
@@ -0,0 +1,87 @@
+# app/db/rates.py
+
+"""
+История ставок работников (таблица worker_rates).
+
+Ставка действует с effective_from до следующей записи того же работника. При начале смены в сессию проставляется
+ставка на этот момент (rate_at), а если ставка работника меняется посреди смены, время после изменения оплачивается
+по новой ставке: такие изменения подставляются в снимок сессии (SessionFacts.rate_changes) перед расчётом итогов.
+
+Оба запроса - диапазоны по уникальному индексу (user_id, effective_from): ставка на момент - последняя запись
+не позже него, изменения внутри сессий - записи строго между началом и концом.
+"""
+
+from bisect import bisect_right
+from dataclasses import replace
+from datetime import datetime, UTC
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import models
+from app.db.facts import SessionFacts
+
+# Изменения ставок по работнику: user_id -> [(момент UTC, ставка)] по возрастанию
+History = dict[int, list[tuple[datetime, int]]]
+
+
+async def rate_at(db_session: AsyncSession, user_id: int, moment: datetime) -> int | None:
+    """Ставка работника, действующая в момент moment (UTC), или None, если ставок до него не было."""
+    rates = models.WorkerRate
+    return await db_session.scalar(select(rates.hour_kopecks_rate)
+                                   .where(rates.user_id == user_id, rates.effective_from <= moment)
+                                   .order_by(rates.effective_from.desc())
+                                   .limit(1))
+
+
+async def load_history(db_session: AsyncSession, user_ids=None, after: datetime | None = None,
+                       before: datetime | None = None) -> History:
+    """
+    Изменения ставок работников.
+    :param user_ids: Работники (id в БД), None - все
+    :param after: Только изменения строго после этого момента
+    :param before: Только изменения строго до этого момента
+    """
+    rates = models.WorkerRate
+    query = select(rates.user_id, rates.effective_from, rates.hour_kopecks_rate)
+    if user_ids is not None:
+        query = query.where(rates.user_id.in_(user_ids))
+    if after is not None:
+        query = query.where(rates.effective_from > after)
+    if before is not None:
+        query = query.where(rates.effective_from < before)
+
+    return group_history(await db_session.execute(query.order_by(rates.user_id, rates.effective_from)))
+
+
+def group_history(rows) -> History:
+    """Строки (user_id, effective_from, ставка), отсортированные по работнику и дате -> History."""
+    history: History = {}
+    for user_id, effective_from, rate in rows:
+        history.setdefault(user_id, []).append((effective_from, rate))
+    return history
+
+
+def with_rate_changes(facts: SessionFacts | None, history: History, now: datetime | None = None) \
+        -> SessionFacts | None:
+    """Снимок сессии с изменениями ставки работника внутри неё (незавершённая сессия - до now)."""
+    if facts is None:
+        return None
+    changes = history.get(facts.user_id, ())
+    end = facts.ended_at or now or datetime.now(UTC).replace(tzinfo=None)
+    inside = tuple(changes[bisect_right(changes, (facts.started_at, float('inf'))):
+                           bisect_right(changes, (end, -1))])
+    return replace(facts, rate_changes=inside) if inside != facts.rate_changes else facts
+
+
+async def attach_rate_changes(db_session: AsyncSession, facts_list: list[SessionFacts | None]) \
+        -> list[SessionFacts | None]:
+    """with_rate_changes для нескольких снимков: изменения ставок для всех берутся одним запросом."""
+    present = [facts for facts in facts_list if facts is not None]
+    if not present:
+        return facts_list
+    now = datetime.now(UTC).replace(tzinfo=None)
+    history = await load_history(db_session, {facts.user_id for facts in present},
+                                 after=min(facts.started_at for facts in present),
+                                 before=max(facts.ended_at or now for facts in present))
+    return [with_rate_changes(facts, history, now) for facts in facts_list]
@@ -0,0 +1,214 @@
+# app/db/rollups.py
+
+"""
+Инкрементальное обновление таблиц worked_time_hourly / worked_time_daily.
+
+Каждая завершённая сессия раскладывается по часам (UTC) и по локальным дням. При изменении сессии считаем вклад
+"до" и "после" и применяем только разницу, поэтому отчёты читают готовые суммы, а не пересчитывают все сессии.
+Если ставка работника менялась посреди сессии (app.db.rates), каждая часть сессии считается по своей ставке.
+"""
+
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+
+from app.db import models, rates
+from app.db.facts import SessionFacts
+from app.misc.config import settings
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# (worked_seconds, kopeck_seconds) по ключу (user_id, начало часа / локальная дата)
+Contribution = dict[tuple[int, datetime | date], tuple[int, int]]
+
+
+def local_offset() -> timedelta:
+    return timedelta(hours=settings.UTC_OFFSET_HOURS)
+
+
+def _split(started_at: datetime, ended_at: datetime, step: timedelta, shift: timedelta):
+    # Режем интервал по границам шага (час / сутки) в системе координат со сдвигом shift.
+    # Границы округляем до секунд, чтобы сумма по частям в точности равнялась длительности сессии
+    start = started_at.replace(microsecond=0) + shift
+    end = ended_at.replace(microsecond=0) + shift
+
+    if step == HOUR:
+        bucket = start.replace(minute=0, second=0)
+    else:
+        bucket = start.replace(hour=0, minute=0, second=0)
+
+    while bucket < end:
+        next_bucket = bucket + step
+        seconds = int((min(end, next_bucket) - max(start, bucket)).total_seconds())
+        if seconds > 0:
+            yield bucket, seconds
+        bucket = next_bucket
+
+
+def session_contribution(facts: SessionFacts | None) -> tuple[Contribution, Contribution]:
+    """
+    Вклад сессии в часовые и дневные итоги.
+    :param facts: Снимок сессии (None - сессии нет, например, она удалена)
+    :return: Два словаря: по часам (UTC) и по локальным дням
+    """
+    hourly, daily = {}, {}
+    if facts is None or not facts.is_closed or facts.ended_at <= facts.started_at:
+        return hourly, daily
+
+    for started_at, ended_at, rate in facts.rate_segments():
+        rate = rate or 0
+        for totals, step, shift in ((hourly, HOUR, timedelta()), (daily, DAY, local_offset())):
+            for bucket, seconds in _split(started_at, ended_at, step, shift):
+                key = (facts.user_id, bucket if step == HOUR else bucket.date())
+                total_seconds, total_kopecks = totals.get(key, (0, 0))
+                totals[key] = (total_seconds + seconds, total_kopecks + seconds * rate)
+
+    return hourly, daily
+
+
+def _difference(old: Contribution, new: Contribution) -> Contribution:
+    delta = {}
+    for key in old.keys() | new.keys():
+        old_seconds, old_kopecks = old.get(key, (0, 0))
+        new_seconds, new_kopecks = new.get(key, (0, 0))
+        if (new_seconds - old_seconds) or (new_kopecks - old_kopecks):
+            delta[key] = (new_seconds - old_seconds, new_kopecks - old_kopecks)
+    return delta
+
+
+def _insert(db_session: AsyncSession, table):
+    dialect = postgresql if db_session.bind.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(table)
+
+
+async def _upsert(db_session: AsyncSession, table, bucket_column: str, delta: Contribution):
+    if not delta:
+        return
+
+    stmt = _insert(db_session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.user_id, getattr(table, bucket_column)],
+        set_={'worked_seconds': table.worked_seconds + stmt.excluded.worked_seconds,
+              'kopeck_seconds': table.kopeck_seconds + stmt.excluded.kopeck_seconds}
+    )
+    await db_session.execute(stmt, [
+        {'user_id': user_id, bucket_column: bucket, 'worked_seconds': seconds, 'kopeck_seconds': kopecks}
+        for (user_id, bucket), (seconds, kopecks) in delta.items()
+    ])
+
+
+async def apply_session_change(db_session: AsyncSession, old: SessionFacts | None, new: SessionFacts | None) \
+        -> tuple[SessionFacts | None, SessionFacts | None]:
+    """
+    Применяет к rollup-таблицам разницу между старым и новым состоянием сессии.
+    Вызывается внутри той же транзакции, что и само изменение сессии (commit делает вызывающий код).
+    :return: Снимки (old, new) с изменениями ставки работника внутри сессии - их и стоит передавать в сигналы
+    """
+    return (await apply_session_changes(db_session, [(old, new)]))[0]
+
+
+async def apply_session_changes(db_session: AsyncSession,
+                                changes: list[tuple[SessionFacts | None, SessionFacts | None]],
+                                attach_rates: bool = True) -> list[tuple[SessionFacts | None, SessionFacts | None]]:
+    """
+    То же для нескольких сессий сразу: разницы складываются, и на каждую таблицу уходит один upsert.
+    :param attach_rates: Подставить в снимки изменения ставок из истории (False - они уже подставлены)
+    """
+    if attach_rates:
+        attached = await rates.attach_rate_changes(db_session, [facts for change in changes for facts in change])
+        changes = list(zip(attached[::2], attached[1::2]))
+
+    hourly_delta, daily_delta = defaultdict(lambda: (0, 0)), defaultdict(lambda: (0, 0))
+    for old, new in changes:
+        old_hourly, old_daily = session_contribution(old)
+        new_hourly, new_daily = session_contribution(new)
+        for totals, delta in ((hourly_delta, _difference(old_hourly, new_hourly)),
+                              (daily_delta, _difference(old_daily, new_daily))):
+            for key, (seconds, kopecks) in delta.items():
+                total_seconds, total_kopecks = totals[key]
+                totals[key] = (total_seconds + seconds, total_kopecks + kopecks)
+
+    await _upsert(db_session, models.WorkedTimeHourly, 'hour_start', hourly_delta)
+    await _upsert(db_session, models.WorkedTimeDaily, 'day', daily_delta)
+    return changes
+
+
+def _expected_totals(db_session: Session) -> tuple[Contribution, Contribution]:
+    # Синхронно: вызывается и из rebuild (через run_sync), и из миграции схемы (backfill)
+    worker_rates = models.WorkerRate
+    history = rates.group_history(db_session.execute(
+        select(worker_rates.user_id, worker_rates.effective_from, worker_rates.hour_kopecks_rate)
+        .order_by(worker_rates.user_id, worker_rates.effective_from)))
+
+    hourly, daily = defaultdict(lambda: (0, 0)), defaultdict(lambda: (0, 0))
+    # Только столбцы снимка: в миграции схемы столбцов из более поздних версий ещё нет
+    ws = models.WorkSession
+    result = db_session.scalars(select(ws).where(ws.is_ended == True)
+                                .options(load_only(ws.user_id, ws.created_at, ws.ended_date, ws.is_ended,
+                                                   ws.hour_kopecks_rate, ws.geolocation_latitude,
+                                                   ws.geolocation_longitude, ws.work_position))
+                                .execution_options(yield_per=1_000))
+    for obj in result:
+        session_hourly, session_daily = session_contribution(rates.with_rate_changes(SessionFacts.from_model(obj),
+                                                                                     history))
+        for totals, contribution in ((hourly, session_hourly), (daily, session_daily)):
+            for key, (seconds, kopecks) in contribution.items():
+                total_seconds, total_kopecks = totals[key]
+                totals[key] = (total_seconds + seconds, total_kopecks + kopecks)
+
+    return dict(hourly), dict(daily)
+
+
+async def _stored_totals(db_session: AsyncSession, table, bucket_column: str) -> Contribution:
+    rows = await db_session.execute(select(table.user_id, getattr(table, bucket_column), table.worked_seconds,
+                                           table.kopeck_seconds))
+    # Нулевые строки остаются после вычитания вклада и на сверку не влияют
+    return {(user_id, bucket): (seconds, kopecks) for user_id, bucket, seconds, kopecks in rows
+            if seconds or kopecks}
+
+
+async def rebuild(check_only: bool = False) -> dict[str, int]:
+    """
+    Пересчитывает rollup-таблицы с нуля по всем завершённым сессиям.
+    :param check_only: Только сверить с текущими данными, ничего не записывая
+    :return: Количество расхождений по каждой таблице (до пересборки)
+    """
+    async with models.session() as db_session:
+        expected_hourly, expected_daily = await db_session.run_sync(_expected_totals)
+
+        mismatches = {}
+        for name, table, bucket_column, expected in (
+                ('hourly', models.WorkedTimeHourly, 'hour_start', expected_hourly),
+                ('daily', models.WorkedTimeDaily, 'day', expected_daily)):
+            mismatches[name] = len(_difference(await _stored_totals(db_session, table, bucket_column), expected))
+
+            if not check_only:
+                await db_session.execute(delete(table))
+                await _upsert(db_session, table, bucket_column, expected)
+
+        if not check_only:
+            await db_session.commit()
+
+    return mismatches
+
+
+def backfill(conn):
+    """
+    Шаг миграции схемы (синхронно, внутри run_sync): заполняет rollup-таблицы по всем завершённым сессиям,
+    чтобы после обновления отчёты не показывали нули до ручного manage.py rebuild-rollups.
+    """
+    with Session(conn) as db_session:
+        expected_hourly, expected_daily = _expected_totals(db_session)
+    for table, bucket_column, expected in ((models.WorkedTimeHourly, 'hour_start', expected_hourly),
+                                           (models.WorkedTimeDaily, 'day', expected_daily)):
+        conn.execute(delete(table))
+        if expected:
+            conn.execute(insert(table), [
+                {'user_id': user_id, bucket_column: bucket, 'worked_seconds': seconds, 'kopeck_seconds': kopecks}
+                for (user_id, bucket), (seconds, kopecks) in expected.items()
+            ])
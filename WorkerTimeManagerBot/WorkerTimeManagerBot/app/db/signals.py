@@ -0,0 +1,25 @@
+# app/db/signals.py
+
+from typing import Callable
+
+from app.db.facts import SessionFacts
+from app.misc.config import private_logger
+
+# Подписчики на изменения сессий: получают состояние "до" и "после" (None - сессии не было / она удалена).
+# Вызываются уже после успешного commit, поэтому должны быть быстрыми и не обращаться к БД
+SessionListener = Callable[[SessionFacts | None, SessionFacts | None], None]
+session_listeners: list[SessionListener] = []
+
+
+def subscribe(listener: SessionListener) -> SessionListener:
+    session_listeners.append(listener)
+    return listener
+
+
+def session_changed(old: SessionFacts | None, new: SessionFacts | None):
+    for listener in session_listeners:
+        try:
+            listener(old, new)
+        except Exception as e:
+            # Ошибка подписчика не должна ломать сам запрос к БД
+            private_logger.error(f'Ошибка обработчика изменения сессии {listener.__qualname__}: {e}')
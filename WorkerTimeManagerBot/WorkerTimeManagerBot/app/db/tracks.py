@@ -0,0 +1,305 @@
+# app/db/tracks.py
+
+"""
+Маршрут смены по трансляции геопозиции Telegram (live location).
+
+Пока работник транслирует геопозицию, Telegram присылает edited_message с новой точкой каждые несколько секунд.
+Каждая такая точка обрабатывается без обращения к БД:
+- сессия работника ищется в памяти (в БД - только при первой точке или после перезапуска);
+- точка прореживается: сохраняется, если с предыдущей прошло не меньше TRACK_MIN_SECONDS и работник сместился
+  на TRACK_MIN_METERS, либо прошло TRACK_MAX_SECONDS (отметка "стоит на месте");
+- сразу же обновляются итоги для сводки: пройденное расстояние и время внутри рабочей площадки.
+
+Раз в TRACK_FLUSH_SECONDS (или при BATCH_POINTS точках в памяти) готовые пачки пишутся в БД одной транзакцией:
+пачка сессии - одна строка track_chunks, итоги - в session_tracks. Внутри пачки точки дельта-кодированы: время
+в секундах и координаты в 1e-5 градуса (~1 м) записываются разностью с предыдущей точкой в zigzag varint, так что
+точка занимает 3-6 байт вместо 24. Сводка маршрута читает только итоги (и ещё не записанный остаток из памяти),
+сами точки не загружаются и не декодируются.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+
+from sqlalchemy import insert, select
+
+from app.db import models, queries, signals
+from app.db.facts import SessionFacts
+from app.misc import geofence
+from app.misc.config import settings, private_logger
+from app.misc.geohash import haversine_km
+
+BATCH_POINTS = 1_000
+# Пачка сессии пишется, когда в ней CHUNK_POINTS точек или первой из них CHUNK_MAX_SECONDS: точек после
+# прореживания немного, а у каждой пачки есть накладные расходы (первая точка целиком, строка в таблице)
+CHUNK_POINTS = 64
+CHUNK_MAX_SECONDS = 1800
+SCALE = 100_000  # Координаты хранятся целыми в 1e-5 градуса
+MAX_ACCURACY_M = 200  # Точки с погрешностью больше этой не сохраняются
+NO_SESSION_TTL = 60.0  # Секунды, сколько помнить, что у работника нет активной смены
+
+
+def encode_points(points: list[tuple[int, int, int]]) -> bytes:
+    """(unix-время, широта * SCALE, долгота * SCALE) -> разности с предыдущей точкой в zigzag varint."""
+    out = bytearray()
+    previous = (0, 0, 0)
+    for point in points:
+        for value, prev in zip(point, previous):
+            delta = value - prev
+            number = delta << 1 if delta >= 0 else ((-delta) << 1) - 1
+            while number >= 0x80:
+                out.append(number & 0x7F | 0x80)
+                number >>= 7
+            out.append(number)
+        previous = point
+    return bytes(out)
+
+
+def decode_points(data: bytes) -> list[tuple[datetime, float, float]]:
+    """Обратно к (время UTC без tzinfo, широта, долгота)."""
+    values, number, shift = [], 0, 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            values.append(number >> 1 if not number & 1 else -((number + 1) >> 1))
+            number, shift = 0, 0
+
+    points, t, lat, lon = [], 0, 0, 0
+    for i in range(0, len(values) - 2, 3):
+        t, lat, lon = t + values[i], lat + values[i + 1], lon + values[i + 2]
+        points.append((datetime.fromtimestamp(t, UTC).replace(tzinfo=None), lat / SCALE, lon / SCALE))
+    return points
+
+
+@dataclass(slots=True)
+class _Track:
+    session_id: int
+    telegram_id: int
+    site_id: int | None
+    last: tuple[int, float, float] | None = None  # Последняя сохранённая точка: (unix-время, широта, долгота)
+    last_on_site: bool = False
+    pending: list[tuple[int, int, int]] = field(default_factory=list)  # Ещё не записанные точки
+    distance_m: float = 0.0  # Прирост итогов с последней записи
+    on_site_seconds: int = 0
+    closed: bool = False  # Смена завершена: после записи трек можно забыть
+    deleted: bool = False  # Сессия удалена: незаписанные точки писать некуда
+
+
+class RouteTracker:
+    def __init__(self):
+        self._tracks: dict[int, _Track] = {}  # ID сессии -> маршрут (завершённые - до записи последних точек)
+        self._active: dict[int, int] = {}  # Telegram ID -> ID активной сессии
+        self._no_session: dict[int, float] = {}  # Telegram ID -> до какого момента (loop.time) не искать смену
+        self._pending_points = 0
+        self._flush_task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+
+    async def ingest(self, telegram_id: int, timestamp: int, latitude: float, longitude: float,
+                     accuracy_m: float | None = None) -> bool:
+        """
+        Точка трансляции геопозиции.
+        :param timestamp: Unix-время точки (edit_date правки сообщения)
+        :return: True, если у работника есть активная смена (точка учтена или отброшена прореживанием)
+        """
+        track = await self._get_track(telegram_id)
+        if track is None:
+            return False
+        if accuracy_m is not None and accuracy_m > MAX_ACCURACY_M:
+            return True
+
+        if self._add_point(track, timestamp, latitude, longitude):
+            self._pending_points += 1
+            if self._pending_points >= BATCH_POINTS:
+                self._wakeup.set()
+            self._schedule()
+        return True
+
+    async def _get_track(self, telegram_id: int) -> _Track | None:
+        track = self._tracks.get(self._active.get(telegram_id))
+        if track is not None and not track.closed:
+            return track
+
+        loop = asyncio.get_running_loop()
+        if self._no_session.get(telegram_id, 0) > loop.time():
+            return None
+
+        target = await queries.get_track_target(telegram_id)
+        if target is None:
+            self._no_session[telegram_id] = loop.time() + NO_SESSION_TTL
+            return None
+        session_id, site_id, stored = target
+        await geofence.get_index()
+        # Пока шли запросы, трек могла создать параллельная точка того же работника
+        if (track := self._tracks.get(session_id)) is not None:
+            return track
+
+        track = _Track(session_id, telegram_id, site_id)
+        if stored is not None:
+            # После перезапуска продолжаем маршрут с последней записанной точки
+            last_at = int(stored.last_at.replace(tzinfo=UTC).timestamp())
+            track.last = (last_at, stored.last_latitude, stored.last_longitude)
+            track.last_on_site = stored.last_on_site
+        self._tracks[session_id] = track
+        self._active[telegram_id] = session_id
+        return track
+
+    @staticmethod
+    def _add_point(track: _Track, timestamp: int, latitude: float, longitude: float) -> bool:
+        if track.last is not None:
+            last_time, last_lat, last_lon = track.last
+            elapsed = timestamp - last_time
+            if elapsed < settings.TRACK_MIN_SECONDS:
+                return False
+            distance = haversine_km(last_lat, last_lon, latitude, longitude) * 1000
+            if distance < settings.TRACK_MIN_METERS and elapsed < settings.TRACK_MAX_SECONDS:
+                return False
+            track.distance_m += distance
+            if track.last_on_site:
+                track.on_site_seconds += elapsed
+
+        track.last = (timestamp, latitude, longitude)
+        track.last_on_site = geofence.is_on_site(latitude, longitude, track.site_id)
+        track.pending.append((timestamp, round(latitude * SCALE), round(longitude * SCALE)))
+        return True
+
+    def on_session_changed(self, old: SessionFacts | None, new: SessionFacts | None):
+        if old is None:
+            # Новая смена: работнику больше не нужно ждать истечения "смены нет"
+            self._no_session.clear()
+            return
+        track = self._tracks.get(old.id)
+        if track is not None and (new is None or (new.is_ended and not old.is_ended)):
+            track.closed = True
+            if new is None:
+                track.deleted = True
+                track.pending.clear()  # Сессия удалена вместе с маршрутом
+            self._schedule()
+
+    def _schedule(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Вне event loop (скрипты): допишется при close()
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), settings.TRACK_FLUSH_SECONDS)
+        except TimeoutError:
+            pass
+        self._wakeup.clear()
+        if not await self.flush():
+            # Пачка вернулась в треки: следующая попытка - через TRACK_FLUSH_SECONDS
+            self._flush_task = None
+            self._schedule()
+
+    async def flush(self, force: bool = False) -> bool:
+        """
+        Пишет готовые пачки: по строке track_chunks на сессию и обновлённые итоги в session_tracks.
+        :param force: Записать все накопленные точки, а не только готовые пачки (остановка бота)
+        :return: False - запись не удалась, точки возвращены в треки
+        """
+        batch, closed = [], []
+        now = int(time.time())
+        self._pending_points = 0
+        for track in self._tracks.values():
+            ready = force or track.closed or len(track.pending) >= CHUNK_POINTS or (
+                track.pending and max(now, track.last[0]) - track.pending[0][0] >= CHUNK_MAX_SECONDS)
+            if track.pending and ready:
+                batch.append((track, track.pending, track.distance_m, track.on_site_seconds, track.last,
+                              track.last_on_site))
+                track.pending, track.distance_m, track.on_site_seconds = [], 0.0, 0
+            self._pending_points += len(track.pending)
+            if track.closed:
+                closed.append(track)
+        if not batch:
+            self._forget(closed)
+            return True
+
+        try:
+            async with models.session() as session:
+                stored = {row.session_id: row for row in await session.scalars(
+                    select(models.SessionTrack)
+                    .where(models.SessionTrack.session_id.in_([entry[0].session_id for entry in batch])))}
+                chunks = []
+                for track, points, distance_m, on_site_seconds, last, last_on_site in batch:
+                    data = encode_points(points)
+                    chunks.append({'session_id': track.session_id, 'points': len(points), 'data': data})
+
+                    row = stored.get(track.session_id)
+                    if row is None:
+                        row = models.SessionTrack(session_id=track.session_id, points=0, distance_m=0.0,
+                                                  on_site_seconds=0, chunks=0, encoded_bytes=0,
+                                                  first_at=_utc(points[0][0]))
+                        session.add(row)
+                    row.points += len(points)
+                    row.distance_m += distance_m
+                    row.on_site_seconds += on_site_seconds
+                    row.chunks += 1
+                    row.encoded_bytes += len(data)
+                    row.last_at, row.last_latitude, row.last_longitude = _utc(last[0]), last[1], last[2]
+                    row.last_on_site = last_on_site
+
+                await session.execute(insert(models.TrackChunk), chunks)
+                await session.commit()
+        except Exception as e:
+            private_logger.error(f'Ошибка записи маршрутов ({len(batch)} сессий): {e}')
+            # Возвращаем пачку в треки (перед точками, пришедшими во время записи) и пробуем снова позже
+            for track, points, distance_m, on_site_seconds, _, _ in batch:
+                if track.deleted:
+                    continue
+                track.pending[:0] = points
+                track.distance_m += distance_m
+                track.on_site_seconds += on_site_seconds
+                self._pending_points += len(points)
+            return False
+        self._forget(closed)
+        return True
+
+    def _forget(self, closed: list[_Track]):
+        # Завершённые смены, все точки которых записаны
+        for track in closed:
+            if track.pending and not track.deleted:
+                continue  # Точки пришли, пока шла запись: допишутся следующей пачкой
+            self._tracks.pop(track.session_id, None)
+            if self._active.get(track.telegram_id) == track.session_id:
+                del self._active[track.telegram_id]
+
+    def pending_summary(self, session_id: int) -> tuple[int, float, int]:
+        """Ещё не записанная часть маршрута: (точки, метры, секунды на площадке)."""
+        track = self._tracks.get(session_id)
+        if track is None:
+            return 0, 0.0, 0
+        return len(track.pending), track.distance_m, track.on_site_seconds
+
+    async def close(self):
+        """Дописывает накопленные точки (вызывается при остановке бота)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._wakeup.set()
+            await self._flush_task
+        await self.flush(force=True)
+
+
+def _utc(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, UTC).replace(tzinfo=None)
+
+
+async def load_points(session_id: int) -> list[tuple[datetime, float, float]]:
+    """Все точки маршрута сессии (время UTC, широта, долгота), например для выгрузки."""
+    try:
+        async with models.session() as session:
+            chunks = await session.scalars(select(models.TrackChunk.data)
+                                           .where(models.TrackChunk.session_id == session_id)
+                                           .order_by(models.TrackChunk.id))
+            return [point for data in chunks for point in decode_points(data)]
+    except Exception as e:
+        private_logger.error(f'Ошибка чтения точек маршрута сессии {session_id}: {e}')
+        return []
+
+
+route_tracker = RouteTracker()
+signals.subscribe(route_tracker.on_session_changed)
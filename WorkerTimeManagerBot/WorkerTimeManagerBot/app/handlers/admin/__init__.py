@@ -1,11 +1,12 @@
-from . import workers_management, logs_management
-from . import sessions_management, sessions_editor
+from . import callbacks, workers_management, logs_management, nearby, bulk
+# Модули только с кнопками: импорт регистрирует их обработчики в callbacks.table
+from . import sessions_management, sessions_editor, reports, dashboard, audit, routes
 from ...misc.middlewares import AdminCheckMiddleware
 
-admin_routers = [workers_management.router, sessions_management.router, sessions_editor.router, logs_management.router]
+admin_routers = [callbacks.router, workers_management.router, logs_management.router, nearby.router, bulk.router]
 
 
 # Устанавливаем middleware для всех детей родительского класса админа
 for router in admin_routers:
     router.message.middleware(AdminCheckMiddleware())
-    router.callback_query.middleware(AdminCheckMiddleware())
\ No newline at end of file
+    router.callback_query.middleware(AdminCheckMiddleware())
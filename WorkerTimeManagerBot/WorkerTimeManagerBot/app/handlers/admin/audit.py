@@ -0,0 +1,85 @@
+from datetime import datetime
+from html import escape
+
+from aiogram.types import CallbackQuery
+from aiogram.utils.markdown import hbold
+
+from app.db import queries, models
+from app.keyboards import inlines
+from app.keyboards.callbacks import SessionAudit, WorkerAudit
+from app.misc.rendering import format_local
+from .callbacks import table
+
+PAGE_SIZE = 10
+
+ACTION_LABELS = {
+    'session_started': 'Начало смены',
+    'session_ended': 'Завершение смены',
+    'session_deleted': 'Удаление сессии',
+    'rate_changed': 'Изменение ставки',
+    'start_time_changed': 'Изменение времени начала',
+    'end_time_changed': 'Изменение времени конца',
+}
+
+
+def _format_time(value: str) -> str:
+    # В журнале время хранится в UTC, показываем в локальном
+    return format_local(datetime.fromisoformat(value)) if value != 'None' else 'не завершена'
+
+
+def _format_value(action: str, value: str | None) -> str:
+    if value is None:
+        return '—'
+    if action == 'rate_changed':
+        return f'{int(value) / 100:.2f} ₽/ч'
+    if action in ('start_time_changed', 'end_time_changed', 'session_ended'):
+        return _format_time(value)
+    if action == 'session_deleted':
+        return ' - '.join(map(_format_time, value.split(' - ')))
+    return escape(value)
+
+
+def render_audit_event(event: models.AuditEvent) -> str:
+    actor = 'система' if event.actor_id is None else f'ID{event.actor_id}'
+    text = (f'{format_local(event.created_at)} | {actor} | сессия №{event.session_id}\n'
+            f'{ACTION_LABELS.get(event.action, event.action)}')
+    if event.action != 'session_started' or event.new_value:
+        text += f': {_format_value(event.action, event.old_value)} → {_format_value(event.action, event.new_value)}'
+    return text
+
+
+@table.route(SessionAudit)
+@table.route(WorkerAudit)
+async def audit_history_handler(callback: CallbackQuery, callback_data: SessionAudit | WorkerAudit):
+    """
+    История изменений сессии или работника.
+    before_id - id последнего показанного события, с него продолжается следующая страница.
+    """
+    before_id = callback_data.before_id
+
+    if isinstance(callback_data, SessionAudit):
+        title = f'История сессии №{callback_data.session_id}'
+        events = await queries.get_audit_events(session_id=callback_data.session_id, before_id=before_id,
+                                                limit=PAGE_SIZE + 1)
+    else:
+        user = await queries.get_user_by_telegram_id(callback_data.telegram_id)
+        if not user:
+            await callback.answer('Пользователь не найден.')
+            return
+        title = f'История работника ID{callback_data.telegram_id}'
+        events = await queries.get_audit_events(user_id=user.id, before_id=before_id, limit=PAGE_SIZE + 1)
+
+    # Лишнее (PAGE_SIZE + 1) событие только показывает, что есть следующая страница
+    has_next = len(events) > PAGE_SIZE
+    events = events[:PAGE_SIZE]
+
+    text = hbold(title) + '\n\n'
+    text += '\n\n'.join(map(render_audit_event, events)) if events else 'Записей нет.'
+    keyboard = inlines.audit_page_kb(callback_data, events[-1].id if has_next else None)
+
+    # Первая страница - отдельным сообщением, следующие заменяют предыдущую
+    if before_id is None:
+        await callback.message.answer(text, reply_markup=keyboard)
+    else:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
@@ -0,0 +1,238 @@
+"""
+Массовые действия администратора с сессиями.
+
+Сессии отмечаются в списке "Управление сессиями" (режим "Выбрать несколько", выбор хранится в данных FSM), затем
+к ним применяется действие: завершить, изменить ставку, сдвинуть время. Есть и действия без выбора: завершить все
+активные сессии и поставить ставку сессиям работника без ставки за период (кнопка в карточке работника).
+
+Каждое действие - один UPDATE ... RETURNING (queries.end_sessions / set_sessions_rate / shift_sessions), после
+которого за один проход уведомлений каждый затронутый работник получает одно сообщение, а администратор - сводку.
+"""
+
+from datetime import datetime, date, UTC
+
+from aiogram import Router, Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message
+from aiogram.utils.markdown import hbold, hcode
+
+from app.db import queries
+from app.db.facts import SessionFacts
+from app.db.overlaps import SessionTimeConflict
+from app.handlers.state.groups import AdminStates
+from app.keyboards import inlines, replies
+from app.keyboards.callbacks import ToggleSession, BulkSessions, BulkAction, WorkerBulkRate
+from app.misc import notify, rendering
+from app.misc.config import private_logger
+from app.misc.live_stats import live_stats
+from .callbacks import table
+from .sessions_management import list_sessions, get_selection, set_selection
+
+router = Router()
+
+MAX_SHIFT_MINUTES = 24 * 60
+
+WORKER_RATE_HELP = (
+    'Введите ставку в рублях для сессий работника без ставки. Чтобы ограничить период, добавьте первый и последний '
+    f'день: {hcode("350 2024-05-01 2024-05-31")}'
+)
+
+
+class BulkInputError(ValueError):
+    pass
+
+
+def parse_rate(text: str) -> int:
+    """Ставка в рублях -> копейки."""
+    try:
+        rate_kopecks = round(float(text.replace(',', '.')) * 100)
+    except ValueError:
+        raise BulkInputError('Ставка должна быть числом') from None
+    if rate_kopecks <= 0:
+        raise BulkInputError('Ставка должна быть больше нуля')
+    return rate_kopecks
+
+
+def parse_shift(text: str) -> int:
+    """'+30' / '-15' -> минуты."""
+    try:
+        minutes = int(text.strip())
+    except ValueError:
+        raise BulkInputError('Сдвиг должен быть целым числом минут') from None
+    if not 0 < abs(minutes) <= MAX_SHIFT_MINUTES:
+        raise BulkInputError(f'Сдвиг должен быть от 1 до {MAX_SHIFT_MINUTES} минут по модулю')
+    return minutes
+
+
+def parse_worker_rate(text: str) -> tuple[int, date | None, date | None]:
+    """'ставка [первый_день последний_день]' -> (копейки, первый день, последний день)."""
+    words = text.split()
+    if len(words) not in (1, 3):
+        raise BulkInputError('Нужна ставка и, по желанию, два дня периода')
+    rate_kopecks = parse_rate(words[0])
+    if len(words) == 1:
+        return rate_kopecks, None, None
+    try:
+        first_day, last_day = date.fromisoformat(words[1]), date.fromisoformat(words[2])
+    except ValueError:
+        raise BulkInputError('Дни периода - в формате YYYY-MM-DD') from None
+    if first_day > last_day:
+        raise BulkInputError('Первый день периода позже последнего')
+    return rate_kopecks, first_day, last_day
+
+
+async def notify_changed(bot: Bot, admin_id: int, changed: list[tuple[SessionFacts, int | None]], title: str,
+                         worker_title: str, ended: bool = False):
+    """
+    Один проход уведомлений после массового действия: работнику - одно сообщение по всем его сессиям,
+    администратору - сводка по всем.
+    :param ended: Сессии завершены - убрать сообщения о начале смены и вернуть работникам меню
+    """
+    digest, by_worker = [], {}
+    for facts, _ in changed:
+        reports = await rendering.render_session_reports(facts, ('worker', 'digest'))
+        digest.append(reports['digest'])
+        if facts.telegram_id is not None:
+            by_worker.setdefault(facts.telegram_id, []).append(f'\n{reports["worker"]}')
+
+    if ended:
+        await notify.delete_messages(bot, [(facts.telegram_id, message_id) for facts, message_id in changed
+                                           if facts.telegram_id is not None])
+    messages = []
+    for telegram_id, reports in by_worker.items():
+        kwargs = {'reply_markup': replies.worker_menu(telegram_id)} if ended else {}
+        messages += [(telegram_id, chunk, kwargs) for chunk in notify.join_chunks(hbold(worker_title), reports)]
+    messages += [(admin_id, chunk, {}) for chunk in notify.join_chunks(hbold(f'{title}: {len(changed)}'), digest)]
+    await notify.send_batch(bot, messages)
+
+
+def log_bulk(actor: int, changed: list[tuple[SessionFacts, int | None]], action: str, description: str):
+    session_ids = [facts.id for facts, _ in changed]
+    private_logger.info(f'Администратор {actor} {description}: сессии {session_ids}',
+                        extra={'actor': actor, 'action': action, 'session_ids': session_ids})
+
+
+@table.route(ToggleSession)
+async def toggle_session(callback: CallbackQuery, callback_data: ToggleSession, state: FSMContext):
+    selected = set(await get_selection(state))
+    selected ^= {callback_data.session_id}
+    await set_selection(state, list(selected))
+    await list_sessions(callback, callback_data.page, state, select=True)
+
+
+@table.route(BulkSessions)
+async def bulk_sessions(callback: CallbackQuery, callback_data: BulkSessions, state: FSMContext):
+    action, page = callback_data.action, callback_data.page
+
+    if action == BulkAction.END_ALL:
+        await callback.answer()
+        await callback.message.edit_text(f'Завершить все активные сессии ({len(live_stats.active)})? '
+                                         'Работники получат уведомления.',
+                                         reply_markup=inlines.end_all_confirmation_kb(page))
+        return
+    if action == BulkAction.END_ALL_CONFIRMED:
+        await callback.answer()
+        changed = await queries.end_sessions(None, datetime.now(UTC))
+        log_bulk(callback.from_user.id, changed, 'sessions_bulk_ended', 'завершил все активные сессии')
+        await callback.message.edit_text(f'Завершено сессий: {len(changed)}.')
+        await notify_changed(callback.bot, callback.from_user.id, changed, 'Завершено сессий',
+                             'Вашу смену завершил администратор!', ended=True)
+        return
+
+    selected = await get_selection(state)
+    if action == BulkAction.CLEAR:
+        await set_selection(state, [])
+        await list_sessions(callback, page, state, select=True)
+        return
+    if not selected:
+        await callback.answer('Сначала выберите сессии в списке.')
+        return
+
+    await callback.answer()
+    if action == BulkAction.MENU:
+        await callback.message.edit_text(f'Выбрано сессий: {len(selected)}', reply_markup=inlines.bulk_actions_kb(page))
+    elif action == BulkAction.END:
+        changed = await queries.end_sessions(selected, datetime.now(UTC))
+        await set_selection(state, [])
+        log_bulk(callback.from_user.id, changed, 'sessions_bulk_ended', 'завершил выбранные сессии')
+        await callback.message.edit_text(f'Завершено сессий: {len(changed)} (остальные уже были завершены).')
+        await notify_changed(callback.bot, callback.from_user.id, changed, 'Завершено сессий',
+                             'Вашу смену завершил администратор!', ended=True)
+    elif action == BulkAction.RATE:
+        await state.set_state(AdminStates.waiting_for_bulk_rate)
+        await callback.message.answer(f'Введите новую ставку в рублях для выбранных сессий ({len(selected)}):',
+                                      reply_markup=replies.back_action)
+    elif action == BulkAction.SHIFT:
+        await state.set_state(AdminStates.waiting_for_bulk_shift)
+        await callback.message.answer(f'На сколько минут сдвинуть начало и конец выбранных сессий ({len(selected)})? '
+                                      f'Например, {hcode("+30")} или {hcode("-15")}.',
+                                      reply_markup=replies.back_action)
+
+
+@router.message(AdminStates.waiting_for_bulk_rate)
+async def bulk_rate(message: Message, state: FSMContext):
+    try:
+        rate_kopecks = parse_rate(message.text or '')
+    except BulkInputError as e:
+        await message.answer(f'{e}. Попробуйте ещё раз.')
+        return
+    selected = await get_selection(state)
+    await state.clear()
+
+    changed = await queries.set_sessions_rate(rate_kopecks, session_ids=selected)
+    log_bulk(message.from_user.id, changed, 'sessions_bulk_rate_changed', f'изменил ставку на {rate_kopecks / 100} руб')
+    await message.answer(f'Ставка {rate_kopecks / 100:.2f} руб. установлена для сессий: {len(changed)}.',
+                         reply_markup=replies.worker_menu(message.from_user.id))
+    await notify_changed(message.bot, message.from_user.id, changed, 'Изменена ставка сессий',
+                         'Ваша ставка изменилась, отчёты по сессиям:')
+
+
+@router.message(AdminStates.waiting_for_bulk_shift)
+async def bulk_shift(message: Message, state: FSMContext):
+    try:
+        minutes = parse_shift(message.text or '')
+    except BulkInputError as e:
+        await message.answer(f'{e}. Попробуйте ещё раз.')
+        return
+    selected = await get_selection(state)
+    await state.clear()
+
+    try:
+        changed = await queries.shift_sessions(selected, minutes)
+    except SessionTimeConflict as e:
+        await message.answer(f'Время не сдвинуто. Сессия №{e.session_id}: {rendering.render_conflict(e)}',
+                             reply_markup=replies.worker_menu(message.from_user.id))
+        return
+    log_bulk(message.from_user.id, changed, 'sessions_bulk_shifted', f'сдвинул время на {minutes:+d} мин')
+    await message.answer(f'Время сдвинуто на {minutes:+d} мин для сессий: {len(changed)}.',
+                         reply_markup=replies.worker_menu(message.from_user.id))
+    await notify_changed(message.bot, message.from_user.id, changed, 'Сдвинуто время сессий',
+                         'Администратор изменил время ваших смен:')
+
+
+@table.route(WorkerBulkRate)
+async def worker_rate_prompt(callback: CallbackQuery, callback_data: WorkerBulkRate, state: FSMContext):
+    await callback.answer()
+    await state.set_state(AdminStates.waiting_for_worker_rate)
+    await state.update_data(user_id=callback_data.user_id)
+    await callback.message.answer(WORKER_RATE_HELP, reply_markup=replies.back_action)
+
+
+@router.message(AdminStates.waiting_for_worker_rate)
+async def worker_rate(message: Message, state: FSMContext):
+    try:
+        rate_kopecks, first_day, last_day = parse_worker_rate(message.text or '')
+    except BulkInputError as e:
+        await message.answer(f'{e}. Попробуйте ещё раз.')
+        return
+    user_id = (await state.get_data()).get('user_id')
+    await state.clear()
+
+    changed = await queries.set_sessions_rate(rate_kopecks, user_id=user_id, first_day=first_day, last_day=last_day)
+    period = f' за {first_day} - {last_day}' if first_day else ''
+    log_bulk(message.from_user.id, changed, 'sessions_bulk_rate_changed',
+             f'поставил ставку {rate_kopecks / 100} руб сессиям без ставки{period}')
+    await message.answer(f'Ставка {rate_kopecks / 100:.2f} руб. установлена для сессий без ставки{period}: '
+                         f'{len(changed)}.', reply_markup=replies.worker_menu(message.from_user.id))
+    await notify_changed(message.bot, message.from_user.id, changed, 'Поставлена ставка сессиям',
+                         'Вашим сменам назначена ставка, отчёты по сессиям:')
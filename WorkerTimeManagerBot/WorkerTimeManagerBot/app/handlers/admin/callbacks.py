@@ -0,0 +1,52 @@
+"""
+Единая точка входа для нажатий inline-кнопок административной панели.
+
+Вместо цепочки фильтров F.data.startswith(...) по нескольким роутерам обработчик выбирается по префиксу
+callback data из словаря: один поиск на нажатие, сколько бы кнопок ни было. Обработчики регистрируются
+декоратором @table.route(Фабрика) в своих модулях и получают разобранные данные в параметре callback_data.
+"""
+
+from aiogram import Router, F
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+from app.keyboards import callbacks
+from app.misc import metrics
+
+router = Router()
+
+
+class CallbackTable:
+    def __init__(self):
+        self._handlers: dict[str, CallableObject] = {}
+
+    def route(self, factory: type[CallbackData]):
+        """Регистрирует обработчик кнопок фабрики. Второй обработчик на тот же префикс - ошибка при импорте."""
+        def decorator(handler):
+            if factory.__prefix__ in self._handlers:
+                registered = self._handlers[factory.__prefix__].callback
+                raise ValueError(f'Кнопки {factory.__name__} уже обрабатывает {registered.__module__}.'
+                                 f'{registered.__name__}')
+            self._handlers[factory.__prefix__] = CallableObject(handler)
+            return handler
+        return decorator
+
+    def resolve(self, callback_data: CallbackData) -> CallableObject | None:
+        return self._handlers.get(callback_data.__prefix__)
+
+
+table = CallbackTable()
+
+
+@router.callback_query(F.data)
+async def dispatch_callback(callback: CallbackQuery, **data):
+    callback_data = callbacks.parse(callback.data)
+    handler = table.resolve(callback_data) if callback_data is not None else None
+    if handler is None:
+        # Кнопка из сообщения, отправленного до изменения формата, или неизвестная кнопка
+        await callback.answer('Эта кнопка устарела, откройте административную панель заново.')
+        return
+
+    metrics.set_handler(handler.callback)
+    return await handler.call(callback, **data, callback_data=callback_data)
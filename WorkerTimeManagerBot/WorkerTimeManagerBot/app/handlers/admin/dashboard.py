@@ -0,0 +1,47 @@
+from aiogram.types import CallbackQuery
+from aiogram.utils.markdown import hbold
+
+from app.keyboards import inlines
+from app.keyboards.callbacks import Dashboard
+from app.misc.live_stats import live_stats, DashboardSnapshot
+from app.misc.message_cache import rendered_messages
+from app.misc.rendering import format_local
+from .callbacks import table
+
+
+def _format_duration(seconds: int) -> str:
+    hours, rem = divmod(seconds, 3600)
+    return f'{hours} ч {rem // 60} мин'
+
+
+def render_dashboard(snapshot: DashboardSnapshot) -> str:
+    text = (
+        f'{hbold("Дашборд")}\n\n'
+        f'Сейчас работают: {hbold(snapshot.active_workers)}\n'
+        f'Отработано сегодня: {hbold(_format_duration(snapshot.worked_seconds_today))}\n'
+        f'Заработано сегодня: {hbold(f"{snapshot.earned_kopecks_today / 100:.2f} ₽")}\n'
+        f'Прогноз выплат за день: {hbold(f"{snapshot.projected_kopecks_today / 100:.2f} ₽")}\n'
+    )
+
+    if snapshot.longest_sessions:
+        text += f'\n{hbold("Самые долгие открытые смены:")}'
+    for facts, seconds in snapshot.longest_sessions:
+        started_at = format_local(facts.started_at)
+        text += (f'\nID{facts.telegram_id} | {facts.work_position} | с {started_at} '
+                 f'({_format_duration(seconds)})')
+
+    return text
+
+
+@table.route(Dashboard)
+async def dashboard_handler(callback: CallbackQuery):
+    """
+    Обработчик для кнопки "Дашборд". Не делает запросов к БД: все цифры берутся из app.misc.live_stats.
+    """
+    text = render_dashboard(live_stats.snapshot())
+
+    # Сообщение редактируется, только если цифры изменились
+    if not await rendered_messages.edit_text(callback.message, text, inlines.dashboard_kb):
+        await callback.answer('Данные не изменились')
+        return
+    await callback.answer()
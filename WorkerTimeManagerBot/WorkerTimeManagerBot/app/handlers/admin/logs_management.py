@@ -1,13 +1,61 @@
-import os.path
+import asyncio
+import os
+from datetime import datetime
 
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, FSInputFile
+from aiogram import Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, FSInputFile, Message
+from aiogram.utils.markdown import hbold, hcode
+
+from app.handlers.state.groups import AdminStates
+from app.keyboards.callbacks import PrivateLogs
+from app.misc.config import private_logger
+from app.misc.log_search import log_index, parse_filter, LogFilterError
+from .callbacks import table
 
 router = Router()
 
+FILTER_HELP = (
+    f'{hbold("Выборка логов")}\n\n'
+    'Отправьте фильтр одной строкой, параметры через пробел (все необязательны):\n'
+    f'{hcode("с=2026-10-01 по=2026-10-02T18:00 уровень=ERROR работник=123456 сессия=15")}\n\n'
+    'Даты - в локальном времени, "по" без времени включает весь день. '
+    f'Отправьте {hcode("-")}, чтобы получить все логи.'
+)
+
 
-@router.callback_query(F.data == 'get_txt_private_logs')
-async def get_txt_private_logs(callback: CallbackQuery):
+@table.route(PrivateLogs)
+async def get_txt_private_logs(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
-    await callback.message.answer_document(FSInputFile(path=os.path.abspath('private_logs.txt'),
-                                                       filename='private_logs.txt'))
\ No newline at end of file
+    await callback.message.answer(FILTER_HELP)
+    await state.set_state(AdminStates.waiting_for_logs_filter)
+
+
+@router.message(AdminStates.waiting_for_logs_filter)
+async def send_filtered_logs(message: Message, state: FSMContext):
+    """
+    Отправляет записи логов по фильтру сжатым документом. Поиск идёт по индексу смещений в отдельном потоке,
+    результат пишется во временный .gz и отправляется с диска.
+    """
+    try:
+        log_filter = parse_filter(message.text or '')
+    except LogFilterError as e:
+        await message.answer(f'{e}. Попробуйте ещё раз или отправьте "-" для всех логов.')
+        return
+    await state.clear()
+
+    path = None
+    try:
+        path, found = await asyncio.to_thread(log_index.export, log_filter)
+        if path is None:
+            await message.answer('Записей по этому фильтру не найдено.')
+            return
+
+        filename = f'private_logs-{datetime.now().strftime("%Y%m%d-%H%M%S")}.txt.gz'
+        await message.answer_document(FSInputFile(path=path, filename=filename), caption=f'Найдено записей: {found}')
+    except Exception as e:
+        await message.answer('Ошибка при выборке логов')
+        private_logger.error(f'Ошибка при выборке логов: {e}')
+    finally:
+        if path is not None:
+            os.remove(path)
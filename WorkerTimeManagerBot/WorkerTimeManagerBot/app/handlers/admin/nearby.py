@@ -0,0 +1,99 @@
+from html import escape
+
+from aiogram import Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message
+from aiogram.utils.markdown import hbold, hcode
+
+from app.db import queries
+from app.handlers.state.groups import AdminStates
+from app.keyboards.callbacks import NearbySessions
+from app.misc.rendering import format_local
+from .callbacks import table
+
+router = Router()
+
+DEFAULT_RADIUS_KM = 1.0
+MAX_RADIUS_KM = 100.0
+RESULTS_LIMIT = 30
+HISTORY_WORDS = ('все', 'история')
+
+NEARBY_HELP = (
+    f'{hbold("Кто работает рядом")}\n\n'
+    'Отправьте точку на карте (поиск среди активных смен в радиусе '
+    f'{DEFAULT_RADIUS_KM:g} км) или строку вида\n'
+    f'{hcode("55.7558 37.6173 2")} - широта, долгота и радиус в км (необязательно).\n'
+    f'Добавьте {hcode("все")}, чтобы искать и среди завершённых смен.'
+)
+
+
+class NearbyQueryError(ValueError):
+    pass
+
+
+def parse_query(text: str) -> tuple[float, float, float, bool]:
+    """
+    Разбирает "широта долгота [радиус] [все]".
+    :return: (широта, долгота, радиус в км, включать ли завершённые смены)
+    """
+    words = text.replace(',', ' ').lower().split()
+    include_history = bool(words) and words[-1] in HISTORY_WORDS
+    if include_history:
+        words.pop()
+    if len(words) not in (2, 3):
+        raise NearbyQueryError('Нужны широта и долгота, радиус - по желанию')
+
+    try:
+        latitude, longitude = float(words[0]), float(words[1])
+        radius_km = float(words[2]) if len(words) == 3 else DEFAULT_RADIUS_KM
+    except ValueError:
+        raise NearbyQueryError('Координаты и радиус должны быть числами') from None
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise NearbyQueryError('Координаты вне допустимого диапазона')
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise NearbyQueryError(f'Радиус должен быть от 0 до {MAX_RADIUS_KM:g} км')
+    return latitude, longitude, radius_km, include_history
+
+
+def render_nearby(found: list[tuple[queries.models.WorkSession, float]], radius_km: float,
+                  include_history: bool) -> str:
+    scope = 'смены' if include_history else 'активные смены'
+    text = hbold(f'{scope.capitalize()} в радиусе {radius_km:g} км') + '\n\n'
+    if not found:
+        return text + 'Никого не найдено.'
+
+    lines = []
+    for session, distance in found:
+        status = f'до {format_local(session.ended_date)}' if session.is_ended else 'идёт'
+        lines.append(f'{distance:.2f} км | ID{session.worker.telegram_id} | {escape(session.work_position)} | '
+                     f'сессия №{session.id}, с {format_local(session.created_at)}, {status}')
+    if len(found) == RESULTS_LIMIT:
+        lines.append(f'\nПоказаны ближайшие {RESULTS_LIMIT}.')
+    return text + '\n'.join(lines)
+
+
+@table.route(NearbySessions)
+async def nearby_prompt(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await callback.message.answer(NEARBY_HELP)
+    await state.set_state(AdminStates.waiting_for_nearby_point)
+
+
+@router.message(AdminStates.waiting_for_nearby_point)
+async def nearby_sessions(message: Message, state: FSMContext):
+    """Сессии рядом с точкой: поиск по geohash-индексу (см. queries.get_sessions_near)."""
+    if message.location:
+        latitude, longitude = message.location.latitude, message.location.longitude
+        radius_km, include_history = DEFAULT_RADIUS_KM, False
+    else:
+        try:
+            latitude, longitude, radius_km, include_history = parse_query(message.text or '')
+        except NearbyQueryError as e:
+            await message.answer(f'{e}. Попробуйте ещё раз.')
+            return
+    await state.clear()
+
+    found = await queries.get_sessions_near(latitude, longitude, radius_km, active_only=not include_history,
+                                            limit=RESULTS_LIMIT)
+    await message.answer(render_nearby(found, radius_km, include_history))
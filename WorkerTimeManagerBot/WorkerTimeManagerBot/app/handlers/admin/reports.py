@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta, UTC
+
+from aiogram.types import CallbackQuery
+from aiogram.utils.markdown import hbold
+
+from app.db import queries
+from app.keyboards.callbacks import WorkedTimeReport
+from app.misc.rendering import to_local
+from .callbacks import table
+
+REPORT_DAYS = 7  # За сколько последних дней показывать отчёт
+
+
+@table.route(WorkedTimeReport)
+async def worked_time_report(callback: CallbackQuery):
+    """
+    Отчёт по отработанному времени за последние дни.
+    Читается из предрасчитанных итогов (rollup), поэтому не зависит от количества сессий.
+    """
+    today = to_local(datetime.now(UTC)).date()
+    totals = await queries.get_worked_time_by_days(today - timedelta(days=REPORT_DAYS - 1), today)
+
+    text = hbold(f'Отработано за последние {REPORT_DAYS} дней') + '\n(учтены только завершённые смены)\n'
+    if not totals:
+        text += '\nНет завершённых смен за этот период.'
+
+    for day, seconds, kopecks in totals:
+        hours, rem = divmod(seconds, 3600)
+        text += f'\n{day.strftime("%Y-%m-%d")}: {hours} ч {rem // 60} мин, {kopecks / 100:.2f} ₽'
+
+    await callback.message.answer(text)
+    await callback.answer()
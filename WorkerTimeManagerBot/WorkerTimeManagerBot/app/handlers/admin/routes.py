@@ -0,0 +1,52 @@
+from aiogram.types import CallbackQuery
+from aiogram.utils.markdown import hbold
+
+from app.db import queries
+from app.db.tracks import route_tracker
+from app.keyboards.callbacks import SessionRoute
+from app.misc import geofence
+from app.misc.rendering import format_local
+from .callbacks import table
+
+
+def _format_seconds(seconds: float) -> str:
+    hours, rem = divmod(int(seconds), 3600)
+    return f'{hours} ч {rem // 60} мин'
+
+
+def render_route(session_id: int, track: queries.models.SessionTrack | None, pending: tuple[int, float, int],
+                 has_sites: bool) -> str:
+    pending_points, pending_distance, pending_on_site = pending
+    title = hbold(f'Маршрут сессии №{session_id}') + '\n\n'
+    if track is None and not pending_points:
+        return title + 'Маршрут не записывался: работник не транслировал геопозицию во время смены.'
+
+    points = (track.points if track else 0) + pending_points
+    distance_km = ((track.distance_m if track else 0) + pending_distance) / 1000
+    text = title + f'Точек: {points}'
+    if pending_points:
+        text += f' (ещё не записано: {pending_points})'
+    text += f'\nПройдено: {distance_km:.2f} км'
+
+    if track is not None:
+        tracked_seconds = (track.last_at - track.first_at).total_seconds()
+        text += (f'\nТрансляция: с {format_local(track.first_at)} по {format_local(track.last_at)} '
+                 f'({_format_seconds(tracked_seconds)})')
+        if has_sites:
+            on_site = track.on_site_seconds + pending_on_site
+            share = f' ({on_site / tracked_seconds:.0%})' if tracked_seconds > 0 else ''
+            text += f'\nНа площадке: {_format_seconds(on_site)}{share}'
+        text += f'\nХранится: {track.encoded_bytes} Б в {track.chunks} пачках'
+    return text
+
+
+@table.route(SessionRoute)
+async def session_route_handler(callback: CallbackQuery, callback_data: SessionRoute):
+    """Сводка маршрута смены: только итоги из session_tracks и буфера, сами точки не читаются."""
+    session_id = callback_data.session_id
+    track = await queries.get_session_track(session_id)
+    has_sites = bool(await geofence.get_index())
+
+    await callback.message.answer(render_route(session_id, track, route_tracker.pending_summary(session_id),
+                                               has_sites))
+    await callback.answer()
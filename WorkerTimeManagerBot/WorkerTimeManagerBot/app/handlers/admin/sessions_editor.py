@@ -1,83 +1,76 @@
+from dataclasses import replace
 from datetime import datetime, UTC
 
-from aiogram import types, Router, F
+from aiogram import types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 from aiogram.utils.markdown import hbold
 
 from app.db import queries
+from app.db.facts import SessionFacts
+from .callbacks import table
 from ..state.groups import AdminStates
 from ...keyboards import replies
-from ...misc import utils
+from ...keyboards.callbacks import EditStartTime, EditEndTime, DeleteSession, EndSession
+from ...misc import rendering
 from ...misc.config import private_logger
 
-router = Router()
 
-
-@router.callback_query(lambda call: call.data.startswith('edit_sis_starts_time:'))
-async def handle_edit_start_time(call: types.CallbackQuery, state: FSMContext):
+@table.route(EditStartTime)
+async def handle_edit_start_time(call: types.CallbackQuery, state: FSMContext, callback_data: EditStartTime):
     await call.answer()
-    session_id = int(call.data.split(':')[1])
+    session_id = callback_data.session_id
     await state.set_state(AdminStates.waiting_for_start_time)
     await state.update_data(session_id=session_id)
     await call.message.answer("Пожалуйста, введите новое время начала сессии в формате 'YYYY-MM-DD HH:MM'.",
                               reply_markup=replies.back_action)
 
 
-@router.callback_query(lambda call: call.data.startswith('edit_sis_end_time:'))
-async def handle_edit_end_time(call: types.CallbackQuery, state: FSMContext):
+@table.route(EditEndTime)
+async def handle_edit_end_time(call: types.CallbackQuery, state: FSMContext, callback_data: EditEndTime):
     await call.answer()
-    session_id = int(call.data.split(':')[1])
+    session_id = callback_data.session_id
     await state.set_state(AdminStates.waiting_for_end_time)
     await state.update_data(session_id=session_id)
     await call.message.answer("Пожалуйста, введите новое время конца сессии в формате 'YYYY-MM-DD HH:MM'.",
                               reply_markup=replies.back_action)
 
 
-@router.callback_query(lambda call: call.data.startswith('delete_session:'))
-async def handle_delete_session(call: types.CallbackQuery):
+@table.route(DeleteSession)
+async def handle_delete_session(call: types.CallbackQuery, callback_data: DeleteSession):
     await call.answer()
-    session_id = int(call.data.split(':')[1])
+    session_id = callback_data.session_id
     try:
         await queries.delete_session(session_id)
         await call.message.answer("Сессия успешно удалена.")
-        private_logger.info(f'Администратор {call.from_user.id} удалил сессию ID{session_id}')
+        private_logger.info(f'Администратор {call.from_user.id} удалил сессию ID{session_id}',
+                            extra={'actor': call.from_user.id, 'session_id': session_id, 'action': 'session_deleted'})
     except Exception as e:
         await call.message.answer(f"Ошибка при удалении сессии")
         private_logger.error(f"Ошибка при удалении сессии: {e}")
 
 
-@router.callback_query(F.data.startswith('end_work_session:'))
-async def end_work_session(call: CallbackQuery):
+@table.route(EndSession)
+async def end_work_session(call: CallbackQuery, callback_data: EndSession):
     await call.answer()
-    session_id = int(call.data.split(':')[1])
+    session_id = callback_data.session_id
     session: queries.models.WorkSession = await queries.get_session_by_id(session_id)
 
     try:
         await queries.end_worker_active_session(session.user_id, datetime.now(UTC))
         await call.message.answer("Сессия успешно остановлена.")
-        private_logger.info(f'Администратор {call.from_user.id} остановил сессию ID{session_id}')
-
-        # Извлечение компонентов с использованием divmod
-        total_earned = await queries.get_session_payment(session) / 100
-        days, hours, minutes, seconds = await queries.get_session_time(session)
-
-        text = f'{hbold('Вашу смену завершил администратор!')}\n'
-        text += f'Время работы: '
-        text += f' {days} дней' if days else ''
-        text += f' {hours} часов' if hours else ''
-        text += f' {minutes} минут' if minutes else ''
-        text += f'{seconds} секунд' if not any([hours, days, minutes]) else ''
-        text += (
-            f'\nАдрес: {utils.get_address(session.geolocation_latitude, session.geolocation_longitude)}\n'
-            f'Место / позиция: {session.work_position}')
-
-        if session.hour_kopecks_rate:
-            # Ставка за минуту * кол-во отработанных минут. Всё это округлённое до 2 знаков после запятой
-            # Скобки для читабельности
-            text += (f'\nИндивидуальная ставка: {(session.hour_kopecks_rate / 100):.2f} ₽ / час'
-                     f'\nИтого заработано: {total_earned} ₽')
-
+        private_logger.info(f'Администратор {call.from_user.id} остановил сессию ID{session_id}',
+                            extra={'actor': call.from_user.id, 'worker': session.worker.telegram_id,
+                                   'session_id': session_id, 'action': 'session_force_ended'})
+
+        # Снимок на момент остановки (если сессия уже была завершена - берём как есть)
+        facts = SessionFacts.from_model(session)
+        if not facts.is_closed:
+            facts = replace(facts, ended_at=datetime.now(UTC).replace(tzinfo=None), is_ended=True)
+        facts = await queries.with_rate_changes(facts)  # Если ставка работника поменялась посреди смены
+
+        report = await rendering.render_session_report(facts, 'worker')
+        text = f'{hbold('Вашу смену завершил администратор!')}\n{report}'
         await call.bot.send_message(session.worker.telegram_id, text, reply_markup=replies.worker_menu(
             session.worker.telegram_id
         ))
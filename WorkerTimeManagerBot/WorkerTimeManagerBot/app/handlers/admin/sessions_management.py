@@ -1,37 +1,57 @@
-from datetime import timedelta
 from typing import List
 
-import pytz
-from aiogram import Router, F, Bot
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.markdown import hbold
 
 from app.db import models
 from app.db import queries
+from app.db.facts import SessionFacts
 from app.keyboards import inlines
-from app.misc import utils
+from app.keyboards.callbacks import SessionsList, SessionInfo, ToggleSession, BulkSessions, BulkAction
+from app.misc import rendering
+from app.misc.message_cache import rendered_messages
 from app.misc.config import private_logger
-
-router = Router()
+from .callbacks import table
 
 ITEMS_PER_PAGE = 15  # Количество элементов на странице
+SELECTION_KEY = 'bulk_sessions'  # Выбранные для массовых действий сессии - в данных FSM администратора
+
+
+async def get_selection(state: FSMContext) -> list[int]:
+    return (await state.get_data()).get(SELECTION_KEY, [])
+
 
+async def set_selection(state: FSMContext, session_ids: list[int]):
+    await state.update_data({SELECTION_KEY: sorted(session_ids)})
 
-@router.callback_query(F.data == 'sessions_management')
-async def sessions_management(callback: CallbackQuery):
+
+@table.route(SessionsList)
+async def sessions_management(callback: CallbackQuery, callback_data: SessionsList, state: FSMContext):
     """
-    Обработчик для кнопки "Управление сессиями".
+    Обработчик для кнопки "Управление сессиями" и кнопок пагинации.
     Выводит список сессий с пагинацией.
     """
+    if not callback_data.select and await get_selection(state):
+        await set_selection(state, [])  # Вышли из режима выбора
 
-    await list_sessions(callback)
+    await list_sessions(callback, callback_data.page, state, callback_data.select)
 
 
-async def list_sessions(callback: CallbackQuery, page: int = 1):
+async def list_sessions(callback: CallbackQuery, page: int = 1, state: FSMContext | None = None, select: bool = False):
     """
     Функция для вывода списка сессий с пагинацией.
+    :param select: Режим выбора: нажатие на сессию отмечает её для массовых действий
     """
     try:
+        selected = set(await get_selection(state)) if select else set()
+        # Страница уже показана и сессии не менялись - не пересобираем клавиатуру (это N запросов get_chat)
+        source_key = ('sessions', page, rendered_messages.data_version, select, tuple(sorted(selected)))
+        if rendered_messages.is_fresh(callback.message, source_key):
+            await callback.answer()
+            return
+
         sessions: List[models.WorkSession] = await queries.get_all_sessions(page=page, per_page=ITEMS_PER_PAGE)
         total_sessions: int = await queries.get_sessions_count()
         max_page: int = (total_sessions + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE  # общее количество страниц
@@ -40,57 +60,70 @@ async def list_sessions(callback: CallbackQuery, page: int = 1):
             await callback.answer("Нет сессий для отображения.")
             return
 
-        keyboard = await generate_sessions_keyboard(sessions, page, max_page, callback.bot)
+        keyboard = await generate_sessions_keyboard(sessions, page, max_page, callback.bot,
+                                                    selected if select else None)
+        title = f'Выберите сессии (выбрано: {len(selected)}):' if select else 'Список сессий:'
 
-        await callback.message.edit_text(
-            text=hbold("Список сессий:"),
-            reply_markup=keyboard
-        )
+        await rendered_messages.edit_text(callback.message, hbold(title), keyboard, source_key)
         await callback.answer()  # Убираем "ожидание"
     except Exception as e:
         await callback.answer("Произошла ошибка при выводе списка сессий.")
         private_logger.error(f'Ошибка при получении списка сессий: {e}')
 
 
-async def generate_sessions_keyboard(sessions: List[models.WorkSession], page: int,
-                                     max_page: int, bot: Bot) -> InlineKeyboardMarkup:
+async def generate_sessions_keyboard(sessions: List[models.WorkSession], page: int, max_page: int, bot: Bot,
+                                     selected: set[int] | None = None) -> InlineKeyboardMarkup:
     """
     Функция для генерации клавиатуры со списком сессий и кнопками пагинации.
+    :param selected: Выбранные сессии в режиме выбора, None - обычный список
     """
+    select = selected is not None
     keyboard_buttons = []
     for session in sessions:
-        session_date = (session.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")
+        session_date = rendering.format_local(session.created_at)
         chat = await bot.get_chat(session.worker.telegram_id)
         button_text = f"@{chat.username} | Сессия от: {session_date}"
-        keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"session_info:{session.id}")])
+        if select:
+            button_text = ('☑ ' if session.id in selected else '☐ ') + button_text
+            data = ToggleSession(session_id=session.id, page=page)
+        else:
+            data = SessionInfo(session_id=session.id)
+        keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=data.pack())])
 
     # Кнопки пагинации
     pagination_buttons = []
     if page > 1:
-        pagination_buttons.append(InlineKeyboardButton(text="Назад", callback_data=f"sessions_page:0:{page - 1}"))
+        pagination_buttons.append(InlineKeyboardButton(text="Назад",
+                                                       callback_data=SessionsList(page=page - 1, select=select).pack()))
     if page < max_page:
-        pagination_buttons.append(InlineKeyboardButton(text="Вперед", callback_data=f"sessions_page:0:{page + 1}"))
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons + [pagination_buttons])
+        pagination_buttons.append(InlineKeyboardButton(text="Вперед",
+                                                       callback_data=SessionsList(page=page + 1, select=select).pack()))
+
+    # Массовые действия
+    if select:
+        bulk_buttons = [
+            [InlineKeyboardButton(text=f'Действия ({len(selected)})',
+                                  callback_data=BulkSessions(action=BulkAction.MENU, page=page).pack())],
+            [InlineKeyboardButton(text='Готово', callback_data=SessionsList(page=page).pack())],
+        ]
+    else:
+        bulk_buttons = [
+            [InlineKeyboardButton(text='Выбрать несколько', callback_data=SessionsList(page=page, select=True).pack())],
+            [InlineKeyboardButton(text='Завершить все активные',
+                                  callback_data=BulkSessions(action=BulkAction.END_ALL, page=page).pack())],
+        ]
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons + [pagination_buttons] + bulk_buttons)
     return keyboard
 
 
-@router.callback_query(F.data.startswith("sessions_page:"))
-async def sessions_pagination_handler(callback: CallbackQuery):
-    """
-    Обработчик для кнопок пагинации сессий.
-    """
-    page: int = int(callback.data.split(":")[2])  # sessions_page:page -> page
-    await list_sessions(callback, page)
-
-
-@router.callback_query(F.data.startswith("session_info:"))
-async def session_info_handler(callback: CallbackQuery):
+@table.route(SessionInfo)
+async def session_info_handler(callback: CallbackQuery, callback_data: SessionInfo):
     """
     Обработчик для кнопок с информацией о сессии.
     Выводит информацию о сессии: дата начала, дата окончания, сумма к выплате.
     """
-    session_id: int = int(callback.data.split(":")[1])  # session_info:123 -> 123
+    session_id: int = callback_data.session_id
 
     # Получить сессию из базы данных через queries
     session_obj: models.WorkSession = await queries.get_session_by_id(session_id)
@@ -98,34 +131,10 @@ async def session_info_handler(callback: CallbackQuery):
         await callback.answer("Сессия не найдена.")
         return
 
-    # Получить сумму к выплате
-    payment = await queries.get_session_payment(session_obj)
-    days, hours, minutes, seconds = await queries.get_session_time(session_obj)
-    payment_rub: float = payment / 100  # Перевести в рубли
-
-    # Сформировать текст сообщения
-    start_date = (session_obj.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
-    end_date = (session_obj.ended_date + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S") if session_obj.ended_date else "Еще не закончена"
-    text = (
-        f"Информация о сессии:\n"
-        f"Дата начала: {hbold(start_date)}\n"
-        f"Дата окончания: {hbold(end_date)}\n"
-    )
-
-    text += f'Время работы: '
-    text += f' {days} дней' if days else ''
-    text += f' {hours} часов' if hours else ''
-    text += f' {minutes} минут' if minutes else ''
-    text += f'{seconds} секунд' if not any([hours, days, minutes]) else ''
-    text += (
-        f'\nАдрес: {utils.get_address(session_obj.geolocation_latitude, session_obj.geolocation_longitude)}\n'
-        f'Место / позиция: {session_obj.work_position}')
-
-    if session_obj.hour_kopecks_rate:
-        # Ставка за минуту * кол-во отработанных минут. Всё это округлённое до 2 знаков после запятой
-        text += (f'\nИндивидуальная ставка: {(session_obj.hour_kopecks_rate / 100):.2f} ₽ / час'
-                 f'\nИтого заработано: {payment_rub} ₽')
-
-    await callback.message.edit_text(text=text, reply_markup=inlines.edit_session_kb(session_id,
-                                                                                     session_obj.worker.telegram_id))
+    # Сумма - с изменениями ставки работника внутри сессии, как в отчёте о завершении смены и в итогах
+    facts = await queries.with_rate_changes(SessionFacts.from_model(session_obj))
+    text = "Информация о сессии:\n" + await rendering.render_session_report(facts, 'admin')
+
+    await rendered_messages.edit_text(callback.message, text,
+                                      inlines.edit_session_kb(session_id, session_obj.worker.telegram_id))
     await callback.answer()
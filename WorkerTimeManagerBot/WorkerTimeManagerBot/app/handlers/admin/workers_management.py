@@ -1,8 +1,7 @@
-import asyncio
-from datetime import timedelta
+from dataclasses import replace
+from datetime import datetime, UTC
 from typing import List
 
-import pytz
 from aiogram import Router, F, Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
@@ -12,10 +11,15 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.utils.markdown import hbold
 
 from app.db import models
-from app.db import queries
+from app.db import queries, rollups
+from app.db.facts import SessionFacts
 from app.keyboards import inlines, replies
-from app.misc import utils
+from app.keyboards.callbacks import WorkersList, UserSearch, UserSearchById, UserSearchByUsername, UserInfo, \
+    UserSessions, ChangeRate, SessionInfo, WorkerRate
+from app.misc import rendering
+from app.misc.message_cache import rendered_messages
 from app.misc.config import private_logger
+from .callbacks import table
 
 router = Router()
 
@@ -33,6 +37,7 @@ class UserManagementStates(StatesGroup):
     waiting_for_telegram_id = State()
     waiting_for_rate = State()
     waiting_for_username = State()  # Ожидание ввода юзернейма
+    waiting_for_worker_rate = State()  # Ставка работника в историю ставок (app.db.rates)
 
 
 ITEMS_PER_PAGE = 15  # Количество элементов на странице
@@ -43,13 +48,13 @@ async def admin_panel_utils(message: Message):
     await message.answer(hbold(message.text), reply_markup=inlines.admin_panel)
 
 
-@router.callback_query(F.data == 'workers_management')
-async def worker_management(callback: CallbackQuery):
+@table.route(WorkersList)
+async def worker_management(callback: CallbackQuery, callback_data: WorkersList):
     """
-    Обработчик для кнопки "Управление работниками".
+    Обработчик для кнопки "Управление работниками" и кнопок пагинации.
     Выводит список пользователей с пагинацией.
     """
-    await list_users(callback)
+    await list_users(callback, callback_data.page)
 
 
 async def list_users(callback: CallbackQuery, page: int = 1):
@@ -57,8 +62,14 @@ async def list_users(callback: CallbackQuery, page: int = 1):
     Функция для вывода списка пользователей с пагинацией.
     """
     try:
-        users: List[models.User] = await queries.get_all_users(page=page, per_page=ITEMS_PER_PAGE)
         total_users: int = await queries.get_all_users_count()
+        # Страница уже показана и данные не менялись - не пересобираем клавиатуру (это N запросов get_chat)
+        source_key = ('users', page, total_users, rendered_messages.data_version)
+        if rendered_messages.is_fresh(callback.message, source_key):
+            await callback.answer()
+            return
+
+        users: List[models.User] = await queries.get_all_users(page=page, per_page=ITEMS_PER_PAGE)
         max_page: int = (total_users + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE  # общее количество страниц
 
         if not users:
@@ -67,10 +78,7 @@ async def list_users(callback: CallbackQuery, page: int = 1):
 
         keyboard = await generate_users_keyboard(users, page, max_page, callback.bot)
 
-        await callback.message.edit_text(
-            text=hbold("Список пользователей:"),
-            reply_markup=keyboard
-        )
+        await rendered_messages.edit_text(callback.message, hbold("Список пользователей:"), keyboard, source_key)
         await callback.answer()  # Убираем "ожидание"
     except Exception as e:
         private_logger.error(f"Ошибка при выводе списка пользователей: {e}")
@@ -87,35 +95,36 @@ async def generate_users_keyboard(users: List[models.User], page: int, max_page:
         session_count: int = await queries.get_user_session_count(user.id)
         chat = await bot.get_chat(user.telegram_id)
         button_text = f"ID: {user.telegram_id} | @{chat.username} | Сессий: {session_count}"
-        keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"user:{user.telegram_id}")])
+        keyboard_buttons.append([InlineKeyboardButton(text=button_text,
+                                                      callback_data=UserInfo(telegram_id=user.telegram_id).pack())])
 
     # Кнопки пагинации
     pagination_buttons = []
     if page > 1:
-        pagination_buttons.append(InlineKeyboardButton(text="Назад", callback_data=f"page:{page - 1}"))
+        pagination_buttons.append(InlineKeyboardButton(text="Назад", callback_data=WorkersList(page=page - 1).pack()))
     if page < max_page:
-        pagination_buttons.append(InlineKeyboardButton(text="Вперед", callback_data=f"page:{page + 1}"))
+        pagination_buttons.append(InlineKeyboardButton(text="Вперед", callback_data=WorkersList(page=page + 1).pack()))
 
     # Кнопка для поиска пользователя
-    search_button = [InlineKeyboardButton(text="Поиск пользователя", callback_data="search_user")]
+    search_button = [InlineKeyboardButton(text="Поиск пользователя", callback_data=UserSearch().pack())]
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons + [pagination_buttons, search_button])
     return keyboard
 
 
-@router.callback_query(F.data == "search_user")
+@table.route(UserSearch)
 async def search_user(callback: CallbackQuery, state: FSMContext):
     """
     Начинает процесс поиска пользователя, предлагая выбрать тип поиска
     """
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="По Telegram ID", callback_data="search_by_id")],
-        [InlineKeyboardButton(text="По Username", callback_data="search_by_username")]
+        [InlineKeyboardButton(text="По Telegram ID", callback_data=UserSearchById().pack())],
+        [InlineKeyboardButton(text="По Username", callback_data=UserSearchByUsername().pack())]
     ])
     await callback.message.edit_text("Выберите способ поиска пользователя:", reply_markup=keyboard)
     await callback.answer()
 
 
-@router.callback_query(F.data == "search_by_id")
+@table.route(UserSearchById)
 async def search_by_id(callback: CallbackQuery, state: FSMContext):
     """
     Начинает поиск пользователя по Telegram ID
@@ -125,7 +134,7 @@ async def search_by_id(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "search_by_username")
+@table.route(UserSearchByUsername)
 async def search_by_username(callback: CallbackQuery, state: FSMContext):
     """
     Начинает поиск пользователя по Username
@@ -176,23 +185,13 @@ async def get_username(message: Message, state: FSMContext):
     await state.clear()
 
 
-@router.callback_query(F.data.startswith("page:"))
-async def pagination_handler(callback: CallbackQuery):
-    """
-    Обработчик для кнопок пагинации.
-    """
-    page: int = int(callback.data.split(":")[1])  # page:2 -> 2
-    await list_users(callback, page)
-
-
-@router.callback_query(F.data.startswith("user:"))
-async def user_info_handler(callback: CallbackQuery):
+@table.route(UserInfo)
+async def user_info_handler(callback: CallbackQuery, callback_data: UserInfo):
     """
     Обработчик для кнопок с информацией о пользователе.
     Выводит информацию о пользователе и кнопки управления.
     """
-    telegram_id: int = int(callback.data.split(":")[1])  # user:12345 -> 12345
-    await show_user_info(callback.message, telegram_id)
+    await show_user_info(callback.message, callback_data.telegram_id)
     await callback.answer()
 
 
@@ -207,6 +206,7 @@ async def show_user_info(message: Message, telegram_id: int):
         return
 
     session_count: int = await queries.get_user_session_count(user.id)
+    worker_rates: List[models.WorkerRate] = await queries.get_worker_rates(user.id)
 
     chat = await message.bot.get_chat(user.telegram_id)
 
@@ -216,8 +216,15 @@ async def show_user_info(message: Message, telegram_id: int):
         f"Telegram ID: {hbold(user.telegram_id)}\n"
         f"Количество сессий: {hbold(session_count)}\n"
     )
+    if worker_rates:
+        text += "Ставки (последние):\n" + "\n".join(
+            f"с {rendering.format_local(rate.effective_from)}: {rate.hour_kopecks_rate / 100:.2f} руб / час"
+            for rate in worker_rates
+        )
+    else:
+        text += "Ставка работника не задана\n"
 
-    keyboard = inlines.worker_user_editor(user.telegram_id)
+    keyboard = inlines.worker_user_editor(user.telegram_id, user.id)
 
     try:
         await message.delete()
@@ -227,14 +234,13 @@ async def show_user_info(message: Message, telegram_id: int):
         await message.answer(text=text, reply_markup=keyboard)
 
 
-@router.callback_query(F.data.startswith("change_rate:"))
-async def change_rate_handler(callback: CallbackQuery, state: FSMContext):
+@table.route(ChangeRate)
+async def change_rate_handler(callback: CallbackQuery, state: FSMContext, callback_data: ChangeRate):
     """
     Обработчик для кнопки "Изменить ставку".
     Запрашивает новое значение ставки у пользователя.
     """
-    session_id: int = int(callback.data.split(":")[1])  # change_rate:12345 -> 12345
-    await state.update_data(session_id=session_id)
+    await state.update_data(session_id=callback_data.session_id)
     await state.set_state(UserManagementStates.waiting_for_rate)
     await callback.message.answer("Пожалуйста, введите новую ставку в рублях:", reply_markup=replies.back_action)
     await callback.answer()
@@ -259,20 +265,27 @@ async def get_new_rate(message: Message, state: FSMContext):
 
         await queries.update_user_session_rate(session_id, rate_kopecks)
 
-        if user_session.old_message_id:
+        # Сообщение о начале идущей смены не трогаем: его правит session_ticker, новую ставку он подхватит сам
+        # (сигнал session_changed). Удалённое сообщение он бы молча перестал обновлять
+        if user_session.old_message_id and user_session.is_ended:
             try:
                 await message.bot.delete_message(user_session.worker.telegram_id, user_session.old_message_id)
             except TelegramBadRequest:
                 pass
 
+        # Объект сессии получен до изменения ставки, поэтому подставляем новую ставку в снимок
+        facts = replace(SessionFacts.from_model(user_session), hour_kopecks_rate=rate_kopecks)
+        facts = await queries.with_rate_changes(facts)  # Ставка работника могла меняться посреди сессии
         await message.bot.send_message(user_session.worker.telegram_id, (
             f'Ваша ставка изменилась, отправляю отчёт по сессии №{user_session.id}\n'
-            f'{await get_sessions_all_information(user_session)}'
+            f'{await rendering.render_session_report(facts, 'worker')}'
         ))
 
 
         private_logger.info(f'Администратор {message.from_user.id} изменил ставку '
-                            f'{user_session.worker.telegram_id} на {rate_rub} руб')
+                            f'{user_session.worker.telegram_id} на {rate_rub} руб',
+                            extra={'actor': message.from_user.id, 'worker': user_session.worker.telegram_id,
+                                   'session_id': session_id, 'action': 'rate_changed'})
 
         await message.answer(f"Ставка пользователя {user_session.worker.telegram_id} "
                              f"успешно изменена на {rate_rub} руб.")
@@ -288,20 +301,81 @@ async def get_new_rate(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка при обновлении ставки.")
 
 
-@router.callback_query(F.data.startswith("user_sessions:"))
-async def user_sessions_handler(callback: CallbackQuery):
+@table.route(WorkerRate)
+async def worker_rate_handler(callback: CallbackQuery, state: FSMContext, callback_data: WorkerRate):
     """
-    Обработчик для кнопки "Сессии пользователя".
-    Выводит список сессий пользователя с пагинацией.
+    Обработчик для кнопки "Ставка работника".
+    Ставка попадает в историю ставок и проставляется в смены, начатые с даты, с которой она действует, до следующей
+    ставки из истории.
     """
-    telegram_id: int = int(callback.data.split(":")[1])  # user_sessions:12345 -> 12345
-    user: models.User = await queries.get_user_by_telegram_id(telegram_id)
+    await state.update_data(telegram_id=callback_data.telegram_id)
+    await state.set_state(UserManagementStates.waiting_for_worker_rate)
+    await callback.message.answer("Введите ставку в рублях. Она начнёт действовать сейчас, либо добавьте дату "
+                                  "'YYYY-MM-DD' или дату и время 'YYYY-MM-DD HH:MM', с которых она действует:",
+                                  reply_markup=replies.back_action)
+    await callback.answer()
 
+
+def parse_worker_rate(text: str) -> tuple[int, datetime]:
+    """
+    "ставка [YYYY-MM-DD [HH:MM]]" -> (ставка в копейках, с какого момента действует в UTC).
+    :raise ValueError: Некорректный формат
+    """
+    words = text.split()
+    if not 1 <= len(words) <= 3:
+        raise ValueError(text)
+    rate_kopecks = round(float(words[0].replace(',', '.')) * 100)
+    if rate_kopecks <= 0:
+        raise ValueError(text)
+    if len(words) == 1:
+        return rate_kopecks, datetime.now(UTC).replace(tzinfo=None)
+    # Дата и время вводятся по местному времени, в БД - UTC
+    local = datetime.strptime(' '.join(words[1:]), '%Y-%m-%d %H:%M' if len(words) == 3 else '%Y-%m-%d')
+    return rate_kopecks, local - rollups.local_offset()
+
+
+@router.message(UserManagementStates.waiting_for_worker_rate)
+async def set_worker_rate(message: Message, state: FSMContext):
+    """
+    Записывает ставку работника. Смены, начатые после момента начала действия ставки (до следующей ставки),
+    получают новую ставку, а у смен, которые идут через этот момент, время после него оплачивается по новой ставке.
+    """
+    try:
+        rate_kopecks, effective_from = parse_worker_rate(message.text or '')
+    except ValueError:
+        await message.answer("Некорректный формат. Пример: 350 или 350 2024-05-01 или 350 2024-05-01 09:00")
+        return
+
+    telegram_id: int = (await state.get_data()).get("telegram_id")
+    await state.clear()
+    user: models.User = await queries.get_user_by_telegram_id(telegram_id)
     if not user:
-        await callback.answer("Пользователь не найден.")
+        await message.answer("Пользователь не найден.")
         return
 
-    await list_user_sessions(callback, user.id)
+    recalculated = await queries.set_worker_rate(user.id, rate_kopecks, effective_from)
+    if recalculated is None:
+        await message.answer("Произошла ошибка при установке ставки.")
+        return
+
+    private_logger.info(f'Администратор {message.from_user.id} установил ставку работника {telegram_id} '
+                        f'{rate_kopecks / 100} руб с {effective_from} (UTC)',
+                        extra={'actor': message.from_user.id, 'worker': telegram_id, 'action': 'worker_rate_set'})
+    text = (f"Ставка {rate_kopecks / 100:.2f} руб с {rendering.format_local(effective_from)} установлена "
+            f"и будет проставляться в новые смены.")
+    if recalculated:
+        text += f"\nСмены, начатые после этой даты или идущие через неё, пересчитаны: {len(recalculated)}."
+    await message.answer(text, reply_markup=replies.worker_menu(message.from_user.id))
+    await show_user_info(message, telegram_id)
+
+
+@table.route(UserSessions)
+async def user_sessions_handler(callback: CallbackQuery, callback_data: UserSessions):
+    """
+    Обработчик для кнопки "Сессии пользователя" и кнопок пагинации.
+    Выводит список сессий пользователя с пагинацией.
+    """
+    await list_user_sessions(callback, callback_data.user_id, callback_data.page)
 
 
 async def list_user_sessions(callback: CallbackQuery, user_id: int, page: int = 1):
@@ -309,6 +383,11 @@ async def list_user_sessions(callback: CallbackQuery, user_id: int, page: int =
     Функция для вывода списка сессий пользователя с пагинацией.
     """
     try:
+        source_key = ('user_sessions', user_id, page, rendered_messages.data_version)
+        if rendered_messages.is_fresh(callback.message, source_key):
+            await callback.answer()
+            return
+
         sessions: List[models.WorkSession] = await queries.get_user_sessions(user_id=user_id, page=page,
                                                                              per_page=ITEMS_PER_PAGE)
         total_sessions: int = await queries.get_user_session_count(user_id)
@@ -320,10 +399,7 @@ async def list_user_sessions(callback: CallbackQuery, user_id: int, page: int =
 
         keyboard = await generate_sessions_keyboard(sessions, user_id, page, max_page)
 
-        await callback.message.edit_text(
-            text=hbold("Сессии пользователя:"),
-            reply_markup=keyboard
-        )
+        await rendered_messages.edit_text(callback.message, hbold("Сессии пользователя:"), keyboard, source_key)
         await callback.answer()  # Убираем "ожидание"
     except Exception as e:
         private_logger.error(f"Ошибка при выводе списка сессий пользователя {user_id}: {e}")
@@ -338,87 +414,19 @@ async def generate_sessions_keyboard(sessions: List[models.WorkSession], user_id
     keyboard_buttons = []
     for session in sessions:
         # Обрезаем дату создания для краткости
-        session_date = (session.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")
+        session_date = rendering.format_local(session.created_at)
         button_text = f"Сессия от: {session_date}"
-        keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"session_info:{session.id}")])
+        keyboard_buttons.append([InlineKeyboardButton(text=button_text,
+                                                      callback_data=SessionInfo(session_id=session.id).pack())])
 
     # Кнопки пагинации
     pagination_buttons = []
     if page > 1:
         pagination_buttons.append(
-            InlineKeyboardButton(text="Назад", callback_data=f"sessions_page:{user_id}:{page - 1}"))
+            InlineKeyboardButton(text="Назад", callback_data=UserSessions(user_id=user_id, page=page - 1).pack()))
     if page < max_page:
-        print(user_id, page, f"sessions_page:{user_id}:{page + 1}")
         pagination_buttons.append(
-            InlineKeyboardButton(text="Вперед", callback_data=f"sessions_page:{user_id}:{page + 1}"))
+            InlineKeyboardButton(text="Вперед", callback_data=UserSessions(user_id=user_id, page=page + 1).pack()))
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons + [pagination_buttons])
     return keyboard
-
-
-# @router.callback_query(F.data.startswith("sessions_page:"))
-# async def sessions_pagination_handler(callback: CallbackQuery):
-#     """
-#     Обработчик для кнопок пагинации сессий.
-#     """
-#     print(callback.data)
-#     data = callback.data.split(":")  # sessions_page:user_id:page
-#     print(data)
-#     user_id: int = int(data[1])
-#     page: int = int(data[2])
-#     await list_user_sessions(callback, user_id, page)
-
-
-@router.callback_query(F.data.startswith("session_info:"))
-async def session_info_handler(callback: CallbackQuery):
-    """
-    Обработчик для кнопок с информацией о сессии.
-    Выводит информацию о сессии: дата начала, дата окончания, сумма к выплате.
-    """
-    session_id: int = int(callback.data.split(":")[1])  # session_info:123 -> 123
-
-    # Получить сессию из базы данных через queries
-    session_obj: models.WorkSession = await queries.get_session_by_id(session_id)
-    if not session_obj:
-        await callback.answer("Сессия не найдена.")
-        return
-    text = f"Информация о сессии:\n" + await get_sessions_all_information(session_obj)
-
-
-    await callback.message.edit_text(text=text, reply_markup=inlines.edit_session_kb(session_id,
-                                                                                     session_obj.worker.telegram_id))
-    await callback.answer()
-
-
-async def get_sessions_all_information(session_obj: queries.models.WorkSession):
-
-    # Получить сумму к выплате
-    payment = await queries.get_session_payment(session_obj)
-    days, hours, minutes, seconds = await queries.get_session_time(session_obj)
-    payment_rub: float = payment / 100  # Перевести в рубли
-
-    # Сформировать текст сообщения
-    start_date = (session_obj.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")
-    end_date = (session_obj.ended_date + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")\
-        if session_obj.ended_date else "Еще не закончена"
-
-    text = (f"Дата начала: {hbold(start_date)}\n"
-        f"Дата окончания: {hbold(end_date)}\n"
-    )
-
-    text += f'Время работы: '
-    text += f' {days} дней' if days else ''
-    text += f' {hours} часов' if hours else ''
-    text += f' {minutes} минут' if minutes else ''
-    text += f'{seconds} секунд' if not any([hours, days, minutes]) else ''
-    text += (
-    f'\nАдрес: {utils.get_address(session_obj.geolocation_latitude, session_obj.geolocation_longitude)}\n'
-    f'Место / позиция: {session_obj.work_position}')
-
-    if session_obj.hour_kopecks_rate:
-    # Ставка за минуту * кол-во отработанных минут. Всё это округлённое до 2 знаков после запятой
-    # Скобки для читабельности
-        text += (f'\nИндивидуальная ставка: {(session_obj.hour_kopecks_rate / 100):.2f} ₽ / час'
-    f'\nИтого заработано: {payment_rub} ₽')
-
-    return text
@@ -3,7 +3,9 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from app.db import queries
+from app.db.overlaps import SessionTimeConflict
 from app.handlers.state.groups import AdminStates
+from app.misc import rendering
 from app.misc.config import private_logger
 
 router = Router()
@@ -18,7 +20,11 @@ async def process_start_time(message: types.Message, state: FSMContext):
         await queries.update_session_start_time(session_id, new_start_time)
         await message.answer("Время начала сессии успешно изменено.")
         private_logger.info(f'Администратор {message.from_user.id} '
-                            f'изменил время начала сессии ID{session_id} на {new_start_time}')
+                            f'изменил время начала сессии ID{session_id} на {new_start_time}',
+                            extra={'actor': message.from_user.id, 'session_id': session_id,
+                                   'action': 'start_time_changed'})
+    except SessionTimeConflict as e:
+        await message.answer(f"Время не изменено: {rendering.render_conflict(e)}")
     except Exception as e:
         await message.answer(f"Ошибка при изменении времени")
         private_logger.error(f'Ошибка при изменении времени: {e}')
@@ -34,7 +40,11 @@ async def process_end_time(message: types.Message, state: FSMContext):
         await queries.update_session_end_time(session_id, new_end_time)
         await message.answer("Время конца сессии успешно изменено.")
         private_logger.info(f'Администратор {message.from_user.id} '
-                            f'изменил время конца сессии ID{session_id} на {new_end_time}')
+                            f'изменил время конца сессии ID{session_id} на {new_end_time}',
+                            extra={'actor': message.from_user.id, 'session_id': session_id,
+                                   'action': 'end_time_changed'})
+    except SessionTimeConflict as e:
+        await message.answer(f"Время не изменено: {rendering.render_conflict(e)}")
     except Exception as e:
         await message.answer(f"Ошибка при изменении времени")
         private_logger.error(f'Ошибка при изменении времени: {e}')
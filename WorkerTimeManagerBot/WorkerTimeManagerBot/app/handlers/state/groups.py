@@ -11,3 +11,8 @@ class ProcessWorkerSession(StatesGroup):
 class AdminStates(StatesGroup):
     waiting_for_start_time = State()
     waiting_for_end_time = State()
+    waiting_for_logs_filter = State()  # Фильтр выборки логов (см. app.misc.log_search.parse_filter)
+    waiting_for_nearby_point = State()  # Точка для поиска сессий рядом (см. app.handlers.admin.nearby)
+    waiting_for_bulk_rate = State()  # Ставка для выбранных сессий (см. app.handlers.admin.bulk)
+    waiting_for_bulk_shift = State()  # Сдвиг времени выбранных сессий в минутах
+    waiting_for_worker_rate = State()  # Ставка для сессий работника без ставки за период
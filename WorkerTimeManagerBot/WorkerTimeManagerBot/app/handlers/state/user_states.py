@@ -1,8 +1,6 @@
 import asyncio
-from datetime import timedelta
-from os import utime
+from html import escape
 
-import pytz
 from aiogram import Router, F
 from aiogram.exceptions import TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
@@ -11,8 +9,11 @@ from aiogram.utils.markdown import hbold
 
 from . import groups
 from ...db import queries
+from ...db.facts import SessionFacts
+from ...db.overlaps import SessionTimeConflict
 from ...keyboards import replies, inlines
-from ...misc import utils
+from ...misc import geofence, rendering
+from ...misc.ticker import session_ticker, STARTED_PREFIX
 from ...misc.config import private_logger, settings
 
 router = Router()
@@ -22,7 +23,15 @@ router = Router()
 # Любой другой текс / медиа / прочее обработано не будет
 @router.message(groups.ProcessWorkerSession.GET_GEOLOCATION, F.location)
 async def get_worker_geolocation(message: Message, state: FSMContext):
-    await state.update_data(location=message.location)
+    location = message.location
+    site_id, out_of_fence = await geofence.check_location(location.latitude, location.longitude)
+    if out_of_fence and settings.GEOFENCE_MODE == 'reject':
+        # Состояние не меняем: работник может отправить местоположение ещё раз, уже с площадки
+        await message.answer('Вы находитесь вне рабочих площадок, начать смену можно только на площадке. '
+                             'Отправьте местоположение ещё раз, когда будете на месте:')
+        return
+
+    await state.update_data(location=location, site_id=site_id, out_of_fence=out_of_fence)
     await state.set_state(groups.ProcessWorkerSession.GET_EXACT_POSITION_MANUALLY)
 
     await message.answer(hbold('Успех!') + f' Геолокация успешно получена и сохранена, введите вашу текущую позицию '
@@ -42,8 +51,11 @@ async def get_worker_position(message: Message, state: FSMContext):
         location: Location = data['location']
 
         session: queries.models.WorkSession = await queries.add_worker_session(message.from_user.id, location.latitude,
-                                                   location.longitude, message.text)
-        private_logger.info(f'Работник ID{message.from_user.id} запустил свой таймер (приступил к работе).')
+                                                   location.longitude, message.text,
+                                                   data.get('site_id'), data.get('out_of_fence', False))
+        private_logger.info(f'Работник ID{message.from_user.id} запустил свой таймер (приступил к работе).',
+                            extra={'actor': message.from_user.id, 'worker': message.from_user.id,
+                                   'session_id': session.id, 'action': 'session_started'})
 
         # await message.answer(hbold('Успех!') + '\nВы приступили к работе.'
         #                                        f'\n\nНажмите {hbold('Завершить работу')} для того, чтобы закончить '
@@ -51,6 +63,9 @@ async def get_worker_position(message: Message, state: FSMContext):
         #                      reply_markup=replies.ends_work)
 
         await send_notification_about_work_to_admin(message, session, session.worker)
+    except SessionTimeConflict as e:
+        await message.answer(f'Смена не начата, обратитесь к Администратору. {rendering.render_conflict(e)}',
+                             reply_markup=replies.worker_menu(message.from_user.id))
     except Exception as e:
         await message.answer('Непредвиденная ошибка, убедитесь в правильности введённых данных или обратитесь к '
                              'Администратору')
@@ -66,27 +81,31 @@ async def send_notification_about_work_to_admin(message: Message, session: queri
                                                 worker: queries.models.User):
     chat = await message.bot.get_chat(worker.telegram_id)
     username = f'@{chat.username}'
+    # Один и тот же текст (и один запрос адреса) для работника и всех администраторов
+    facts = SessionFacts.from_model(session)
+    report = await rendering.render_session_report(facts, 'started')
 
     try:
-        msg = await message.bot.send_message(worker.telegram_id, text=(
-            f'Вы начали работу!\n'
-            f'Начало: {(session.created_at  + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")}\n'
-            f'Ставка пользователя: Не задана'
-            f'\n\nАдрес: {utils.get_address(session.geolocation_latitude, session.geolocation_longitude)}'
-            f'\nМесто: {session.work_position}'), reply_markup=replies.ends_work)
+        text = STARTED_PREFIX + report
+        msg = await message.bot.send_message(worker.telegram_id, text=text, reply_markup=replies.ends_work)
 
         await queries.set_old_message_id_to_session(session.id, msg.message_id)
+        # Дальше в этом сообщении раз в TICKER_INTERVAL_SECONDS обновляется "на смене / заработано"
+        session_ticker.watch(facts, worker.telegram_id, msg.message_id, text)
     except TelegramRetryAfter as e:
         await asyncio.sleep(e.retry_after)
 
     for admin_id in settings.ADMIN_IDS:
         try:
-            await message.bot.send_message(admin_id, text=(
-                f'Пользователь {username} ID{chat.id} начал работу\n'
-                f'Начало: {(session.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")}\n'
-                f'Ставка пользователя: Не задана'
-                f'\n\nАдрес: {utils.get_address(session.geolocation_latitude, session.geolocation_longitude)}'
-                f'\nМесто: {session.work_position}'
-            ), reply_markup=inlines.worker_editor_panel(session.id, worker.telegram_id))
+            await message.bot.send_message(admin_id, text=f'Пользователь {username} ID{chat.id} начал работу'
+                                                          f'{_fence_note(session)}\n{report}',
+                                           reply_markup=inlines.worker_editor_panel(session.id, worker.telegram_id))
         except TelegramRetryAfter as e:
             await asyncio.sleep(e.retry_after)
+
+
+def _fence_note(session: queries.models.WorkSession) -> str:
+    if session.out_of_fence:
+        return '\n' + hbold('Вне рабочих площадок!')
+    name = geofence.site_name(session.site_id)
+    return f'\nПлощадка: {escape(name)}' if name else ''
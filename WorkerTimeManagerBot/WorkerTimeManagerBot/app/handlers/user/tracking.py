@@ -0,0 +1,30 @@
+from aiogram import Router, F
+from aiogram.filters import StateFilter
+from aiogram.types import Message
+
+from app.db.tracks import route_tracker
+
+router = Router()
+
+
+async def _ingest(message: Message) -> bool:
+    location = message.location
+    # У правки время в edit_date (unix-время), у нового сообщения - date
+    timestamp = message.edit_date or int(message.date.timestamp())
+    return await route_tracker.ingest(message.from_user.id, timestamp, location.latitude, location.longitude,
+                                      location.horizontal_accuracy)
+
+
+# Трансляция геопозиции, начатая уже во время смены (при начале смены точку принимает user_states)
+@router.message(StateFilter(None), F.location)
+async def shift_location(message: Message):
+    if not await _ingest(message):
+        return
+    if message.location.live_period:
+        await message.answer('Маршрут смены записывается, пока включена трансляция геопозиции.')
+
+
+# Новые точки трансляции приходят правками исходного сообщения: их может быть очень много, поэтому без ответов
+@router.edited_message(F.location)
+async def shift_location_update(message: Message):
+    await _ingest(message)
@@ -1,7 +1,7 @@
 import asyncio
-from datetime import datetime, UTC, timedelta
+from dataclasses import replace
+from datetime import datetime, UTC
 
-import pytz
 from aiogram import Router, F
 from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
 from aiogram.filters import Command
@@ -10,9 +10,10 @@ from aiogram.types import Message
 from aiogram.utils.markdown import hbold, hitalic
 
 from app.db import queries
+from app.db.facts import SessionFacts
 from app.handlers.state import groups
 from app.keyboards import replies, inlines
-from app.misc import utils
+from app.misc import rendering
 from app.misc.config import private_logger, settings
 
 router = Router()
@@ -45,7 +46,9 @@ async def start_my_work(message: Message, state: FSMContext):
         f'\nНажмите на кнопку {hbold('"Отправить местоположение"')} ниже.'
         f'\n\n{hbold('Очень важно!')} Убедитесь, что у Telegram есть доступ к вашему местоположению '
         f'{hitalic('(у вас включена передача гео локационных данных и у Telegram есть права на просмотр и получение '
-                   'этих данных)')}.',
+                   'этих данных)')}.'
+        f'\n\nЕсли во время смены транслировать геопозицию (скрепка → Геопозиция → Транслировать), '
+        f'бот сохранит маршрут смены.',
         reply_markup=replies.send_geolocation)
 
 
@@ -68,68 +71,28 @@ async def end_my_work(message: Message):
     except TelegramBadRequest:
         pass
 
-    text = f'{hbold('Смена завершена!')}\n'
+    # Снимок сессии на момент завершения: из него один раз строится отчёт и для работника, и для администраторов
+    facts = replace(SessionFacts.from_model(session), ended_at=current_date.replace(tzinfo=None), is_ended=True)
+    facts = await queries.with_rate_changes(facts)  # Если ставка работника поменялась посреди смены
+    report = await rendering.render_session_report(facts, 'worker')
 
-    # Сформировать текст сообщения
-    start_date = (session.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
-    end_date = (current_date + timedelta(hours=3)).strftime(
-        "%Y-%m-%d %H:%M:%S") if current_date else "Еще не закончена"
-    text += (
-        f"\n"
-        f"Дата начала: {hbold(start_date)}\n"
-        f"Дата окончания: {hbold(end_date)}\n"
-    )
-
-    text += f'\n{await get_all_worker_session_info(session)}'
-    msg = await message.answer(text, reply_markup=replies.worker_menu(message.from_user.id))
+    msg = await message.answer(f'{hbold('Смена завершена!')}\n\n{report}',
+                               reply_markup=replies.worker_menu(message.from_user.id))
     await queries.end_worker_active_session(session.worker.id, current_date)
 
     chat = await message.bot.get_chat(session.worker.telegram_id)
     username = f'@{chat.username}'
     for admin_id in settings.ADMIN_IDS:
         try:
-            text = f'Отчёт за пользователя {username} ID{chat.id}'
-
-            # Сформировать текст сообщения
-            start_date = (session.created_at + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
-            end_date = (current_date + timedelta(hours=3)).strftime(
-                "%Y-%m-%d %H:%M:%S") if current_date else "Еще не закончена"
-            text += (
-                f"\n"
-                f"Дата начала: {hbold(start_date)}\n"
-                f"Дата окончания: {hbold(end_date)}\n"
-            )
-
-            text += f'\n{await get_all_worker_session_info(session)}'
-            await message.bot.send_message(admin_id, text,
-            reply_markup=inlines.worker_editor_panel(session.id, session.worker.telegram_id))
+            await message.bot.send_message(admin_id, f'Отчёт за пользователя {username} ID{chat.id}\n\n{report}',
+                                           reply_markup=inlines.worker_editor_panel(session.id, session.worker.telegram_id))
         except TelegramRetryAfter as e:
             await asyncio.sleep(e.retry_after)
 
     if not session.hour_kopecks_rate:
         await queries.set_old_message_id_to_session(session.id, msg.message_id)
 
-    private_logger.info(f'Работник ID{message.from_user.id} остановил свой таймер (завершил работу).')
-
-
-async def get_all_worker_session_info(session: queries.models.WorkSession):
-    # Извлечение компонентов с использованием divmod
-    total_earned = await queries.get_session_payment(session) / 100
-    days, hours, minutes, seconds = await queries.get_session_time(session)
-
-    text = f'Время работы: '
-    text += f' {days} дней' if days else ''
-    text += f' {hours} часов' if hours else ''
-    text += f' {minutes} минут' if minutes else ''
-    text += f'{seconds} секунд' if not any([hours, days, minutes]) else ''
-    text += (
-        f'\nАдрес: {utils.get_address(session.geolocation_latitude, session.geolocation_longitude)}\n'
-        f'Место / позиция: {session.work_position}')
-
-    if session.hour_kopecks_rate:
-        # Ставка за минуту * кол-во отработанных минут. Всё это округлённое до 2 знаков после запятой
-        # Скобки для читабельности
-        text += (f'\nИндивидуальная ставка: {(session.hour_kopecks_rate / 100):.2f} ₽ / час'
-                 f'\nИтого заработано: {total_earned} ₽')
+    private_logger.info(f'Работник ID{message.from_user.id} остановил свой таймер (завершил работу).',
+                        extra={'actor': message.from_user.id, 'worker': message.from_user.id,
+                               'session_id': session.id, 'action': 'session_ended'})
 
-    return text
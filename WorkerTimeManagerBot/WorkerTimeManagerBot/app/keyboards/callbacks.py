@@ -0,0 +1,178 @@
+"""
+Callback data inline-кнопок: типизированные фабрики с короткими префиксами.
+
+Кнопки собираются через .pack(), обработчики получают уже разобранный объект (callback_data). Каждому префиксу
+соответствует ровно один обработчик, который выбирается по словарю (app.handlers.admin.callbacks), а не перебором
+фильтров. Целые числа упаковываются в base36 (Telegram ID 5551234567 -> '2jt2807'), поэтому даже с курсорами и
+фильтрами данные остаются далеко от лимита Telegram в 64 байта.
+
+Поле с Telegram ID во всех фабриках называется telegram_id: по имени его находит запись апдейтов (app.misc.recorder).
+"""
+
+from enum import Enum
+from typing import Annotated, Any
+
+from aiogram.filters.callback_data import CallbackData
+from pydantic import BeforeValidator
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def to_base36(value: int) -> str:
+    if value < 0:
+        return '-' + to_base36(-value)
+    digits = ''
+    while True:
+        value, rem = divmod(value, 36)
+        digits = _DIGITS[rem] + digits
+        if not value:
+            return digits
+
+
+def _from_base36(value: Any) -> Any:
+    return int(value, 36) if isinstance(value, str) else value
+
+
+# Целое, которое в callback data хранится в base36
+Int36 = Annotated[int, BeforeValidator(_from_base36)]
+
+
+class Compact:
+    """Примесь к CallbackData (ставится перед ней): целые поля упаковываются в base36."""
+
+    def _encode_value(self, key: str, value: Any) -> str:
+        if isinstance(value, int) and not isinstance(value, (bool, Enum)):
+            return to_base36(value)
+        return super()._encode_value(key, value)
+
+
+# --- Административная панель ---
+
+class Dashboard(Compact, CallbackData, prefix='d'):
+    pass
+
+
+class WorkersList(Compact, CallbackData, prefix='w'):
+    page: Int36 = 1
+
+
+class UserSearch(Compact, CallbackData, prefix='q'):
+    pass
+
+
+class UserSearchById(Compact, CallbackData, prefix='qi'):
+    pass
+
+
+class UserSearchByUsername(Compact, CallbackData, prefix='qu'):
+    pass
+
+
+class UserInfo(Compact, CallbackData, prefix='u'):
+    telegram_id: Int36
+
+
+class UserSessions(Compact, CallbackData, prefix='us'):
+    user_id: Int36  # id в БД, не Telegram ID
+    page: Int36 = 1
+
+
+class SessionsList(Compact, CallbackData, prefix='s'):
+    page: Int36 = 1
+    select: bool = False  # Режим выбора нескольких сессий для массовых действий
+
+
+class ToggleSession(Compact, CallbackData, prefix='sg'):
+    session_id: Int36
+    page: Int36 = 1
+
+
+class BulkAction(str, Enum):
+    MENU = 'm'
+    END = 'e'
+    RATE = 'r'
+    SHIFT = 's'
+    CLEAR = 'c'
+    END_ALL = 'a'
+    END_ALL_CONFIRMED = 'A'
+
+
+class BulkSessions(Compact, CallbackData, prefix='b'):
+    action: BulkAction
+    page: Int36 = 1  # Страница списка, на которую вернуться
+
+
+class WorkerRate(Compact, CallbackData, prefix='ur'):
+    telegram_id: Int36
+
+
+class WorkerBulkRate(Compact, CallbackData, prefix='wr'):
+    user_id: Int36  # id в БД, не Telegram ID
+
+
+class SessionInfo(Compact, CallbackData, prefix='si'):
+    session_id: Int36
+
+
+class ChangeRate(Compact, CallbackData, prefix='sr'):
+    session_id: Int36
+
+
+class EditStartTime(Compact, CallbackData, prefix='ss'):
+    session_id: Int36
+
+
+class EditEndTime(Compact, CallbackData, prefix='se'):
+    session_id: Int36
+
+
+class EndSession(Compact, CallbackData, prefix='sx'):
+    session_id: Int36
+
+
+class DeleteSession(Compact, CallbackData, prefix='sd'):
+    session_id: Int36
+
+
+class SessionRoute(Compact, CallbackData, prefix='sm'):
+    session_id: Int36
+
+
+class WorkedTimeReport(Compact, CallbackData, prefix='r'):
+    pass
+
+
+class PrivateLogs(Compact, CallbackData, prefix='l'):
+    pass
+
+
+class NearbySessions(Compact, CallbackData, prefix='n'):
+    pass
+
+
+class SessionAudit(Compact, CallbackData, prefix='as'):
+    session_id: Int36
+    before_id: Int36 | None = None  # Курсор: id последнего показанного события
+
+
+class WorkerAudit(Compact, CallbackData, prefix='aw'):
+    telegram_id: Int36
+    before_id: Int36 | None = None
+
+
+FACTORIES: dict[str, type[CallbackData]] = {}
+for _factory in Compact.__subclasses__():
+    if _factory.__prefix__ in FACTORIES:
+        raise ValueError(f'Префикс {_factory.__prefix__!r} уже занят {FACTORIES[_factory.__prefix__].__name__}')
+    FACTORIES[_factory.__prefix__] = _factory
+
+
+def parse(data: str) -> CallbackData | None:
+    """Разбирает callback data по префиксу. None - неизвестный префикс или неверный формат (например, старая кнопка)."""
+    factory = FACTORIES.get(data.split(':', 1)[0])
+    if factory is None:
+        return None
+    try:
+        return factory.unpack(data)
+    except (TypeError, ValueError):
+        return None
@@ -1,32 +1,85 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from .callbacks import Dashboard, WorkersList, SessionsList, WorkedTimeReport, PrivateLogs, ChangeRate, EditStartTime, \
+    EditEndTime, EndSession, DeleteSession, SessionAudit, WorkerAudit, UserSessions, NearbySessions, \
+    SessionRoute, BulkSessions, BulkAction, WorkerBulkRate, WorkerRate
+
 admin_panel = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text='Управление работниками', callback_data='workers_management')],
-    [InlineKeyboardButton(text='Управление сессиями', callback_data='sessions_management')],
-    [InlineKeyboardButton(text='Получить .txt логов', callback_data='get_txt_private_logs')],
+    [InlineKeyboardButton(text='Дашборд', callback_data=Dashboard().pack())],
+    [InlineKeyboardButton(text='Управление работниками', callback_data=WorkersList().pack())],
+    [InlineKeyboardButton(text='Управление сессиями', callback_data=SessionsList().pack())],
+    [InlineKeyboardButton(text='Отработанное время по дням', callback_data=WorkedTimeReport().pack())],
+    [InlineKeyboardButton(text='Кто работает рядом', callback_data=NearbySessions().pack())],
+    [InlineKeyboardButton(text='Получить логи (с фильтром)', callback_data=PrivateLogs().pack())],
+])
+
+dashboard_kb = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text='Обновить', callback_data=Dashboard().pack())],
 ])
 
 
 def edit_session_kb(session_id: int, telegram_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Изменить ставку работника", callback_data=f"change_rate:{session_id}")],
-        [InlineKeyboardButton(text='Изменить время начала', callback_data=f'edit_sis_starts_time:{session_id}')],
-        [InlineKeyboardButton(text='Изменить время конца', callback_data=f'edit_sis_end_time:{session_id}')],
-        [InlineKeyboardButton(text='Завершить сессию', callback_data=f'end_work_session:{session_id}')],
-        [InlineKeyboardButton(text='Удалить сессию навсегда', callback_data=f'delete_session:{session_id}')],
+        [InlineKeyboardButton(text="Изменить ставку работника",
+                              callback_data=ChangeRate(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Изменить время начала', callback_data=EditStartTime(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Изменить время конца', callback_data=EditEndTime(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Завершить сессию', callback_data=EndSession(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Удалить сессию навсегда',
+                              callback_data=DeleteSession(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='История изменений', callback_data=SessionAudit(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Маршрут', callback_data=SessionRoute(session_id=session_id).pack())],
     ])
 
 
-def worker_user_editor(telegram_id: int):
+def worker_user_editor(telegram_id: int, user_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Сессии пользователя", callback_data=f"user_sessions:{telegram_id}")]
+        [InlineKeyboardButton(text="Сессии пользователя", callback_data=UserSessions(user_id=user_id).pack())],
+        [InlineKeyboardButton(text="История изменений", callback_data=WorkerAudit(telegram_id=telegram_id).pack())],
+        [InlineKeyboardButton(text="Ставка работника", callback_data=WorkerRate(telegram_id=telegram_id).pack())],
+        [InlineKeyboardButton(text="Ставка для сессий без ставки",
+                              callback_data=WorkerBulkRate(user_id=user_id).pack())],
     ])
 
 
 def worker_editor_panel(session_id: int, telegram_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Изменить ставку работника", callback_data=f"change_rate:{session_id}")],
-        [InlineKeyboardButton(text='Изменить время начала сессии', callback_data=f'edit_sis_starts_time:{session_id}')],
-        [InlineKeyboardButton(text='Завершить сессию', callback_data=f'end_work_session:{session_id}')],
-        [InlineKeyboardButton(text='Удалить сессию навсегда', callback_data=f'delete_session:{session_id}')],
+        [InlineKeyboardButton(text="Изменить ставку работника",
+                              callback_data=ChangeRate(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Изменить время начала сессии',
+                              callback_data=EditStartTime(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Завершить сессию', callback_data=EndSession(session_id=session_id).pack())],
+        [InlineKeyboardButton(text='Удалить сессию навсегда',
+                              callback_data=DeleteSession(session_id=session_id).pack())],
+    ])
+
+
+def audit_page_kb(page: SessionAudit | WorkerAudit, before_id: int | None):
+    """Клавиатура страницы журнала: "Дальше" ведёт к событиям старше before_id (None - страниц больше нет)."""
+    if before_id is None:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='Дальше', callback_data=page.model_copy(update={'before_id': before_id}).pack())],
+    ])
+
+
+def bulk_actions_kb(page: int):
+    """Действия с выбранными сессиями; page - страница списка, на которую вернуться."""
+    def button(text: str, action: BulkAction) -> list[InlineKeyboardButton]:
+        return [InlineKeyboardButton(text=text, callback_data=BulkSessions(action=action, page=page).pack())]
+
+    return InlineKeyboardMarkup(inline_keyboard=[
+        button('Завершить', BulkAction.END),
+        button('Изменить ставку', BulkAction.RATE),
+        button('Сдвинуть время', BulkAction.SHIFT),
+        button('Снять выбор', BulkAction.CLEAR),
+        [InlineKeyboardButton(text='К списку', callback_data=SessionsList(page=page, select=True).pack())],
+    ])
+
+
+def end_all_confirmation_kb(page: int):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='Да, завершить все',
+                              callback_data=BulkSessions(action=BulkAction.END_ALL_CONFIRMED, page=page).pack())],
+        [InlineKeyboardButton(text='Отмена', callback_data=SessionsList(page=page).pack())],
     ])
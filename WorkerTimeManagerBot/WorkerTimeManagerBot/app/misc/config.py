@@ -1,9 +1,15 @@
+import atexit
 import logging
+import queue
+from typing import Literal
+from logging.handlers import QueueHandler, QueueListener
 
 from dotenv import load_dotenv
-from pydantic.v1 import Field
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from app.misc.logs import CompressingRotatingFileHandler, JsonFormatter, StructuredTextFormatter, TEXT_FORMAT
+
 load_dotenv()
 
 BOT_COMMANDS = {
@@ -18,6 +24,68 @@ class Settings(BaseSettings):
     LOGGING_LEVEL: str | int = Field('INFO')
     BOT_TOKEN: str = Field()
     ADMIN_IDS: list[int] = Field()
+    # Смещение локального времени относительно UTC (по умолчанию МСК). Используется для группировки по дням
+    UTC_OFFSET_HOURS: int = Field(3)
+
+    # Логи: ротация по размеру (байты) и по времени (часы), сколько сжатых архивов хранить и писать ли JSON-строки
+    LOG_FILE: str = Field('private_logs.txt')
+    LOG_MAX_BYTES: int = Field(10 * 1024 * 1024)
+    LOG_ROTATE_HOURS: int = Field(24)
+    LOG_BACKUP_COUNT: int = Field(30)
+    LOG_JSON: bool = Field(False)
+
+    # Метрики в формате Prometheus (0 - сервер не запускается) и порог (секунды) для записи медленных апдейтов в лог
+    METRICS_HOST: str = Field('127.0.0.1')
+    METRICS_PORT: int = Field(0)
+    SLOW_UPDATE_SECONDS: float = Field(1.0)
+
+    # Для разработки и тестов: лимиты на один апдейт (запросы к БД, вызовы Bot API) и допустимая задержка event loop.
+    # off - проверки выключены, warn - предупреждение в лог, raise - исключение BudgetExceeded (для pytest)
+    GUARD_MODE: Literal['off', 'warn', 'raise'] = Field('off')
+    GUARD_MAX_QUERIES: int = Field(8)
+    GUARD_MAX_API_CALLS: int = Field(4)
+    GUARD_LOOP_LAG_SECONDS: float = Field(0.1)
+
+    # Запись входящих апдейтов (без персональных данных) в JSONL для benchmarks/replay.py. None - не записывать.
+    # Соль для псевдонимов ID: если пусто, используется токен бота
+    RECORD_UPDATES_FILE: str | None = Field(None)
+    RECORD_SALT: str = Field('')
+
+    # performance - uvloop, orjson в сессии aiogram и общий пул HTTP-соединений для Bot API и геокодера
+    # (нужны зависимости: poetry install --extras performance). HTTP_POOL_LIMIT - размер пула в этом режиме
+    RUNTIME_PROFILE: Literal['default', 'performance'] = Field('default')
+    HTTP_POOL_LIMIT: int = Field(100)
+    NOMINATIM_URL: str = Field('https://nominatim.openstreetmap.org')
+
+    # offline - адрес ищется в локальном справочнике GAZETTEER_FILE (GeoNames или CSV), без Nominatim и сети.
+    # Если ближайшая точка справочника дальше GAZETTEER_MAX_DISTANCE_KM, адрес считается ненайденным
+    GEOCODER_BACKEND: Literal['nominatim', 'offline'] = Field('nominatim')
+    GAZETTEER_FILE: str | None = Field(None)
+    GAZETTEER_MAX_DISTANCE_KM: float = Field(5.0)
+
+    # Проверка геолокации при начале смены по рабочим площадкам (python manage.py import-sites):
+    # off - не проверять, flag - принимать, но помечать смену вне площадок, reject - не давать начать смену
+    GEOFENCE_MODE: Literal['off', 'flag', 'reject'] = Field('off')
+    GEOFENCE_RELOAD_SECONDS: int = Field(60)
+
+    # Маршрут смены по трансляции геопозиции: точка сохраняется, если с предыдущей прошло не меньше
+    # TRACK_MIN_SECONDS и работник сместился на TRACK_MIN_METERS (или прошло TRACK_MAX_SECONDS).
+    # Точки копятся в памяти и пишутся в БД пачками раз в TRACK_FLUSH_SECONDS
+    TRACK_MIN_SECONDS: int = Field(10)
+    TRACK_MIN_METERS: float = Field(25.0)
+    TRACK_MAX_SECONDS: int = Field(300)
+    TRACK_FLUSH_SECONDS: float = Field(120.0)
+
+    # Счётчик "на смене / заработано" в сообщении о начале смены правится раз в TICKER_INTERVAL_SECONDS
+    # (0 - выключен). Всего не больше TICKER_EDITS_PER_SECOND правок в секунду: лимит Telegram - около 30 сообщений
+    TICKER_INTERVAL_SECONDS: int = Field(60)
+    TICKER_EDITS_PER_SECOND: float = Field(20.0)
+
+    # Автоматическое закрытие забытых смен: смена закрывается, когда длится дольше MAX_SHIFT_HOURS (0 - без лимита)
+    # или наступает время закрытия работника / площадки (python manage.py set-close-time). Проверка раз
+    # в SWEEP_INTERVAL_SECONDS (0 - выключена); из нескольких запущенных копий бота её выполняет одна
+    MAX_SHIFT_HOURS: float = Field(0)
+    SWEEP_INTERVAL_SECONDS: int = Field(60)
 
 
 settings = Settings()
@@ -25,10 +93,20 @@ settings = Settings()
 # Необязательно и редко используется в подобных проектах, но если брать в учёт, что бот может масштабироваться,
 # то почему бы и нет. По-моему, очень даже удобно для отслеживания полезных данных
 private_logger = logging.getLogger('LOCAL-PROJECT-PROCESS')  # Или любое другое название
+
+# Логгер только кладёт записи в очередь, а в консоль и файл их пишет отдельный поток: диск не блокирует event loop
+file_formatter = JsonFormatter() if settings.LOG_JSON else StructuredTextFormatter(TEXT_FORMAT)
 handler = logging.StreamHandler()
-file_handler = logging.FileHandler('private_logs.txt', encoding='utf-8')
-handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
-private_logger.addHandler(handler)
-private_logger.addHandler(file_handler)
+file_handler = CompressingRotatingFileHandler(settings.LOG_FILE, settings.LOG_MAX_BYTES,
+                                              settings.LOG_ROTATE_HOURS * 3600, settings.LOG_BACKUP_COUNT)
+handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+file_handler.setFormatter(file_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, handler, file_handler, respect_handler_level=True)
+log_listener.start()
+# При выходе дописываем всё, что осталось в очереди
+atexit.register(log_listener.stop)
+
+private_logger.addHandler(QueueHandler(log_queue))
 private_logger.propagate = False
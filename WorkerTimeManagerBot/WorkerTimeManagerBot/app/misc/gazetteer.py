@@ -0,0 +1,164 @@
+"""
+Офлайн-геокодер (GEOCODER_BACKEND=offline): ближайший адрес из локального справочника без обращения к Nominatim.
+
+Справочник (GAZETTEER_FILE, можно .gz):
+- GeoNames (*.txt, например cities500.txt или RU.txt): TSV без заголовка, берутся название, координаты и код страны;
+- CSV с заголовком (например, выгрузка адресов из OSM через osmium): столбцы lat/latitude, lon/longitude и
+  address/display_name/name.
+
+Точки хранятся в KD-дереве на массивах (array): координаты переводятся в единичные векторы на сфере, поэтому
+расстояния не искажаются у полюсов и на 180-м меридиане. Дерево неявное - узел диапазона [lo, hi) лежит в его
+середине, так что кроме трёх массивов координат и списка адресов памяти не требуется. Поиск ближайшей точки -
+десятки микросекунд даже на миллионах записей, поэтому выполняется прямо в event loop.
+"""
+
+import csv
+import gzip
+import math
+import threading
+from array import array
+
+from app.misc.config import settings, private_logger
+
+EARTH_RADIUS_KM = 6371.0088
+_LATITUDE_COLUMNS = ('lat', 'latitude')
+_LONGITUDE_COLUMNS = ('lon', 'lng', 'longitude')
+_ADDRESS_COLUMNS = ('address', 'display_name', 'name')
+
+
+def to_unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class Gazetteer:
+    def __init__(self, points: list[tuple[float, float, str]]):
+        """
+        :param points: Список (широта, долгота, адрес)
+        """
+        vectors = [to_unit_vector(lat, lon) for lat, lon, _ in points]
+        order = list(range(len(points)))
+        axes = ([v[0] for v in vectors], [v[1] for v in vectors], [v[2] for v in vectors])
+        self._build(order, axes)
+
+        # Точки переставлены в порядке дерева: узел диапазона [lo, hi) - элемент (lo + hi) // 2
+        self.coords = tuple(array('d', (axis[i] for i in order)) for axis in axes)
+        self.addresses = [points[i][2] for i in order]
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    @staticmethod
+    def _build(order: list[int], axes: tuple[list[float], ...]):
+        # Обход без рекурсии: диапазон сортируется по оси глубины, медиана становится узлом
+        stack = [(0, len(order), 0)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if hi - lo < 2:
+                continue
+            order[lo:hi] = sorted(order[lo:hi], key=axes[axis].__getitem__)
+            mid = (lo + hi) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((lo, mid, next_axis))
+            stack.append((mid + 1, hi, next_axis))
+
+    def nearest(self, latitude: float, longitude: float) -> tuple[str, float] | None:
+        """
+        Ближайшая точка справочника.
+        :return: (адрес, расстояние в км) или None, если справочник пуст
+        """
+        if not self.addresses:
+            return None
+        query = to_unit_vector(latitude, longitude)
+        qx, qy, qz = query
+        xs, ys, zs = self.coords
+        coords = self.coords
+
+        best_distance, best_index = math.inf, -1
+        # (lo, hi, ось, квадрат расстояния до разделяющей плоскости - нижняя граница для всего диапазона)
+        stack = [(0, len(self.addresses), 0, 0.0)]
+        while stack:
+            lo, hi, axis, bound = stack.pop()
+            if lo >= hi or bound >= best_distance:
+                continue
+            mid = (lo + hi) // 2
+            dx, dy, dz = xs[mid] - qx, ys[mid] - qy, zs[mid] - qz
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best_distance, best_index = distance, mid
+
+            diff = query[axis] - coords[axis][mid]
+            next_axis = (axis + 1) % 3
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # Дальняя половина проверяется позже и только если плоскость ближе лучшего найденного
+            stack.append((*far, next_axis, diff * diff))
+            stack.append((*near, next_axis, 0.0))
+
+        return self.addresses[best_index], chord_to_km(math.sqrt(best_distance))
+
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _read_geonames(file) -> list[tuple[float, float, str]]:
+    points = []
+    for row in csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE):
+        if len(row) < 9:
+            continue
+        # 1 - название, 4/5 - широта/долгота, 8 - код страны
+        name = f'{row[1]}, {row[8]}' if row[8] else row[1]
+        points.append((float(row[4]), float(row[5]), name))
+    return points
+
+
+def _read_csv(file) -> list[tuple[float, float, str]]:
+    reader = csv.DictReader(file)
+    columns = {name.lower(): name for name in reader.fieldnames or ()}
+
+    def column(candidates: tuple[str, ...]) -> str:
+        for candidate in candidates:
+            if candidate in columns:
+                return columns[candidate]
+        raise ValueError(f'В справочнике нет ни одного из столбцов: {", ".join(candidates)}')
+
+    lat, lon, address = column(_LATITUDE_COLUMNS), column(_LONGITUDE_COLUMNS), column(_ADDRESS_COLUMNS)
+    return [(float(row[lat]), float(row[lon]), row[address]) for row in reader if row[lat] and row[lon]]
+
+
+def load_gazetteer(path: str) -> Gazetteer:
+    with _open_text(path) as file:
+        is_csv = path.removesuffix('.gz').endswith('.csv')
+        points = _read_csv(file) if is_csv else _read_geonames(file)
+    return Gazetteer(points)
+
+
+_gazetteer: Gazetteer | None = None
+_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Справочник из GAZETTEER_FILE; загружается один раз (при запуске бота - заранее, см. main.py)."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                if not settings.GAZETTEER_FILE:
+                    raise RuntimeError('Для GEOCODER_BACKEND=offline необходимо указать GAZETTEER_FILE')
+                _gazetteer = load_gazetteer(settings.GAZETTEER_FILE)
+                private_logger.info(f'Справочник адресов {settings.GAZETTEER_FILE}: {len(_gazetteer)} точек')
+    return _gazetteer
+
+
+def reverse(latitude: float, longitude: float) -> str:
+    """Адрес ближайшей точки справочника, если она не дальше GAZETTEER_MAX_DISTANCE_KM."""
+    result = get_gazetteer().nearest(latitude, longitude)
+    if result is None or result[1] > settings.GAZETTEER_MAX_DISTANCE_KM:
+        return "Адрес не найден"
+    return result[0]
@@ -0,0 +1,186 @@
+"""
+Геозоны рабочих площадок (GEOFENCE_MODE): к какой площадке относится геолокация, присланная при начале смены.
+
+Площадка - многоугольник или круг (точка + радиус); радиус многоугольника - допустимое отклонение от его границы
+(точность GPS). Площадки загружаются из БД в индекс, который перечитывается раз в GEOFENCE_RELOAD_SECONDS
+(редактируются они через manage.py, то есть из другого процесса).
+
+Поиск:
+- сетка CELL_DEGREES x CELL_DEGREES: каждая площадка записана во все ячейки, которые задевает её прямоугольник
+  (с учётом радиуса), поэтому проверяются только площадки из ячейки точки;
+- прямоугольник площадки - дешёвый отсев оставшихся кандидатов;
+- точное попадание - в локальной проекции в метрах: чётность пересечений луча со сторонами многоугольника,
+  а снаружи - расстояние до ближайшей стороны.
+Вершины хранятся в array, поэтому и тысячи площадок помещаются в памяти компактно, а проверка занимает микросекунды.
+"""
+
+import math
+import time
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+
+from app.db import queries
+from app.misc.config import settings, private_logger
+
+CELL_DEGREES = 0.05  # ~5.5 км по широте
+METERS_PER_DEGREE = 111_320.0
+
+
+@dataclass(slots=True)
+class Site:
+    id: int
+    name: str
+    latitude: float  # Центр круга или опорная точка проекции многоугольника
+    longitude: float
+    radius_m: float
+    xs: array | None = None  # Вершины многоугольника в метрах относительно опорной точки
+    ys: array | None = None
+    bbox: tuple[float, float, float, float] = (0.0, 0.0, 0.0, 0.0)  # min/max широта, min/max долгота с радиусом
+
+    @classmethod
+    def from_model(cls, obj) -> 'Site':
+        site = cls(id=obj.id, name=obj.name, latitude=obj.latitude, longitude=obj.longitude, radius_m=obj.radius_m)
+        if obj.polygon:
+            site.xs = array('d', (site._x(lon) for _, lon in obj.polygon))
+            site.ys = array('d', (site._y(lat) for lat, _ in obj.polygon))
+            lats = [lat for lat, _ in obj.polygon]
+            lons = [lon for _, lon in obj.polygon]
+        else:
+            lats, lons = [obj.latitude], [obj.longitude]
+
+        margin_lat = site.radius_m / METERS_PER_DEGREE
+        margin_lon = margin_lat / max(math.cos(math.radians(site.latitude)), 1e-6)
+        site.bbox = (min(lats) - margin_lat, max(lats) + margin_lat, min(lons) - margin_lon, max(lons) + margin_lon)
+        return site
+
+    def _x(self, longitude: float) -> float:
+        return (longitude - self.longitude) * METERS_PER_DEGREE * math.cos(math.radians(self.latitude))
+
+    def _y(self, latitude: float) -> float:
+        return (latitude - self.latitude) * METERS_PER_DEGREE
+
+    def distance_m(self, latitude: float, longitude: float) -> float:
+        """Расстояние от точки до площадки в метрах (0 - внутри многоугольника)."""
+        x, y = self._x(longitude), self._y(latitude)
+        if self.xs is None:
+            return math.hypot(x, y)
+
+        xs, ys = self.xs, self.ys
+        inside = False
+        best = math.inf
+        j = len(xs) - 1
+        for i in range(len(xs)):
+            xi, yi, xj, yj = xs[i], ys[i], xs[j], ys[j]
+            if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+                inside = not inside
+            # Расстояние до стороны (j, i): проекция точки на отрезок
+            dx, dy = xi - xj, yi - yj
+            length = dx * dx + dy * dy
+            t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - xj) * dx + (y - yj) * dy) / length))
+            best = min(best, math.hypot(x - xj - t * dx, y - yj - t * dy))
+            j = i
+        return 0.0 if inside else best
+
+
+def _cell(latitude: float, longitude: float) -> tuple[int, int]:
+    return math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)
+
+
+class SiteIndex:
+    def __init__(self, sites: list[Site]):
+        self.sites = {site.id: site for site in sites}
+        self.cells: dict[tuple[int, int], list[Site]] = defaultdict(list)
+        for site in sites:
+            min_lat, max_lat, min_lon, max_lon = site.bbox
+            (row_from, col_from), (row_to, col_to) = _cell(min_lat, min_lon), _cell(max_lat, max_lon)
+            for row in range(row_from, row_to + 1):
+                for col in range(col_from, col_to + 1):
+                    self.cells[row, col].append(site)
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def match(self, latitude: float, longitude: float) -> Site | None:
+        """Площадка, в пределах которой (с учётом радиуса) находится точка; из нескольких - ближайшая."""
+        best, best_distance = None, math.inf
+        for site in self.cells.get(_cell(latitude, longitude), ()):
+            min_lat, max_lat, min_lon, max_lon = site.bbox
+            if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+                continue
+            distance = site.distance_m(latitude, longitude)
+            if distance <= site.radius_m and distance < best_distance:
+                best, best_distance = site, distance
+        return best
+
+
+_index = SiteIndex([])
+_loaded_at: float | None = None
+
+
+async def get_index() -> SiteIndex:
+    """Индекс площадок; перечитывается из БД не чаще раза в GEOFENCE_RELOAD_SECONDS."""
+    global _index, _loaded_at
+    if _loaded_at is None or time.monotonic() - _loaded_at > settings.GEOFENCE_RELOAD_SECONDS:
+        _index = SiteIndex([Site.from_model(obj) for obj in await queries.get_work_sites()])
+        _loaded_at = time.monotonic()
+    return _index
+
+
+def site_name(site_id: int | None) -> str | None:
+    site = _index.sites.get(site_id)
+    return site.name if site else None
+
+
+def is_on_site(latitude: float, longitude: float, site_id: int | None = None) -> bool:
+    """По уже загруженному индексу: точка внутри площадки site_id или, если она не задана, любой площадки."""
+    site = _index.sites.get(site_id)
+    if site is not None:
+        return site.distance_m(latitude, longitude) <= site.radius_m
+    return _index.match(latitude, longitude) is not None
+
+
+async def check_location(latitude: float, longitude: float) -> tuple[int | None, bool]:
+    """
+    Проверка геолокации при начале смены.
+    :return: (ID площадки, вне ли площадок). Если режим выключен или площадок нет, проверка не выполняется
+    """
+    if settings.GEOFENCE_MODE == 'off':
+        return None, False
+
+    index = await get_index()
+    if not index:
+        private_logger.warning('GEOFENCE_MODE включён, но ни одной рабочей площадки не задано: проверка пропущена')
+        return None, False
+
+    site = index.match(latitude, longitude)
+    return (site.id, False) if site else (None, True)
+
+
+def sites_from_geojson(data: dict, default_radius_m: float) -> list[dict]:
+    """
+    Площадки из GeoJSON FeatureCollection: Polygon (внешний контур) или Point (круг).
+    Свойства: name - название, radius - радиус / допуск в метрах (по умолчанию default_radius_m).
+    :return: Поля для models.WorkSite
+    """
+    sites = []
+    for number, feature in enumerate(data.get('features', ()), start=1):
+        geometry, properties = feature['geometry'], feature.get('properties') or {}
+        name = properties.get('name') or f'Площадка {number}'
+        radius = float(properties.get('radius', default_radius_m))
+
+        if geometry['type'] == 'Point':
+            lon, lat = geometry['coordinates'][:2]
+            sites.append(dict(name=name, latitude=lat, longitude=lon, radius_m=radius, polygon=None))
+        elif geometry['type'] == 'Polygon':
+            # В GeoJSON порядок (долгота, широта), последняя вершина повторяет первую
+            ring = [[lat, lon] for lon, lat, *_ in geometry['coordinates'][0]]
+            if ring[0] == ring[-1]:
+                ring.pop()
+            if len(ring) < 3:
+                raise ValueError(f'У площадки "{name}" меньше трёх вершин')
+            sites.append(dict(name=name, latitude=sum(lat for lat, _ in ring) / len(ring),
+                              longitude=sum(lon for _, lon in ring) / len(ring), radius_m=radius, polygon=ring))
+        else:
+            raise ValueError(f'Тип геометрии {geometry["type"]} не поддерживается (площадка "{name}")')
+    return sites
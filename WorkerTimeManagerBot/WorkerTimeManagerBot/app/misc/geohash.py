@@ -0,0 +1,82 @@
+"""
+Geohash для поиска сессий рядом с точкой (WorkSession.geohash).
+
+Geohash - строка, у которой каждый следующий символ делит ячейку ещё на 32 части, поэтому все точки ячейки
+с префиксом p образуют непрерывный диапазон строк [p, p + '{'), который читается по обычному индексу.
+Поиск в радиусе: круг накрывается несколькими ячейками подходящего размера (cover), сессии из этих диапазонов
+проверяются точно по формуле гаверсинусов.
+"""
+
+import math
+
+ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ~5 x 5 м: точнее, чем геолокация телефона
+RANGE_END = '{'  # Следующий за 'z' символ ASCII: верхняя граница диапазона префикса
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bits, is_lon = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if is_lon else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        is_lon = not is_lon
+        bits += 1
+        if bits == 5:
+            chars.append(ALPHABET[value])
+            value, bits = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Размер ячейки (по широте, по долготе) в градусах."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover(latitude: float, longitude: float, radius_km: float) -> list[str]:
+    """
+    Префиксы ячеек, которые вместе накрывают круг: самые мелкие ячейки, которых нужно не больше MAX_COVER_CELLS.
+    """
+    angle = min(math.pi, radius_km / EARTH_RADIUS_KM)
+    d_lat = math.degrees(angle)
+    min_lat, max_lat = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+    cos_lat = math.cos(math.radians(latitude))
+    if min_lat == -90 or max_lat == 90 or math.sin(angle) >= cos_lat:
+        # Круг накрывает полюс: подходят все долготы
+        min_lon, max_lon = -180.0, 180.0
+    else:
+        d_lon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+        min_lon, max_lon = longitude - d_lon, longitude + d_lon
+
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols <= MAX_COVER_CELLS or precision == 1:
+            break
+
+    cells = set()
+    for row in range(rows):
+        lat = min(max_lat, (math.floor(min_lat / height) + row + 0.5) * height)
+        for col in range(cols):
+            lon = (math.floor(min_lon / width) + col + 0.5) * width
+            # Переход через 180-й меридиан
+            cells.add(encode(max(-90.0, lat), (lon + 180) % 360 - 180, precision))
+    return sorted(cells)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,100 @@
+"""
+Проверки для разработки и тестов (GUARD_MODE = warn / raise): N+1 запросы и блокирующие вызовы в обработчиках.
+
+- Лимиты на апдейт: если обработка одного апдейта сделала больше GUARD_MAX_QUERIES запросов к БД или
+  GUARD_MAX_API_CALLS вызовов Bot API, пишется предупреждение (или бросается BudgetExceeded) со списком мест вызова.
+- Задержка event loop: отдельный поток следит за "пульсом" из event loop. Если пульс пропал дольше, чем на
+  GUARD_LOOP_LAG_SECONDS, значит, что-то выполняется синхронно, не отдавая управление: поток снимает стек
+  главного потока и записывает, в каком обработчике и на какой строке это произошло.
+
+Счётчики берутся из UpdateTimer (app.misc.metrics), поэтому GuardMiddleware работает только вместе с
+MetricsMiddleware.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from app.misc import metrics
+from app.misc.config import settings, private_logger
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class LoopLag:
+    seconds: float
+    stack: tuple[str, ...]  # Кадры кода приложения, от внешнего к внутреннему
+
+
+class LoopLagWatchdog:
+    def __init__(self, threshold: float, interval: float = 0.02):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports: list[LoopLag] = []
+        self._beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stopped = threading.Event()
+        self._heartbeat_task: asyncio.Task | None = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval
+            # Об одной блокировке сообщаем один раз, стек снимаем, пока она ещё продолжается
+            if lag < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            report = LoopLag(lag, tuple(metrics.app_frames(frame, limit=5)))
+            self.reports.append(report)
+            private_logger.warning(f'Event loop заблокирован дольше {lag * 1000:.0f} мс: '
+                                   f'{" → ".join(report.stack) or "вне кода приложения"}')
+
+    def start(self):
+        """Запускать изнутри работающего event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+
+watchdog = LoopLagWatchdog(settings.GUARD_LOOP_LAG_SECONDS)
+
+
+def _format_sites(call_sites: Counter, phase: str) -> str:
+    sites = [(site, count) for (site_phase, site), count in call_sites.most_common() if site_phase == phase]
+    return '\n'.join(f'  {count} x {site}' for site, count in sites)
+
+
+def check_update(timer: metrics.UpdateTimer, lags: list[LoopLag]) -> list[str]:
+    """Нарушения лимитов за апдейт (пустой список - всё в порядке)."""
+    problems = []
+    queries = timer.phases.get('db', (0,))[0]
+    api_calls = timer.phases.get('bot_api', (0,))[0]
+
+    if queries > settings.GUARD_MAX_QUERIES:
+        problems.append(f'{queries} запросов к БД (лимит {settings.GUARD_MAX_QUERIES}):\n'
+                        f'{_format_sites(timer.call_sites, "db")}')
+    if api_calls > settings.GUARD_MAX_API_CALLS:
+        problems.append(f'{api_calls} вызовов Bot API (лимит {settings.GUARD_MAX_API_CALLS}):\n'
+                        f'{_format_sites(timer.call_sites, "bot_api")}')
+    for lag in lags:
+        problems.append(f'event loop заблокирован на {lag.seconds * 1000:.0f}+ мс:\n  {" → ".join(lag.stack)}')
+    return problems
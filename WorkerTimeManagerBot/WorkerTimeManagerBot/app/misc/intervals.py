@@ -0,0 +1,73 @@
+"""
+Интервалы [начало, конец) в памяти: дерево для поиска пересечений и проход "заметающей прямой" по отсортированным.
+
+Используются для проверки массовых правок времени сессий (app.db.overlaps) и сверки со сменами по плану.
+Конец None - интервал не закончен (например, идущая смена) и длится бесконечно.
+"""
+
+from datetime import datetime
+from typing import Generic, Hashable, Iterable, TypeVar
+
+Key = TypeVar('Key', bound=Hashable)
+
+OPEN_END = datetime.max
+
+
+class IntervalTree(Generic[Key]):
+    """
+    Статическое дерево интервалов: интервалы отсортированы по началу, а неявное сбалансированное дерево поверх
+    массива (корень отрезка - его середина) хранит максимальный конец в каждом поддереве. Построение - O(n log n),
+    поиск пересечений - O(log n + k), где k - количество найденных.
+    """
+
+    def __init__(self, intervals: Iterable[tuple[datetime, datetime | None, Key]]):
+        self._items = sorted(((start, end or OPEN_END, key) for start, end, key in intervals), key=lambda item: item[0])
+        self._max_end: list[datetime] = [OPEN_END] * len(self._items)
+        self._build(0, len(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _build(self, lo: int, hi: int) -> datetime | None:
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        ends = [self._items[mid][1], self._build(lo, mid), self._build(mid + 1, hi)]
+        self._max_end[mid] = max(end for end in ends if end is not None)
+        return self._max_end[mid]
+
+    def overlaps(self, start: datetime, end: datetime | None) -> list[Key]:
+        """Ключи интервалов, пересекающихся с [start, end) (касание концами - не пересечение)."""
+        end = end or OPEN_END
+        found, stack = [], [(0, len(self._items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue  # В поддереве всё закончилось до start
+            stack.append((lo, mid))
+            item_start, item_end, key = self._items[mid]
+            if item_start < end:
+                if item_end > start:
+                    found.append(key)
+                stack.append((mid + 1, hi))  # Правее начала только позже, имеет смысл, пока они раньше end
+        return found
+
+
+def sweep_overlaps(intervals: Iterable[tuple[datetime, datetime | None, Key]]) -> list[tuple[Key, Key]]:
+    """
+    Пересечения в одном проходе по интервалам, отсортированным по началу: каждый интервал сравнивается с тем из
+    предыдущих, что заканчивается позже всех. Вместе с сортировкой - O(n log n).
+    :return: [(ключ интервала, ключ более раннего интервала, с которым он пересекается)]
+    """
+    found = []
+    reach_end, reach_key = None, None
+    for start, end, key in intervals:
+        end = end or OPEN_END
+        if reach_end is not None and start < reach_end:
+            found.append((key, reach_key))
+        if reach_end is None or end > reach_end:
+            reach_end, reach_key = end, key
+    return found
@@ -0,0 +1,113 @@
+"""
+Живые агрегаты для дашборда администратора.
+
+Заполняются из БД один раз при запуске (seed), а дальше обновляются по событиям изменения сессий
+(app.db.signals), поэтому построение дашборда не делает ни одного запроса к БД.
+"""
+
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import datetime, date, timedelta, UTC
+
+from app.db import queries, rollups, signals
+from app.db.facts import SessionFacts
+from app.misc.config import private_logger
+
+LONGEST_SESSIONS_LIMIT = 5
+
+
+@dataclass(frozen=True, slots=True)
+class DashboardSnapshot:
+    active_workers: int
+    worked_seconds_today: int
+    earned_kopecks_today: int
+    projected_kopecks_today: int
+    longest_sessions: tuple[tuple[SessionFacts, int], ...]  # (сессия, сколько секунд уже идёт)
+
+
+class LiveStats:
+    def __init__(self):
+        self.active: dict[int, SessionFacts] = {}
+        # Итоги только по завершённым сессиям: локальная дата -> [секунды, ставка * секунды]
+        self.closed_by_day: dict[date, list[int]] = defaultdict(lambda: [0, 0])
+        self.seeded = False
+
+    async def seed(self):
+        """Единственное обращение к БД: активные сессии и сегодняшние итоги из rollup-таблицы."""
+        today = self._local_now().date()
+
+        active = await queries.attach_rate_changes([SessionFacts.from_model(obj)
+                                                    for obj in await queries.get_active_sessions()])
+        self.active = {facts.id: facts for facts in active}
+        self.closed_by_day.clear()
+        for day, seconds, kopecks in await queries.get_worked_time_by_days(today, today):
+            self.closed_by_day[day] = [seconds, kopecks * 3600]
+
+        self.seeded = True
+        private_logger.info(f'Дашборд инициализирован: активных сессий {len(self.active)}')
+
+    def on_session_changed(self, old: SessionFacts | None, new: SessionFacts | None):
+        if not self.seeded:
+            return
+
+        # Завершённые сессии уже учтены в rollup-итогах на момент seed, поэтому применяем такую же разницу
+        for facts, sign in ((old, -1), (new, 1)):
+            for (_, day), (seconds, kopeck_seconds) in rollups.session_contribution(facts)[1].items():
+                totals = self.closed_by_day[day]
+                totals[0] += sign * seconds
+                totals[1] += sign * kopeck_seconds
+
+        if old is not None:
+            self.active.pop(old.id, None)
+        if new is not None and not new.is_ended:
+            if new.telegram_id is None and old is not None:
+                new = replace(new, telegram_id=old.telegram_id)
+            self.active[new.id] = new
+
+        self._prune()
+
+    def snapshot(self) -> DashboardSnapshot:
+        now = datetime.now(UTC).replace(tzinfo=None)
+        offset = rollups.local_offset()
+        today = (now + offset).date()
+        day_start = datetime.combine(today, datetime.min.time()) - offset
+        day_end = day_start + timedelta(days=1)
+
+        closed_seconds, closed_kopeck_seconds = self.closed_by_day.get(today, (0, 0))
+        worked_seconds, kopeck_seconds, remaining_kopeck_seconds = closed_seconds, closed_kopeck_seconds, 0
+
+        for facts in self.active.values():
+            # По частям со своей ставкой, если ставка работника менялась посреди смены (как в отчёте и итогах)
+            segments = facts.rate_segments(now)
+            for start, end, rate in segments:
+                seconds = int((end - max(start, day_start)).total_seconds())
+                if seconds > 0:
+                    worked_seconds += seconds
+                    kopeck_seconds += seconds * (rate or 0)
+            # Прогноз: активные смены продолжаются до конца суток по ставке, действующей сейчас
+            remaining_kopeck_seconds += int((day_end - now).total_seconds()) * (segments[-1][2] or 0)
+
+        longest = heapq.nsmallest(LONGEST_SESSIONS_LIMIT, self.active.values(), key=lambda facts: facts.started_at)
+
+        return DashboardSnapshot(
+            active_workers=len({facts.user_id for facts in self.active.values()}),
+            worked_seconds_today=worked_seconds,
+            earned_kopecks_today=kopeck_seconds // 3600,
+            projected_kopecks_today=(kopeck_seconds + remaining_kopeck_seconds) // 3600,
+            longest_sessions=tuple((facts, int((now - facts.started_at).total_seconds())) for facts in longest),
+        )
+
+    def _prune(self):
+        # Старые дни на дашборде не показываются, храним только вчера / сегодня / будущие
+        yesterday = self._local_now().date() - timedelta(days=1)
+        for day in [day for day in self.closed_by_day if day < yesterday]:
+            del self.closed_by_day[day]
+
+    @staticmethod
+    def _local_now() -> datetime:
+        return datetime.now(UTC) + rollups.local_offset()
+
+
+live_stats = LiveStats()
+signals.subscribe(live_stats.on_session_changed)
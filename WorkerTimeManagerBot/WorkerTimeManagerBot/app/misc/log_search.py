@@ -0,0 +1,264 @@
+"""
+Выборка записей из private_logger по фильтру (время, уровень, работник, сессия) без чтения логов целиком.
+
+Для каждого файла (текущего и сжатых архивов после ротации) строится разреженный индекс смещений: время записи
+примерно через каждые INDEX_STEP байт. Поиск по времени - бинарный по индексу, после чего файл читается только
+с найденного смещения и до первой записи позже конца диапазона. Архивы, которые целиком не попадают в диапазон,
+отбрасываются по времени ротации из имени файла и даже не открываются. Индекс текущего файла дописывается
+по мере роста файла, индексы архивов строятся один раз (архивы не меняются).
+
+Результат пишется в gzip во временный файл, который затем отправляется документом прямо с диска.
+"""
+
+import bisect
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, UTC
+from typing import IO, Iterator
+
+from app.misc.config import settings, file_handler
+from app.misc.logs import CompressingRotatingFileHandler
+
+INDEX_STEP = 64 * 1024  # Через сколько байт добавлять точку в индекс
+
+_TEXT_TIME = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - (\w+) - ')
+_JSON_TIME = re.compile(rb'^\{"time": "([^"]+)", "level": "(\w+)"')
+_TEXT_FIELDS = re.compile(r' \[((?:\w+=\S+ ?)+)\]$')
+_ARCHIVE_STAMP = re.compile(r'\.(\d{8}T\d{6})(?:-\d+)?\.gz$')
+
+
+@dataclass(frozen=True, slots=True)
+class LogFilter:
+    """Границы времени - в UTC, без tzinfo. None - без ограничения."""
+    since: datetime | None = None
+    until: datetime | None = None
+    min_level: int = logging.NOTSET
+    worker: int | None = None
+    session_id: int | None = None
+
+
+class LogFilterError(ValueError):
+    pass
+
+
+def parse_filter(text: str) -> LogFilter:
+    """
+    Разбор фильтра из сообщения администратора, например:
+    "с=2026-10-01 по=2026-10-02T18:00 уровень=ERROR работник=123456 сессия=15".
+    Даты указываются в локальном времени (UTC_OFFSET_HOURS), "-" или пустая строка - без фильтра.
+    :raise LogFilterError: если фильтр не удалось разобрать
+    """
+    keys = {'с': 'since', 'по': 'until', 'уровень': 'min_level', 'работник': 'worker', 'сессия': 'session_id',
+            'since': 'since', 'until': 'until', 'level': 'min_level', 'worker': 'worker', 'session': 'session_id'}
+    values = {}
+    text = text.strip()
+    for token in ([] if text in ('', '-') else text.split()):
+        key, sep, value = token.partition('=')
+        if not sep or key.lower() not in keys:
+            raise LogFilterError(f'Непонятный параметр: {token}')
+        name = keys[key.lower()]
+
+        if name in ('since', 'until'):
+            try:
+                moment = datetime.fromisoformat(value)
+            except ValueError:
+                raise LogFilterError(f'Неверная дата: {value}')
+            # Дата без времени в "по=" означает весь этот день
+            if name == 'until' and 'T' not in value and ' ' not in value:
+                moment += timedelta(days=1)
+            values[name] = moment - timedelta(hours=settings.UTC_OFFSET_HOURS)
+        elif name == 'min_level':
+            level = logging.getLevelName(value.upper())
+            if not isinstance(level, int):
+                raise LogFilterError(f'Неизвестный уровень: {value}')
+            values[name] = level
+        else:
+            if not value.isdigit():
+                raise LogFilterError(f'Ожидалось число: {token}')
+            values[name] = int(value)
+
+    return LogFilter(**values)
+
+
+@dataclass(slots=True)
+class _FileIndex:
+    # Отсортированные по времени точки (время записи в секундах UTC, смещение начала записи)
+    times: list[float] = field(default_factory=list)
+    offsets: list[int] = field(default_factory=list)
+    indexed_upto: int = 0  # До какого смещения файл уже просмотрен
+    identity: tuple = ()  # Для архивов (mtime, size): если файл подменили, индекс строится заново
+
+
+def _record_time(line: bytes) -> float | None:
+    """Время начала записи в секундах UTC или None, если строка - продолжение предыдущей (трейсбек)."""
+    if match := _JSON_TIME.match(line):
+        return datetime.fromisoformat(match.group(1).decode()).timestamp()
+    if match := _TEXT_TIME.match(line):
+        # asctime пишется в локальном времени процесса
+        moment = datetime.strptime(match.group(1).decode(), '%Y-%m-%d %H:%M:%S')
+        return moment.timestamp() + int(match.group(2)) / 1000
+    return None
+
+
+class LogIndex:
+    def __init__(self, handler: CompressingRotatingFileHandler):
+        self.handler = handler
+        self._indexes: dict[str, _FileIndex] = {}
+        # Поиск выполняется в потоках (asyncio.to_thread), индексы общие
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _open(path: str) -> IO[bytes]:
+        return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+    def _index(self, path: str) -> _FileIndex:
+        stat = os.stat(path)
+        index = self._indexes.get(path)
+        is_archive = path.endswith('.gz')
+
+        if index is None or (is_archive and index.identity != (stat.st_mtime, stat.st_size)) \
+                or (not is_archive and stat.st_size < index.indexed_upto):
+            # Новый файл, подменённый архив или текущий файл после ротации
+            index = self._indexes[path] = _FileIndex(identity=(stat.st_mtime, stat.st_size))
+        elif is_archive or stat.st_size == index.indexed_upto:
+            return index
+
+        with self._open(path) as file:
+            file.seek(index.indexed_upto)
+            offset = index.indexed_upto
+            last_point = index.offsets[-1] if index.offsets else -INDEX_STEP
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break  # Запись ещё дописывается, проиндексируем в следующий раз
+                if offset - last_point >= INDEX_STEP and (moment := _record_time(line)) is not None:
+                    index.times.append(max(moment, index.times[-1]) if index.times else moment)
+                    index.offsets.append(offset)
+                    last_point = offset
+                offset += len(line)
+            index.indexed_upto = offset
+
+        return index
+
+    def _candidates(self, log_filter: LogFilter) -> list[str]:
+        """Файлы, которые могут содержать записи из диапазона: архивы отбрасываются по времени ротации из имени."""
+        since = log_filter.since.replace(tzinfo=UTC).timestamp() if log_filter.since else None
+        until = log_filter.until.replace(tzinfo=UTC).timestamp() if log_filter.until else None
+
+        files, previous_rotation = [], None
+        for path in self.handler.archives():
+            match = _ARCHIVE_STAMP.search(path)
+            rotated_at = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S').replace(tzinfo=UTC).timestamp() \
+                if match else None
+            # Архив содержит записи между предыдущей ротацией и своей (время в имени округлено вниз до секунды)
+            if not (since is not None and rotated_at is not None and rotated_at + 1 < since) \
+                    and not (until is not None and previous_rotation is not None and previous_rotation > until):
+                files.append(path)
+            previous_rotation = rotated_at
+
+        if os.path.exists(self.handler.baseFilename) \
+                and not (until is not None and previous_rotation is not None and previous_rotation > until):
+            files.append(self.handler.baseFilename)
+        return files
+
+    def _records(self, path: str, since: float | None) -> Iterator[tuple[float, list[bytes]]]:
+        """Записи файла (время, строки записи), начиная с ближайшей точки индекса перед since."""
+        index = self._index(path)
+        start = 0
+        if since is not None and index.times:
+            position = bisect.bisect_left(index.times, since) - 1
+            start = index.offsets[position] if position >= 0 else 0
+
+        with self._open(path) as file:
+            file.seek(start)
+            moment, lines = None, []
+            for line in file:
+                if (line_time := _record_time(line)) is not None:
+                    if lines and moment is not None:
+                        yield moment, lines
+                    moment, lines = line_time, [line]
+                elif lines:
+                    lines.append(line)
+            if lines and moment is not None:
+                yield moment, lines
+
+    @staticmethod
+    def _matches(lines: list[bytes], log_filter: LogFilter) -> bool:
+        first = lines[0].decode(errors='replace').rstrip('\n')
+
+        if first.startswith('{'):
+            try:
+                data = json.loads(first)
+            except ValueError:
+                return False
+            level = logging.getLevelName(data.get('level', ''))
+            fields = data
+            message = data.get('message', '')
+        else:
+            level = logging.getLevelName(first.split(' - ', 2)[1])
+            match = _TEXT_FIELDS.search(first)
+            fields = dict(item.split('=', 1) for item in match.group(1).split()) if match else {}
+            message = first
+
+        if log_filter.min_level and (not isinstance(level, int) or level < log_filter.min_level):
+            return False
+
+        if log_filter.worker is not None:
+            if fields:
+                if str(log_filter.worker) not in (str(fields.get('worker')), str(fields.get('actor'))):
+                    return False
+            elif not re.search(rf'(?<!\d){log_filter.worker}(?!\d)', message):
+                return False
+
+        if log_filter.session_id is not None:
+            if fields:
+                if str(fields.get('session_id')) != str(log_filter.session_id):
+                    return False
+            # Старые записи без структурных полей: ищем "ID<номер>" в тексте
+            elif not re.search(rf'ID{log_filter.session_id}(?!\d)', message):
+                return False
+
+        return True
+
+    def search(self, log_filter: LogFilter, out: IO[bytes]) -> int:
+        """
+        Записывает подходящие записи в out.
+        :return: количество найденных записей
+        """
+        since = log_filter.since.replace(tzinfo=UTC).timestamp() if log_filter.since else None
+        until = log_filter.until.replace(tzinfo=UTC).timestamp() if log_filter.until else None
+
+        found = 0
+        for path in self._candidates(log_filter):
+            for moment, lines in self._records(path, since):
+                if until is not None and moment > until:
+                    break
+                if since is not None and moment < since:
+                    continue
+                if self._matches(lines, log_filter):
+                    out.writelines(lines)
+                    found += 1
+
+        return found
+
+    def export(self, log_filter: LogFilter) -> tuple[str | None, int]:
+        """
+        Выборка в сжатый временный файл. Файл удаляет вызывающий.
+        :return: (путь к .gz или None, если ничего не найдено, количество записей)
+        """
+        fd, path = tempfile.mkstemp(prefix='logs-', suffix='.txt.gz')
+        with self._lock, os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            found = self.search(log_filter, out)
+
+        if not found:
+            os.remove(path)
+            return None, 0
+        return path, found
+
+
+log_index = LogIndex(file_handler)
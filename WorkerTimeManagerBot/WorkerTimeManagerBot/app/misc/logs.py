@@ -0,0 +1,116 @@
+"""
+Обработчики и форматтеры для private_logger.
+
+Сам логгер пишет только в очередь (QueueHandler), а в файл и консоль записи уходят из отдельного потока
+(QueueListener), поэтому event loop бота не ждёт диска. Файл ротируется по размеру и по времени, архивы сжимаются.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, UTC
+from logging.handlers import BaseRotatingHandler
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# Поля, которые можно передать через extra={...} и которые попадут в JSON отдельными ключами
+STRUCTURED_FIELDS = ('actor', 'worker', 'session_id', 'action')
+
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """
+    Ротация по размеру или по времени (что наступит раньше). Старый файл сжимается в
+    <имя>.<время ротации в UTC>.gz, хранится не больше backup_count архивов.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, interval_seconds: int, backup_count: int,
+                 encoding: str = 'utf-8'):
+        super().__init__(filename, 'a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.backup_count = backup_count
+        self.rollover_at = self._compute_rollover()
+
+    def _compute_rollover(self) -> float:
+        # Текущий файл начат в момент последней ротации: отсчитываем от неё, чтобы перезапуски бота не откладывали
+        # ротацию бесконечно
+        archives = self.archives()
+        started = os.path.getmtime(archives[-1]) if archives else time.time()
+        return started + self.interval_seconds
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval_seconds and time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes and self.stream is not None:
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def archive_name(self) -> str:
+        stamp = datetime.now(UTC).strftime('%Y%m%dT%H%M%S')
+        name, counter = f'{self.baseFilename}.{stamp}.gz', 1
+        while os.path.exists(name):
+            name, counter = f'{self.baseFilename}.{stamp}-{counter}.gz', counter + 1
+        return name
+
+    def archives(self) -> list[str]:
+        """Архивы от старых к новым: по времени ротации из имени, затем по счётчику (ротации в одну секунду)."""
+        def order(path: str) -> tuple[str, int]:
+            stamp, _, counter = path[len(self.baseFilename) + 1:-len('.gz')].partition('-')
+            return stamp, int(counter) if counter.isdigit() else 0
+
+        return sorted(glob.glob(f'{glob.escape(self.baseFilename)}.*.gz'), key=order)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            with open(self.baseFilename, 'rb') as source, gzip.open(self.archive_name(), 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.baseFilename)
+
+        if self.backup_count:
+            for path in self.archives()[:-self.backup_count]:
+                os.remove(path)
+
+        self.stream = self._open()
+        self.rollover_at = time.time() + self.interval_seconds
+
+
+class StructuredTextFormatter(logging.Formatter):
+    """Обычная текстовая строка, к которой дописываются структурные поля из extra: [actor=1 session_id=5]."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = ' '.join(f'{field}={getattr(record, field)}' for field in STRUCTURED_FIELDS
+                          if getattr(record, field, None) is not None)
+        if not fields:
+            return text
+        # Трейсбек (если есть) остаётся последним, поля дописываем к первой строке
+        first_line, newline, rest = text.partition('\n')
+        return f'{first_line} [{fields}]{newline}{rest}'
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна JSON-строка; структурные поля из extra выносятся в отдельные ключи."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(data, ensure_ascii=False)
@@ -0,0 +1,90 @@
+"""
+Кэш "отпечатков" уже отправленных сообщений, чтобы не делать лишних edit_text.
+
+Для каждого сообщения (chat_id, message_id) храним хэш последнего текста и клавиатуры, а также ключ данных,
+из которых они были построены (например, страница + версия данных). Если ключ совпадает, обработчик может не
+строить клавиатуру заново, а если совпадает хэш - не вызывать Bot API вовсе (и не ловить "message is not modified").
+Несколько правок одного и того же сообщения, пришедших во время отправки, схлопываются в одну - последнюю.
+"""
+
+import hashlib
+from typing import Hashable
+
+import cachetools
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardMarkup
+
+from app.db import signals
+
+
+def fingerprint(text: str, reply_markup: InlineKeyboardMarkup | None = None) -> bytes:
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if reply_markup is not None:
+        digest.update(reply_markup.model_dump_json(exclude_none=True).encode())
+    return digest.digest()
+
+
+class RenderedMessageCache:
+    def __init__(self, maxsize: int = 10_000):
+        # (chat_id, message_id) -> (ключ исходных данных, отпечаток текста и клавиатуры)
+        self._entries = cachetools.LRUCache(maxsize=maxsize)
+        self._pending: dict[tuple[int, int], tuple] = {}
+        self._in_flight: set[tuple[int, int]] = set()
+        # Растёт при любом изменении сессий: ключи, построенные на старых данных, перестают совпадать
+        self.data_version = 0
+
+    @staticmethod
+    def _key(message: Message) -> tuple[int, int]:
+        return message.chat.id, message.message_id
+
+    def bump_version(self, *_):
+        self.data_version += 1
+
+    def is_fresh(self, message: Message, source_key: Hashable) -> bool:
+        """Сообщение уже показывает данные, построенные по source_key: пересобирать текст и клавиатуру не нужно."""
+        entry = self._entries.get(self._key(message))
+        return entry is not None and entry[0] == source_key
+
+    def forget(self, message: Message):
+        self._entries.pop(self._key(message), None)
+
+    async def edit_text(self, message: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None,
+                        source_key: Hashable = None) -> bool:
+        """
+        Редактирует сообщение, только если текст или клавиатура действительно изменились.
+        :return: True, если правка отправлена (или поставлена в очередь), False - если она не нужна
+        """
+        key = self._key(message)
+        digest = fingerprint(text, reply_markup)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] == digest:
+            self._entries[key] = (source_key, digest)
+            return False
+
+        if key in self._in_flight:
+            # Сообщение прямо сейчас редактируется: запоминаем только последнюю версию, её отправит текущий вызов
+            self._pending[key] = (text, reply_markup, source_key, digest)
+            return True
+
+        self._in_flight.add(key)
+        try:
+            while True:
+                try:
+                    await message.edit_text(text=text, reply_markup=reply_markup)
+                except TelegramBadRequest as e:
+                    if 'message is not modified' not in str(e):
+                        raise
+                self._entries[key] = (source_key, digest)
+
+                pending = self._pending.pop(key, None)
+                if pending is None or pending[3] == digest:
+                    return True
+                text, reply_markup, source_key, digest = pending
+        finally:
+            self._in_flight.discard(key)
+            self._pending.pop(key, None)
+
+
+rendered_messages = RenderedMessageCache()
+signals.subscribe(rendered_messages.bump_version)
@@ -0,0 +1,190 @@
+"""
+Метрики бота в формате Prometheus и разбивка времени обработки апдейта по фазам.
+
+На каждый апдейт middleware заводит UpdateTimer (через contextvar), в который всё, что выполняется внутри обработки
+(запросы к БД, вызовы Bot API, геокодер), дописывает своё время. По завершении апдейта время обработчика и
+число запросов попадают в гистограммы, а слишком долгие апдейты пишутся в лог с разбивкой по фазам.
+
+Метрики отдаются по HTTP на METRICS_HOST:METRICS_PORT (/metrics), по умолчанию только на localhost.
+"""
+
+import bisect
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+try:
+    import greenlet
+except ImportError:  # Без greenlet нет и async-движка SQLAlchemy, но модуль метрик от него не зависит
+    greenlet = None
+
+from app.misc.config import settings, private_logger
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # Значения меток -> [счётчики по корзинам (не накопительные), сумма, количество]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _labels(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                bucket_label = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{self._labels(labels, bucket_label)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(labels)} {total}')
+            lines.append(f'{self.name}_count{self._labels(labels)} {count}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+update_duration = Histogram('bot_update_duration_seconds', 'Время обработки апдейта', ('handler',))
+update_db_queries = Histogram('bot_update_db_queries', 'Количество запросов к БД за апдейт', ('handler',),
+                              COUNT_BUCKETS)
+db_query_duration = Histogram('bot_db_query_duration_seconds', 'Время выполнения запроса к БД', ('statement',))
+bot_api_duration = Histogram('bot_api_request_duration_seconds', 'Время запроса к Bot API', ('method',))
+geocoder_duration = Histogram('bot_geocoder_duration_seconds', 'Время запроса к геокодеру')
+
+REGISTRY = (update_duration, update_db_queries, db_query_duration, bot_api_duration, geocoder_duration)
+
+
+@dataclass(slots=True)
+class UpdateTimer:
+    started: float = field(default_factory=time.perf_counter)
+    handler: str = 'unhandled'
+    # Фаза (db, bot_api, geocoder) -> [количество, секунды]
+    phases: dict[str, list] = field(default_factory=dict)
+    # (фаза, место вызова) -> количество; собирается, только если включено (см. app.misc.guard)
+    call_sites: Counter | None = None
+
+    def add(self, phase: str, seconds: float):
+        totals = self.phases.setdefault(phase, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        if self.call_sites is not None:
+            self.call_sites[phase, call_site()] += 1
+
+    def breakdown(self, total: float) -> str:
+        parts = [f'{phase}: {count} шт. / {seconds * 1000:.0f} мс' for phase, (count, seconds) in self.phases.items()]
+        other = total - sum(seconds for _, seconds in self.phases.values())
+        parts.append(f'прочее: {other * 1000:.0f} мс')
+        return ', '.join(parts)
+
+
+current_update: ContextVar[UpdateTimer | None] = ContextVar('current_update', default=None)
+
+
+def set_handler(callback) -> None:
+    """Отмечает выбранный обработчик в текущем UpdateTimer (метка 'модуль.функция' для гистограмм)."""
+    timer = current_update.get()
+    if timer is not None:
+        timer.handler = f'{callback.__module__.rsplit(".", 1)[-1]}.{callback.__name__}'
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Служебные модули, которые сами вызываются из инструментирования и не интересны как место вызова
+_SKIPPED_FILES = {os.path.join(_APP_DIR, *parts) for parts in (('misc', 'metrics.py'), ('misc', 'guard.py'),
+                                                                ('misc', 'middlewares.py'), ('db', 'models.py'))}
+
+
+def app_frames(frame, limit: int = 3) -> list[str]:
+    """Кадры стека из кода приложения (от внешнего к внутреннему), например 'handlers/user/work.py:42 in work'."""
+    frames = []
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename not in _SKIPPED_FILES:
+            frames.append(f'{os.path.relpath(filename, _APP_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames[:limit][::-1]
+
+
+def call_site() -> str:
+    frame = sys._getframe(1)
+    # Запросы SQLAlchemy выполняются в дочернем greenlet, а код, который их вызвал, - в стеке родительского
+    if greenlet is not None and (parent := greenlet.getcurrent().parent) is not None:
+        frame = parent.gr_frame
+    return ' → '.join(app_frames(frame)) or 'неизвестно'
+
+
+def record_phase(phase: str, seconds: float, histogram: Histogram | None = None, *labels: str):
+    """Учитывает время фазы в гистограмме и в разбивке текущего апдейта (если он есть)."""
+    if histogram is not None:
+        histogram.observe(seconds, *labels)
+    timer = current_update.get()
+    if timer is not None:
+        timer.add(phase, seconds)
+
+
+@contextmanager
+def measure(phase: str, histogram: Histogram | None = None, *labels: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started, histogram, *labels)
+
+
+def finish_update(timer: UpdateTimer):
+    total = time.perf_counter() - timer.started
+    update_duration.observe(total, timer.handler)
+    update_db_queries.observe(timer.phases.get('db', (0,))[0], timer.handler)
+
+    if settings.SLOW_UPDATE_SECONDS and total >= settings.SLOW_UPDATE_SECONDS:
+        private_logger.warning(f'Медленный апдейт ({timer.handler}): {total * 1000:.0f} мс - {timer.breakdown(total)}')
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for histogram in REGISTRY for line in histogram.render()) + '\n'
+
+
+async def _metrics_handler(request):
+    from aiohttp import web
+
+    return web.Response(body=render_metrics().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def start_metrics_server():
+    """Запускает HTTP-сервер с /metrics, если задан METRICS_PORT. Возвращает runner (web.AppRunner) для остановки."""
+    if not settings.METRICS_PORT:
+        return None
+    # aiohttp.web загружается, только если метрики включены
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get('/metrics', _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+    private_logger.info(f'Метрики доступны на http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics')
+    return runner
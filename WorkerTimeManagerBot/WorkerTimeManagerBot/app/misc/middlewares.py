@@ -1,4 +1,5 @@
 import time
+from collections import Counter
 from typing import Callable, Any, Awaitable
 
 import cachetools
@@ -6,8 +7,14 @@ from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
 from aiogram.dispatcher.flags import get_flag
 from aiogram.exceptions import TelegramAPIError
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
 
-from .config import settings
+from . import metrics
+from .guard import watchdog, check_update, BudgetExceeded
+from .recorder import UpdateRecorder
+from .config import settings, private_logger
+from ..db.audit import current_actor
 import asyncio
 
 
@@ -43,3 +50,118 @@ class AdminCheckMiddleware(BaseMiddleware):
             data["is_admin"] = True
             return await handler(event, data)
         return None
+
+
+class AuditActorMiddleware(BaseMiddleware):
+    """Запоминает, чей апдейт обрабатывается, чтобы журнал действий (app.db.audit) знал автора изменений."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        token = current_actor.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            current_actor.reset(token)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на апдейты: заводит UpdateTimer, в который запросы к БД, Bot API и геокодер дописывают
+    своё время, и по завершении отправляет итог в гистограммы (и в лог, если апдейт медленный).
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        timer = metrics.UpdateTimer()
+        token = metrics.current_update.set(timer)
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.current_update.reset(token)
+            metrics.finish_update(timer)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: сообщает UpdateTimer, какой именно обработчик выбран (метка для гистограмм)."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        if handler_object is not None:
+            metrics.set_handler(handler_object.callback)
+        return await handler(event, data)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время каждого запроса к Bot API (кроме long polling getUpdates) по методам."""
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        with metrics.measure('bot_api', metrics.bot_api_duration, method.__api_method__):
+            return await make_request(bot, method)
+
+
+class GuardMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на апдейты (регистрируется после MetricsMiddleware): включает сбор мест вызова и по
+    завершении обработки сверяет счётчики с лимитами (app.misc.guard).
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        timer = metrics.current_update.get()
+        if timer is None or settings.GUARD_MODE == 'off':
+            return await handler(event, data)
+
+        timer.call_sites = Counter()
+        lags_before = len(watchdog.reports)
+        result = await handler(event, data)
+
+        problems = check_update(timer, watchdog.reports[lags_before:])
+        if problems:
+            text = f'Обработчик {timer.handler}: ' + '\n'.join(problems)
+            if settings.GUARD_MODE == 'raise':
+                raise BudgetExceeded(text)
+            private_logger.warning(text)
+        return result
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на апдейты (регистрируется после MetricsMiddleware): пишет апдейт вместе с выбранным
+    обработчиком в JSONL для воспроизведения (app.misc.recorder).
+    """
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        arrived_at = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            timer = metrics.current_update.get()
+            self.recorder.record(event, arrived_at, timer.handler if timer else 'unhandled')
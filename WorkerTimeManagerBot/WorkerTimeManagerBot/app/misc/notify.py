@@ -0,0 +1,60 @@
+"""
+Пакетная рассылка уведомлений после массовых операций (автоматическое закрытие смен, массовые правки администратора).
+
+Операция сначала целиком выполняется в БД, а уже потом за один проход отправляются сообщения: по одному каждому
+затронутому работнику и сводка администраторам, разбитая на части по лимиту длины сообщения Telegram.
+"""
+
+import asyncio
+from typing import Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+
+from app.misc.config import private_logger
+
+MESSAGE_LIMIT = 4096
+
+
+def join_chunks(header: str, lines: Iterable[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Заголовок и строки -> сообщения не длиннее limit (строка целиком попадает в одно сообщение)."""
+    chunks, current = [], header
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ''
+        current = f'{current}\n{line}' if current else line
+    chunks.append(current)
+    return chunks
+
+
+async def send_batch(bot: Bot, messages: Iterable[tuple[int, str, dict]]) -> int:
+    """
+    Отправляет сообщения по очереди; при 429 ждёт retry_after и повторяет один раз.
+    :param messages: (chat_id, текст, прочие параметры send_message)
+    :return: Сколько сообщений отправлено
+    """
+    sent = 0
+    for chat_id, text, kwargs in messages:
+        for _ in range(2):
+            try:
+                await bot.send_message(chat_id, text, **kwargs)
+                sent += 1
+                break
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except TelegramAPIError as e:
+                private_logger.warning(f'Не удалось отправить уведомление в чат {chat_id}: {e}')
+                break
+    return sent
+
+
+async def delete_messages(bot: Bot, messages: Iterable[tuple[int, int | None]]):
+    """Удаляет сообщения (chat_id, message_id), которые уже могли удалить: например, сообщения о начале смены."""
+    for chat_id, message_id in messages:
+        if not message_id:
+            continue
+        try:
+            await bot.delete_message(chat_id, message_id)
+        except TelegramBadRequest:
+            pass
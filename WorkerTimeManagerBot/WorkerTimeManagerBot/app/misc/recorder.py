@@ -0,0 +1,143 @@
+"""
+Запись входящих апдейтов в JSONL для последующего воспроизведения (benchmarks/replay.py).
+
+Включается настройкой RECORD_UPDATES_FILE. Перед записью апдейт очищается от персональных данных:
+- Telegram ID заменяются стабильными псевдонимами (ключевой хэш), в том числе в поле telegram_id callback data
+  (app.keyboards.callbacks) и в тексте, если число совпадает с уже встречавшимся ID;
+- имена, username и прочие персональные поля заменяются заглушками, координаты округляются (~1 км);
+- свободный текст (например, позиция работника) заменяется заглушкой той же длины. Команды, тексты кнопок и
+  числа/даты (ставки, время) сохраняются - без них воспроизведение пойдёт по другим веткам.
+
+Каждая строка - {"offset": секунды от начала записи, "handler": обработчик, "update": апдейт}. Первая строка
+файла - заголовок с псевдонимами администраторов. Запись идёт через очередь логгера, поэтому диск не блокирует
+event loop.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from datetime import datetime, UTC
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+from aiogram.types import Update
+
+from app.keyboards import replies, callbacks
+from app.misc.config import settings
+
+# Поля, содержащие имена и контакты: значение заменяется целиком
+_NAME_FIELDS = {'first_name', 'last_name', 'username', 'title', 'bio', 'description'}
+_DROPPED_FIELDS = {'contact', 'phone_number', 'photo', 'document', 'voice', 'video', 'video_note', 'audio',
+                   'sticker', 'caption', 'reply_to_message', 'forward_origin', 'external_reply', 'quote'}
+# Объекты, у которых "id" - это Telegram ID пользователя или чата
+_USER_OBJECTS = {'from', 'chat', 'user', 'from_user', 'sender_chat'}
+_KEPT_TEXT = re.compile(r'^[\d\s:.,+\-T]*$')  # Числа, даты и время: ставки, правка времени сессии
+_NUMBER = re.compile(r'\d+')
+
+
+def _button_texts() -> set[str]:
+    keyboards = (replies.send_geolocation, replies.ends_work, replies.decline_work_starts, replies.back_action,
+                 replies.worker_menu(settings.ADMIN_IDS[0] if settings.ADMIN_IDS else None))
+    return {button.text for keyboard in keyboards for row in keyboard.keyboard for button in row}
+
+
+class UpdateScrubber:
+    def __init__(self, salt: str):
+        self._key = hashlib.blake2b(salt.encode(), digest_size=32).digest()
+        self._seen_ids: set[int] = set(settings.ADMIN_IDS)
+        self._button_texts = _button_texts()
+
+    def pseudonym(self, telegram_id: int) -> int:
+        digest = hashlib.blake2b(str(telegram_id).encode(), key=self._key, digest_size=8).digest()
+        # Положительный ID той же "формы", что и настоящие (10 знаков), отрицательные (группы) остаются такими
+        value = 1_000_000_000 + int.from_bytes(digest) % 8_000_000_000
+        return -value if telegram_id < 0 else value
+
+    def _replace_numbers(self, text: str) -> str:
+        return _NUMBER.sub(lambda match: str(self.pseudonym(int(match.group())))
+                           if int(match.group()) in self._seen_ids else match.group(), text)
+
+    def _callback_data(self, data: str) -> str:
+        callback_data = callbacks.parse(data)
+        if callback_data is None:
+            return self._replace_numbers(data)
+        # Целые поля упакованы в base36, поэтому Telegram ID берём из разобранных данных, а не из строки
+        telegram_id = getattr(callback_data, 'telegram_id', None)
+        if telegram_id is None:
+            return data
+        return callback_data.model_copy(update={'telegram_id': self.pseudonym(telegram_id)}).pack()
+
+    def _text(self, text: str) -> str:
+        if text.startswith('/') or text in self._button_texts or _KEPT_TEXT.match(text):
+            return self._replace_numbers(text)
+        return '*' * len(text)
+
+    def _scrub(self, value, key: str | None = None):
+        if isinstance(value, dict):
+            if key in _USER_OBJECTS and isinstance(value.get('id'), int):
+                self._seen_ids.add(abs(value['id']))
+                value = {**value, 'id': self.pseudonym(value['id'])}
+            return {k: self._scrub(v, k) for k, v in value.items() if k not in _DROPPED_FIELDS}
+        if isinstance(value, list):
+            return [self._scrub(item, key) for item in value]
+
+        if key in _NAME_FIELDS and isinstance(value, str):
+            return 'user'
+        if key in ('latitude', 'longitude') and isinstance(value, float):
+            return round(value, 2)
+        if key == 'text' and isinstance(value, str):
+            return self._text(value)
+        if key == 'data' and isinstance(value, str):  # callback_data
+            return self._callback_data(value)
+        if key == 'date':
+            return 0  # При воспроизведении важен только порядок и интервалы (offset)
+        return value
+
+    def scrub(self, update: Update) -> dict:
+        data = update.model_dump(mode='json', exclude_none=True, by_alias=True)
+        # Сначала запоминаем всех пользователей апдейта, чтобы их ID заменились и в тексте/callback_data
+        for obj in (data.get('message') or {}, data.get('callback_query') or {}):
+            if isinstance(obj.get('from'), dict):
+                self._seen_ids.add(obj['from']['id'])
+        return self._scrub(data)
+
+
+class UpdateRecorder:
+    def __init__(self, path: str, salt: str):
+        self.scrubber = UpdateScrubber(salt)
+        self.started = time.monotonic()
+
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._queue = SimpleQueue()
+        self._listener = QueueListener(self._queue, handler)
+        self._logger = logging.getLogger('update-recorder')
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(QueueHandler(self._queue))
+        self._listener.start()
+
+        self._write({'header': {'started': datetime.now(UTC).isoformat(timespec='seconds'),
+                                'admins': [self.scrubber.pseudonym(admin_id) for admin_id in settings.ADMIN_IDS]}})
+
+    def _write(self, record: dict):
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def record(self, update: Update, arrived_at: float, handler: str):
+        """
+        :param arrived_at: time.monotonic() на момент получения апдейта
+        :param handler: выбранный обработчик ('unhandled', если апдейт никуда не попал или отброшен троттлингом)
+        """
+        self._write({'offset': round(arrived_at - self.started, 3), 'handler': handler,
+                     'update': self.scrubber.scrub(update)})
+
+    def close(self):
+        self._listener.stop()
+
+
+def create_recorder() -> UpdateRecorder | None:
+    if not settings.RECORD_UPDATES_FILE:
+        return None
+    return UpdateRecorder(settings.RECORD_UPDATES_FILE, settings.RECORD_SALT or settings.BOT_TOKEN)
@@ -0,0 +1,153 @@
+"""
+Единый рендер отчётов по сессии.
+
+Все варианты текста (работнику, администратору, краткая сводка) строятся из одного снимка сессии (SessionFacts)
+за один проход: длительность, сумма и адрес считаются один раз. Отчёты по завершённым сессиям не меняются,
+поэтому кэшируются (при правке сессии администратором меняется и снимок, а значит и ключ кэша).
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+from html import escape
+
+import cachetools
+from aiogram.utils.markdown import hbold
+
+from app.db.facts import SessionFacts
+from app.misc import utils
+from app.misc.config import settings
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+NOT_ENDED = "Еще не закончена"
+
+# Шаблоны собираются один раз при импорте, дальше только подставляем значения
+_DATES_TEMPLATE = f'Дата начала: {hbold("{start}")}\nДата окончания: {hbold("{end}")}\n'
+_BODY_TEMPLATE = 'Время работы: {duration}\nАдрес: {address}\nМесто / позиция: {position}'
+_RATE_TEMPLATE = '\nИндивидуальная ставка: {rate:.2f} ₽ / час'
+_RATE_CHANGE_TEMPLATE = '\nС {start}: {rate:.2f} ₽ / час'
+_TOTAL_TEMPLATE = '\nИтого заработано: {total:.2f} ₽'
+_STARTED_TEMPLATE = 'Начало: {start}\nСтавка пользователя: {rate}\n\nАдрес: {address}\nМесто: {position}'
+_WORKER_LINE_TEMPLATE = 'Работник: ID{telegram_id}\n'
+_DIGEST_TEMPLATE = '№{id} | ID{telegram_id} | {start} - {end} | {duration} | {total:.2f} ₽'
+_LIVE_TEMPLATE = '\n\nНа смене: {duration}'
+_LIVE_EARNED_TEMPLATE = '\nЗаработано: {total:.2f} ₽'
+_CONFLICT_TEMPLATE = '\n№{id}: {start} - {end}'
+
+VARIANTS = ('worker', 'admin', 'digest', 'started')
+
+_closed_reports = cachetools.LRUCache(maxsize=4_096)
+
+
+@dataclass(frozen=True, slots=True)
+class SessionNumbers:
+    days: int
+    hours: int
+    minutes: int
+    seconds: int
+    payment_kopecks: int
+
+
+def to_local(value: datetime) -> datetime:
+    """UTC (без tzinfo, как в БД) -> локальное время из настроек."""
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value + timedelta(hours=settings.UTC_OFFSET_HOURS)
+
+
+def format_local(value: datetime | None, fmt: str = DATE_FORMAT) -> str:
+    return to_local(value).strftime(fmt) if value else NOT_ENDED
+
+
+def session_numbers(facts: SessionFacts, now: datetime | None = None) -> SessionNumbers:
+    """Длительность (дни, часы, минуты, секунды) и сумма к выплате за один расчёт."""
+    work_time = facts.worked_time(now)
+    hours, rem = divmod(work_time.seconds, 3600)
+    minutes, seconds = divmod(rem, 60)
+
+    return SessionNumbers(work_time.days, hours, minutes, seconds, facts.payment_kopecks(now))
+
+
+def format_duration(numbers: SessionNumbers) -> str:
+    text = ''
+    text += f' {numbers.days} дней' if numbers.days else ''
+    text += f' {numbers.hours} часов' if numbers.hours else ''
+    text += f' {numbers.minutes} минут' if numbers.minutes else ''
+    text += f' {numbers.seconds} секунд' if not any([numbers.hours, numbers.days, numbers.minutes]) else ''
+    return text.strip()
+
+
+async def render_session_reports(facts: SessionFacts, variants: tuple[str, ...] = VARIANTS,
+                                 now: datetime | None = None) -> dict[str, str]:
+    """
+    Строит сразу несколько вариантов отчёта по сессии.
+    :param facts: Снимок сессии (для завершения "на лету" передайте снимок с уже проставленным ended_at)
+    :param variants: Нужные варианты из VARIANTS
+    :param now: Момент, до которого считается незавершённая сессия (по умолчанию - сейчас)
+    :return: Словарь вариант -> текст
+    """
+    if facts.is_closed:
+        cached = {variant: _closed_reports.get((facts, variant)) for variant in variants}
+        if all(cached.values()):
+            return cached
+
+    numbers = session_numbers(facts, now)
+    # Адрес и позиция приходят извне, а сообщения отправляются в HTML-режиме
+    address = await utils.lookup_address(facts.latitude, facts.longitude)
+    # Адрес не получен из-за ошибки сети: такой отчёт не кэшируем, чтобы в следующий раз адрес запросился снова
+    cacheable = facts.is_closed and address is not None
+    address = escape(address or "Адрес не найден")
+    position = escape(facts.work_position or '')
+    start, end = format_local(facts.started_at), format_local(facts.ended_at)
+    duration = format_duration(numbers)
+    total = numbers.payment_kopecks / 100
+
+    body = _BODY_TEMPLATE.format(duration=duration, address=address, position=position)
+    if facts.hour_kopecks_rate or facts.rate_changes:
+        if facts.hour_kopecks_rate:
+            body += _RATE_TEMPLATE.format(rate=facts.hour_kopecks_rate / 100)
+        # Ставка работника поменялась посреди смены: время после изменения оплачено по новой ставке
+        for moment, rate in facts.rate_changes:
+            body += _RATE_CHANGE_TEMPLATE.format(start=format_local(moment), rate=rate / 100)
+        body += _TOTAL_TEMPLATE.format(total=total)
+    dates = _DATES_TEMPLATE.format(start=start, end=end)
+
+    reports = {}
+    for variant in variants:
+        if variant == 'worker':
+            reports[variant] = dates + body
+        elif variant == 'admin':
+            reports[variant] = _WORKER_LINE_TEMPLATE.format(telegram_id=facts.telegram_id) + dates + body
+        elif variant == 'digest':
+            reports[variant] = _DIGEST_TEMPLATE.format(id=facts.id, telegram_id=facts.telegram_id, start=start, end=end,
+                                                       duration=duration, total=total)
+        elif variant == 'started':
+            rate = f'{facts.hour_kopecks_rate / 100:.2f} ₽ / час' if facts.hour_kopecks_rate else 'Не задана'
+            reports[variant] = _STARTED_TEMPLATE.format(start=start, rate=rate, address=address,
+                                                        position=position)
+        else:
+            raise ValueError(f'Неизвестный вариант отчёта: {variant}')
+
+        if cacheable:
+            _closed_reports[(facts, variant)] = reports[variant]
+
+    return reports
+
+
+async def render_session_report(facts: SessionFacts, variant: str = 'worker', now: datetime | None = None) -> str:
+    return (await render_session_reports(facts, (variant,), now))[variant]
+
+
+def render_live_counter(facts: SessionFacts, now: datetime | None = None) -> str:
+    """Строка "на смене / заработано" для сообщения о начале смены (app.misc.ticker)."""
+    numbers = session_numbers(facts, now)
+    text = _LIVE_TEMPLATE.format(duration=format_duration(numbers))
+    if facts.hour_kopecks_rate or facts.rate_changes:
+        text += _LIVE_EARNED_TEMPLATE.format(total=numbers.payment_kopecks / 100)
+    return text
+
+
+def render_conflict(error) -> str:
+    """Текст ошибки app.db.overlaps.SessionTimeConflict со списком сессий, с которыми вышло пересечение."""
+    return str(error) + ''.join(_CONFLICT_TEMPLATE.format(id=facts.id, start=format_local(facts.started_at),
+                                                          end=format_local(facts.ended_at if facts.is_ended else None))
+                                for facts in error.conflicts)
@@ -0,0 +1,66 @@
+"""
+Профиль выполнения (settings.RUNTIME_PROFILE).
+
+default - стандартный event loop asyncio, stdlib json и сессия aiogram с настройками по умолчанию.
+performance:
+- event loop uvloop;
+- orjson для разбора ответов Bot API и сериализации параметров запросов;
+- пул соединений HTTP_POOL_LIMIT, долгий keep-alive и кэш DNS: почти все запросы идут на один хост (api.telegram.org),
+  поэтому соединения переиспользуются, а не открываются заново после 15 с простоя (значение aiohttp по умолчанию);
+- тот же пул (одна aiohttp.ClientSession) используется геокодером вместо отдельного потока с geopy.
+"""
+
+import asyncio
+
+from aiogram.client.session.aiohttp import AiohttpSession
+
+from app.misc.config import settings
+
+PERFORMANCE = settings.RUNTIME_PROFILE == 'performance'
+KEEPALIVE_SECONDS = 75  # Чуть дольше long polling (60 с), чтобы соединение не закрывалось между запросами
+
+_shared_session: AiohttpSession | None = None
+
+
+def _import_performance_deps():
+    try:
+        import orjson
+        import uvloop
+    except ImportError as e:
+        raise RuntimeError('Для RUNTIME_PROFILE=performance необходимы uvloop и orjson: '
+                           'poetry install --extras performance') from e
+    return orjson, uvloop
+
+
+def run(main):
+    """Запускает корутину в event loop выбранного профиля (вместо asyncio.run)."""
+    if not PERFORMANCE:
+        return asyncio.run(main)
+    _, uvloop = _import_performance_deps()
+    return uvloop.run(main)
+
+
+def create_bot_session(**kwargs) -> AiohttpSession:
+    """
+    Сессия для Bot. В режиме performance она же - общий пул HTTP-соединений (см. http_session).
+    :param kwargs: Дополнительные параметры AiohttpSession (например, api для локального сервера Bot API)
+    """
+    global _shared_session
+    if not PERFORMANCE:
+        return AiohttpSession(**kwargs)
+
+    orjson, _ = _import_performance_deps()
+    session = AiohttpSession(limit=settings.HTTP_POOL_LIMIT, json_loads=orjson.loads,
+                             json_dumps=lambda value: orjson.dumps(value).decode(), **kwargs)
+    # Параметры TCPConnector у AiohttpSession задаются только через _connector_init (публичного способа нет)
+    session._connector_init.update(limit_per_host=settings.HTTP_POOL_LIMIT, keepalive_timeout=KEEPALIVE_SECONDS,
+                                   use_dns_cache=True, ttl_dns_cache=3600)
+    _shared_session = session
+    return session
+
+
+async def http_session():
+    """Общая aiohttp.ClientSession бота (режим performance) или None - тогда каждый клиент работает по-своему."""
+    if _shared_session is None:
+        return None
+    return await _shared_session.create_session()
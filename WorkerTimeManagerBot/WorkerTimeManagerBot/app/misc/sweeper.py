@@ -0,0 +1,144 @@
+"""
+Автоматическое закрытие забытых смен.
+
+Крайний срок смены - раньшее из двух: начало + MAX_SHIFT_HOURS и ближайшее после начала время закрытия
+(работника, а если не задано - площадки; python manage.py set-close-time). Смена закрывается этим сроком, а не
+моментом проверки, так что забытая смена не набирает лишних часов, даже если бот был остановлен.
+
+Раз в SWEEP_INTERVAL_SECONDS одна фоновая задача:
+- берёт (или продлевает) аренду в таблице leases - если запущено несколько копий бота, проверку выполняет только
+  владелец аренды, а после его остановки или падения аренду через LEASE_INTERVALS проверок заберёт другая копия;
+- выбирает активные смены с их временем закрытия одним запросом и считает сроки в Python;
+- закрывает просроченные одним UPDATE ... RETURNING (итоги rollup - одним upsert на таблицу);
+- уведомляет работников (по сообщению каждому) и администраторов (одна сводка на всю пачку).
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, UTC
+
+from aiogram import Bot
+from aiogram.utils.markdown import hbold
+
+from app.db import queries, rollups
+from app.db.facts import SessionFacts
+from app.keyboards import replies
+from app.misc import notify, rendering
+from app.misc.config import settings, private_logger
+
+LEASE_NAME = 'session_sweeper'
+LEASE_INTERVALS = 3  # Аренда действует столько интервалов проверки
+
+
+def format_minute(minute: int) -> str:
+    return f'{minute // 60:02}:{minute % 60:02}'
+
+
+def parse_minute(value: str) -> int:
+    """'ЧЧ:ММ' -> минуты от полуночи."""
+    hours, minutes = map(int, value.split(':'))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Некорректное время: {value}')
+    return hours * 60 + minutes
+
+
+def session_deadline(started_at: datetime, close_minute: int | None) -> tuple[datetime, str] | None:
+    """
+    Крайний срок смены.
+    :param started_at: Начало смены (UTC без tzinfo)
+    :param close_minute: Время закрытия (минуты от полуночи по местному времени) или None
+    :return: (срок в UTC, причина для уведомлений) или None, если смену закрывать не нужно
+    """
+    deadlines = []
+    if settings.MAX_SHIFT_HOURS > 0:
+        deadlines.append((started_at + timedelta(hours=settings.MAX_SHIFT_HOURS),
+                          f'смена длиннее {settings.MAX_SHIFT_HOURS:g} ч'))
+    if close_minute is not None:
+        local_start = started_at + rollups.local_offset()
+        close_at = datetime.combine(local_start.date(), datetime.min.time()) + timedelta(minutes=close_minute)
+        if close_at <= local_start:
+            close_at += timedelta(days=1)
+        deadlines.append((close_at - rollups.local_offset(), f'время закрытия {format_minute(close_minute)}'))
+    return min(deadlines, default=None)
+
+
+class SessionSweeper:
+    def __init__(self):
+        # Уникален для каждого процесса, в том числе на одном сервере
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot):
+        if settings.SWEEP_INTERVAL_SECONDS <= 0:
+            return
+        self._bot = bot
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        # Чтобы другая копия бота не ждала истечения аренды
+        await queries.release_lease(LEASE_NAME, self.holder)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                private_logger.error(f'Ошибка автоматического закрытия смен: {e}')
+            await asyncio.sleep(settings.SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self, now: datetime | None = None) -> list[SessionFacts]:
+        """
+        Одна проверка.
+        :param now: Момент проверки (UTC без tzinfo), по умолчанию - текущий
+        :return: Закрытые смены (пусто и у копии бота без аренды)
+        """
+        if not await queries.acquire_lease(LEASE_NAME, self.holder,
+                                           settings.SWEEP_INTERVAL_SECONDS * LEASE_INTERVALS):
+            return []
+
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        deadlines, reasons = {}, {}
+        for facts, close_minute in await queries.get_sweep_candidates(settings.MAX_SHIFT_HOURS > 0):
+            found = session_deadline(facts.started_at, close_minute)
+            if found is not None and found[0] <= now:
+                deadlines[facts.id], reasons[facts.id] = found
+        if not deadlines:
+            return []
+
+        closed = await queries.close_overdue_sessions(deadlines)
+        for facts, _ in closed:
+            private_logger.info(f'Смена №{facts.id} работника ID{facts.telegram_id} закрыта автоматически: '
+                                f'{reasons[facts.id]}',
+                                extra={'worker': facts.telegram_id, 'session_id': facts.id,
+                                       'action': 'session_auto_ended'})
+        if closed and self._bot is not None:
+            await self._notify(closed, reasons)
+        return [facts for facts, _ in closed]
+
+    async def _notify(self, closed: list[tuple[SessionFacts, int | None]], reasons: dict[int, str]):
+        digest, messages = [], []
+        for facts, _ in closed:
+            reports = await rendering.render_session_reports(facts, ('worker', 'digest'))
+            digest.append(f'{reports["digest"]} | {reasons[facts.id]}')
+            if facts.telegram_id is not None:
+                messages.append((facts.telegram_id,
+                                 f'{hbold("Смена закрыта автоматически")} ({reasons[facts.id]}).\n'
+                                 f'Если вы работали дольше, сообщите администратору.\n\n{reports["worker"]}',
+                                 {'reply_markup': replies.worker_menu(facts.telegram_id)}))
+
+        await notify.delete_messages(self._bot, [(facts.telegram_id, message_id) for facts, message_id in closed
+                                                 if facts.telegram_id is not None])
+        # Администраторам - одна сводка на всю пачку
+        summary = notify.join_chunks(hbold(f'Автоматически закрыто смен: {len(closed)}'), digest)
+        messages += [(admin_id, chunk, {}) for admin_id in settings.ADMIN_IDS for chunk in summary]
+        await notify.send_batch(self._bot, messages)
+
+
+session_sweeper = SessionSweeper()
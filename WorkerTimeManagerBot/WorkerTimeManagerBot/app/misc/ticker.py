@@ -0,0 +1,193 @@
+"""
+Живой счётчик в сообщении о начале смены: сколько работник уже на смене и сколько заработал.
+
+Все активные смены обслуживает одна фоновая задача с одной кучей (heapq) моментов следующей правки:
+- правки смены идут по сетке от её начала (начало + k * TICKER_INTERVAL_SECONDS), поэтому смены, начатые
+  в разное время, сами собой разнесены по времени, а не правятся все разом;
+- задача спит до ближайшего момента из кучи (или до появления более ранней записи), а не опрашивает все смены;
+- правки идут не чаще TICKER_EDITS_PER_SECOND в сумме. Если они не успевают, пропущенные шаги сетки не
+  догоняются: следующая правка смены - ближайший шаг сетки после текущей;
+- изменения смены (ставка, время начала) не правят сообщение сразу: правка переносится не дальше чем на
+  COALESCE_SECONDS, и несколько изменений подряд дают одну правку. Если текст не изменился, Bot API не вызывается;
+- при перестановке записи старая остаётся в куче и пропускается при извлечении (сверяется с entry.due).
+
+При запуске расписание строится заново по активным сменам из БД (ID сообщения хранится в old_message_id).
+Смена убирается из расписания при завершении или удалении (app.db.signals), а также если сообщение уже нельзя
+править (удалено, бот заблокирован).
+"""
+
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass, replace
+from datetime import UTC
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from app.db import queries, signals
+from app.db.facts import SessionFacts
+from app.misc import rendering
+from app.misc.config import settings, private_logger
+
+STARTED_PREFIX = 'Вы начали работу!\n'
+COALESCE_SECONDS = 2.0
+TICK_DELAY = 0.5  # Правка чуть позже шага сетки, чтобы минуты на счётчике уже сменились
+MAX_CONCURRENT_EDITS = 8
+
+
+@dataclass(slots=True)
+class _Entry:
+    facts: SessionFacts
+    chat_id: int
+    message_id: int
+    base: str | None = None  # Текст сообщения без счётчика; None - построить при ближайшей правке
+    shown: str | None = None  # Последний отправленный текст
+    due: float = 0.0  # Момент (unix-время) правки, на который указывает актуальная запись в куче
+
+
+class SessionTicker:
+    def __init__(self):
+        self._entries: dict[int, _Entry] = {}  # ID сессии -> смена в расписании
+        self._heap: list[tuple[float, int]] = []  # (момент правки, ID сессии)
+        self._wakeup = asyncio.Event()
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._edits: set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._next_edit_at = 0.0  # loop.time(), раньше которого следующую правку не начинать
+
+    async def start(self, bot: Bot):
+        """Строит расписание по активным сменам из БД и запускает фоновую задачу."""
+        if settings.TICKER_INTERVAL_SECONDS <= 0:
+            return
+        self._bot = bot
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_EDITS)
+        now = time.time()
+        sessions = [obj for obj in await queries.get_active_sessions() if obj.old_message_id]
+        # Изменения ставки посреди смены - чтобы счётчик "заработано" совпадал с отчётом о завершении
+        facts_list = await queries.attach_rate_changes([SessionFacts.from_model(obj) for obj in sessions])
+        for obj, facts in zip(sessions, facts_list):
+            self._add(facts, obj.worker.telegram_id, obj.old_message_id, None, now)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        private_logger.info(f'Счётчик смен запущен: в расписании {len(self._entries)} сообщений')
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        if self._edits:
+            await asyncio.gather(*self._edits, return_exceptions=True)
+        self._task = None
+
+    def watch(self, facts: SessionFacts, chat_id: int, message_id: int, text: str):
+        """
+        Добавляет только что отправленное сообщение о начале смены в расписание.
+        :param text: Текст отправленного сообщения (к нему дописывается счётчик)
+        """
+        if self._task is None:
+            return
+        self._add(facts, chat_id, message_id, text, time.time())
+
+    def on_session_changed(self, old: SessionFacts | None, new: SessionFacts | None):
+        if old is None or (entry := self._entries.get(old.id)) is None:
+            return
+        if new is None or new.is_ended:
+            del self._entries[old.id]
+            return
+
+        if new.telegram_id is None:
+            new = replace(new, telegram_id=old.telegram_id)
+        if new.hour_kopecks_rate != old.hour_kopecks_rate:
+            entry.base = None  # Ставка есть и в самом тексте сообщения
+        entry.facts = new
+        self._push(entry, min(entry.due, time.time() + COALESCE_SECONDS))
+
+    def _add(self, facts: SessionFacts, chat_id: int, message_id: int, base: str | None, now: float):
+        entry = _Entry(facts, chat_id, message_id, base)
+        self._entries[facts.id] = entry
+        self._push(entry, self._next_tick(facts, now))
+
+    @staticmethod
+    def _next_tick(facts: SessionFacts, now: float) -> float:
+        interval = settings.TICKER_INTERVAL_SECONDS
+        started = facts.started_at.replace(tzinfo=UTC).timestamp()
+        return started + ((now - started) // interval + 1) * interval + TICK_DELAY
+
+    def _push(self, entry: _Entry, due: float):
+        entry.due = due
+        # Устаревших записей не больше, чем изменений смен, но при долгой работе куча всё же перестраивается
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(item.due, session_id) for session_id, item in self._entries.items()]
+            heapq.heapify(self._heap)
+        else:
+            heapq.heappush(self._heap, (due, entry.facts.id))
+        if self._heap[0][0] >= due:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._heap[0][0] <= time.time():
+                due, session_id = heapq.heappop(self._heap)
+                entry = self._entries.get(session_id)
+                if entry is None or entry.due != due:
+                    continue
+
+                now = time.time()
+                self._push(entry, self._next_tick(entry.facts, now))
+                text = None if entry.base is None else entry.base + rendering.render_live_counter(entry.facts)
+                if text is not None and text == entry.shown:
+                    continue
+
+                delay = self._next_edit_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if self._entries.get(session_id) is not entry:
+                        continue  # Пока ждали, смену завершили
+                self._next_edit_at = max(loop.time(), self._next_edit_at) + 1 / settings.TICKER_EDITS_PER_SECOND
+                await self._semaphore.acquire()
+                task = loop.create_task(self._edit(entry, text))
+                self._edits.add(task)
+                task.add_done_callback(self._edits.discard)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+    async def _edit(self, entry: _Entry, text: str | None):
+        try:
+            if text is None:
+                entry.base = STARTED_PREFIX + await rendering.render_session_report(entry.facts, 'started')
+                text = entry.base + rendering.render_live_counter(entry.facts)
+            await self._bot.edit_message_text(text, chat_id=entry.chat_id, message_id=entry.message_id)
+            entry.shown = text
+        except TelegramRetryAfter as e:
+            # Общий лимит превышен: притормаживаем все правки, а эту повторяем после паузы
+            self._next_edit_at = asyncio.get_running_loop().time() + e.retry_after
+            if self._entries.get(entry.facts.id) is entry:
+                self._push(entry, time.time() + e.retry_after)
+        except TelegramBadRequest as e:
+            if 'not modified' in e.message:
+                entry.shown = text
+            else:
+                self._forget(entry, e)
+        except TelegramForbiddenError as e:
+            self._forget(entry, e)
+        except Exception as e:
+            private_logger.error(f'Ошибка обновления счётчика смены №{entry.facts.id}: {e}')
+        finally:
+            self._semaphore.release()
+
+    def _forget(self, entry: _Entry, error: Exception):
+        # Сообщение удалено или бот заблокирован: дальше эту смену не правим
+        if self._entries.get(entry.facts.id) is entry:
+            del self._entries[entry.facts.id]
+        private_logger.debug(f'Счётчик смены №{entry.facts.id} остановлен: {error}')
+
+
+session_ticker = SessionTicker()
+signals.subscribe(session_ticker.on_session_changed)
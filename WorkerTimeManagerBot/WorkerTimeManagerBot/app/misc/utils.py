@@ -1,10 +1,68 @@
-from geopy.geocoders import Nominatim
+import asyncio
+from urllib.parse import urlsplit
+
+import cachetools
+
+from app.misc import gazetteer, metrics, runtime
+from app.misc.config import settings
+
+# Адреса по координатам почти не меняются, а Nominatim отвечает медленно и ограничивает частоту запросов
+_address_cache = cachetools.LRUCache(maxsize=10_000)
+USER_AGENT = 'geoapi'
+
 
 # Получаем русское название адреса по широте и долготе
 def get_address(latitude: float, longitude: float):
-    geolocator = Nominatim(user_agent="geoapi")
-    location = geolocator.reverse((latitude, longitude), exactly_one=True, language='ru')
+    # geopy нужен только при первой геолокации, а не при запуске бота
+    from geopy.geocoders import Nominatim
+
+    url = urlsplit(settings.NOMINATIM_URL)
+    geolocator = Nominatim(user_agent=USER_AGENT, domain=url.netloc, scheme=url.scheme)
+    with metrics.measure('geocoder', metrics.geocoder_duration):
+        location = geolocator.reverse((latitude, longitude), exactly_one=True, language='ru')
     if location:
         return location.address
     else:
-        return "Адрес не найден"
\ No newline at end of file
+        return "Адрес не найден"
+
+
+async def get_address_shared(session, latitude: float, longitude: float) -> str:
+    """То же, что get_address, но через общую aiohttp-сессию бота (RUNTIME_PROFILE=performance), без потока."""
+    params = {'lat': latitude, 'lon': longitude, 'format': 'json', 'accept-language': 'ru'}
+    with metrics.measure('geocoder', metrics.geocoder_duration):
+        async with session.get(f'{settings.NOMINATIM_URL}/reverse', params=params,
+                               headers={'User-Agent': USER_AGENT}, raise_for_status=True) as response:
+            data = await response.json()
+    return data.get('display_name') or "Адрес не найден"
+
+
+async def get_address_cached(latitude: float | None, longitude: float | None) -> str:
+    """
+    Неблокирующая версия get_address: запрос уходит в отдельный поток (или в общую сессию в режиме performance),
+    результат кэшируется (~1 м точности).
+    """
+    return await lookup_address(latitude, longitude) or "Адрес не найден"
+
+
+async def lookup_address(latitude: float | None, longitude: float | None) -> str | None:
+    """То же, что get_address_cached, но при ошибке сети возвращает None (такой результат не кэшируется)."""
+    if latitude is None or longitude is None:
+        return "Адрес не найден"
+
+    if settings.GEOCODER_BACKEND == 'offline':
+        # Поиск в справочнике занимает микросекунды: ни потока, ни кэша не нужно
+        with metrics.measure('geocoder', metrics.geocoder_duration):
+            return gazetteer.reverse(latitude, longitude)
+
+    key = (round(latitude, 5), round(longitude, 5))
+    if key not in _address_cache:
+        try:
+            session = await runtime.http_session()
+            if session is not None:
+                _address_cache[key] = await get_address_shared(session, latitude, longitude)
+            else:
+                _address_cache[key] = await asyncio.to_thread(get_address, latitude, longitude)
+        except Exception:
+            # Ошибку сети не кэшируем, чтобы в следующий раз попробовать снова
+            return None
+    return _address_cache[key]
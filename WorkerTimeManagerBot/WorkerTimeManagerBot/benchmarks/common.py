@@ -0,0 +1,99 @@
+"""
+Общие части нагрузочного теста (benchmarks/load.py) и воспроизведения записанных апдейтов (benchmarks/replay.py).
+"""
+
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+BENCH_TOKEN = '123456:bench'
+
+
+def configure_environment(admin_ids: list[int]) -> str:
+    """Временная БД и логи, тестовый токен и администраторы. Вызывать до импорта app (настройки читаются при импорте)."""
+    scratch = tempfile.mkdtemp(prefix='bot-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{os.path.join(scratch, "bench.sqlite3")}'
+    os.environ['LOG_FILE'] = os.path.join(scratch, 'private_logs.txt')
+    os.environ['BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['ADMIN_IDS'] = '[' + ','.join(map(str, admin_ids)) + ']'
+    os.environ['LOGGING_LEVEL'] = 'WARNING'
+    # Бенчмарк не должен сам себя записывать
+    os.environ.pop('RECORD_UPDATES_FILE', None)
+    return scratch
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def prepare_bot(api_base_url: str):
+    """
+    Таблицы во временной БД, данные дашборда и бот, направленный на локальную замену Bot API (она же отвечает
+    за геокодер). Сессия создаётся так же, как в main.py, с учётом RUNTIME_PROFILE.
+    """
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    from app.db.models import ensure_schema
+    from app.misc import runtime
+    from app.misc.config import settings
+    from app.misc.live_stats import live_stats
+    from app.misc.middlewares import BotApiMetricsMiddleware
+
+    await ensure_schema()
+    await live_stats.seed()
+
+    settings.NOMINATIM_URL = api_base_url
+    session = runtime.create_bot_session(api=TelegramAPIServer.from_base(api_base_url))
+    bot = Bot(BENCH_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
+
+
+class LatencyRecorder:
+    """
+    Внешний middleware на апдейты (регистрируется после MetricsMiddleware): время обработки по обработчикам.
+    on_done(update_id, handler) вызывается после обработки каждого апдейта.
+    """
+
+    def __init__(self, on_done=None):
+        self.durations: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.on_done = on_done
+
+    async def __call__(self, handler, event, data):
+        from app.misc import metrics
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            timer = metrics.current_update.get()
+            name = timer.handler if timer else 'unhandled'
+            self.durations[name].append(time.perf_counter() - started)
+            self.errors[name] += failed
+            if self.on_done is not None:
+                self.on_done(event.update_id, name)
+
+    @property
+    def total(self) -> int:
+        return sum(map(len, self.durations.values()))
+
+    def profile(self) -> dict[str, dict[str, float]]:
+        """Профиль задержек {обработчик: {count, p50, p99}} в секундах - для сравнения между коммитами."""
+        return {name: {'count': len(values), 'p50': percentile(values, 0.5), 'p99': percentile(values, 0.99)}
+                for name, values in sorted(self.durations.items())}
+
+    def print_table(self):
+        print(f'\n{"Обработчик":<50}{"кол-во":>8}{"p50, мс":>10}{"p99, мс":>10}{"max, мс":>10}{"ошибок":>8}')
+        for name, values in sorted(self.durations.items(), key=lambda item: -len(item[1])):
+            print(f'{name:<50}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}'
+                  f'{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}{self.errors[name]:>8}')
@@ -0,0 +1,125 @@
+"""
+Локальная замена Bot API для нагрузочных тестов.
+
+Отвечает на методы, которые использует бот (getMe, getUpdates, sendMessage, editMessageText, getChat, deleteMessage,
+answerCallbackQuery и т.д.), с настраиваемой задержкой и долей ответов 429 Too Many Requests. Апдейты для
+getUpdates кладутся в очередь через push_update, так что бот работает в обычном режиме long polling.
+
+Заодно отвечает на GET /reverse как Nominatim (settings.NOMINATIM_URL = base_url) со своей задержкой: геокодер
+ходит по сети так же, как в работе, - и через geopy в потоке, и через общую сессию в режиме performance.
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench bot', 'username': 'bench_bot'}
+
+
+class FakeBotApi:
+    def __init__(self, latency: float = 0.0, rate_429: float = 0.0, retry_after: int = 1,
+                 host: str = '127.0.0.1', port: int = 0, geocoder_latency: float = 0.0):
+        self.latency = latency
+        self.geocoder_latency = geocoder_latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.host = host
+        self.port = port
+
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._updates: deque[dict] = deque()
+        self._new_updates = asyncio.Event()
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def push_update(self, update: dict):
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        app.router.add_get('/reverse', self._reverse)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Порт 0 - свободный порт выбирает система
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _message(self, chat_id, text: str | None = None, message_id: int | None = None) -> dict:
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        return {'message_id': int(message_id), 'date': int(time.time()), 'from': BOT_USER,
+                'chat': {'id': int(chat_id), 'type': 'private'}, 'text': text or ''}
+
+    async def _get_updates(self, params) -> list[dict]:
+        offset = int(params.get('offset') or 0)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0) or 0.1)
+            except TimeoutError:
+                return []
+
+        limit = int(params.get('limit') or 100)
+        return [self._updates[i] for i in range(min(limit, len(self._updates)))]
+
+    async def _reverse(self, request: web.Request) -> web.Response:
+        self.calls['reverse'] += 1
+        if self.geocoder_latency:
+            await asyncio.sleep(self.geocoder_latency)
+        lat, lon = request.query['lat'], request.query['lon']
+        return web.json_response({'lat': lat, 'lon': lon, 'display_name': f'Тестовый адрес {lat}, {lon}'})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await request.post()
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_429 and random.random() < self.rate_429:
+            self.throttled[method] += 1
+            return web.json_response({'ok': False, 'error_code': 429,
+                                      'description': f'Too Many Requests: retry after {self.retry_after}',
+                                      'parameters': {'retry_after': self.retry_after}}, status=429)
+
+        match method:
+            case 'getMe':
+                result = BOT_USER
+            case 'sendMessage' | 'sendDocument':
+                result = self._message(params['chat_id'], params.get('text') or params.get('caption'))
+            case 'editMessageText':
+                result = self._message(params['chat_id'], params.get('text'), params['message_id'])
+            case 'getChat':
+                chat_id = int(params['chat_id'])
+                result = {'id': chat_id, 'type': 'private', 'username': f'user{chat_id}',
+                          'accent_color_id': 0, 'max_reaction_count': 0,
+                          'accepted_gift_types': {'unlimited_gifts': False, 'limited_gifts': False,
+                                                  'unique_gifts': False, 'premium_subscription': False,
+                                                  'gifts_from_channels': False}}
+            case _:
+                # deleteMessage, answerCallbackQuery, setMyCommands и прочее, что возвращает True
+                result = True
+
+        return web.json_response({'ok': True, 'result': result})
@@ -0,0 +1,86 @@
+"""
+Офлайн-геокодер (app.misc.gazetteer): время построения индекса и поиска ближайшего адреса.
+
+Справочник - файл GeoNames/CSV (--file) или случайные точки (--points), запросы - случайные координаты рядом
+с точками справочника. Часть ответов (--check) сверяется с полным перебором.
+
+Запуск из корня проекта:
+    python -m benchmarks.geocoder --points 200000 --queries 20000
+    python -m benchmarks.geocoder --file RU.txt
+"""
+
+import argparse
+import math
+import random
+import time
+
+from benchmarks.common import configure_environment, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Скорость офлайн-геокодера')
+    parser.add_argument('--file', help='Справочник GeoNames (.txt) или CSV; по умолчанию - случайные точки')
+    parser.add_argument('--points', type=int, default=200_000, help='Количество случайных точек справочника')
+    parser.add_argument('--queries', type=int, default=20_000, help='Количество запросов')
+    parser.add_argument('--check', type=int, default=50, help='Сколько ответов сверить с полным перебором')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def random_points(count: int, rng: random.Random) -> list[tuple[float, float, str]]:
+    # Равномерно по сфере, чтобы в выборку попадали и полюса, и 180-й меридиан
+    return [(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180), f'точка {i}') for i in range(count)]
+
+
+def brute_force(points: list[tuple[float, float, str]], latitude: float, longitude: float) -> float:
+    from app.misc.gazetteer import to_unit_vector, chord_to_km
+
+    qx, qy, qz = to_unit_vector(latitude, longitude)
+    best = min(sum((a - b) ** 2 for a, b in zip(to_unit_vector(lat, lon), (qx, qy, qz))) for lat, lon, _ in points)
+    return chord_to_km(math.sqrt(best))
+
+
+def main(args: argparse.Namespace):
+    from app.misc import gazetteer
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    if args.file:
+        index = gazetteer.load_gazetteer(args.file)
+        points = [(lat, lon, '') for lat, lon in _coordinates(index)]
+    else:
+        points = random_points(args.points, rng)
+        index = gazetteer.Gazetteer(points)
+    print(f'Справочник: {len(index)} точек, построение {time.perf_counter() - started:.2f} с')
+
+    queries = []
+    for _ in range(args.queries):
+        lat, lon, _ = rng.choice(points)
+        queries.append((max(-90.0, min(90.0, lat + rng.gauss(0, 0.05))), (lon + rng.gauss(0, 0.05) + 180) % 360 - 180))
+
+    durations = []
+    for lat, lon in queries:
+        started = time.perf_counter()
+        index.nearest(lat, lon)
+        durations.append(time.perf_counter() - started)
+    print(f'Поиск: p50 {percentile(durations, 0.5) * 1e6:.1f} мкс, p99 {percentile(durations, 0.99) * 1e6:.1f} мкс, '
+          f'{len(durations) / sum(durations):.0f} запросов/с')
+
+    mismatches = 0
+    for lat, lon in queries[:args.check]:
+        _, distance = index.nearest(lat, lon)
+        if not math.isclose(distance, brute_force(points, lat, lon), abs_tol=1e-6):
+            mismatches += 1
+    checked = min(args.check, len(queries))
+    print(f'Сверка с перебором: {checked - mismatches} из {checked} совпали')
+
+
+def _coordinates(index) -> list[tuple[float, float]]:
+    xs, ys, zs = index.coords
+    return [(math.degrees(math.asin(z)), math.degrees(math.atan2(y, x))) for x, y, z in zip(xs, ys, zs)]
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    configure_environment([1])
+    main(arguments)
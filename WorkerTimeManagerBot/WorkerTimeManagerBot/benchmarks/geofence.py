@@ -0,0 +1,89 @@
+"""
+Поиск рабочей площадки по геолокации (app.misc.geofence) на тысячах случайных площадок.
+
+Площадки - многоугольники и круги размером в сотни метров, разбросанные по области --span x --span градусов;
+половина запросов попадает внутрь площадок, половина - случайные точки области. Для сравнения тот же поиск
+выполняется перебором всех площадок без индекса.
+
+Запуск из корня проекта:
+    python -m benchmarks.geofence --sites 5000 --queries 20000
+"""
+
+import argparse
+import math
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import configure_environment, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Скорость поиска рабочей площадки')
+    parser.add_argument('--sites', type=int, default=5_000, help='Количество площадок')
+    parser.add_argument('--vertices', type=int, default=24, help='Вершин у многоугольника')
+    parser.add_argument('--span', type=float, default=2.0, help='Размер области в градусах')
+    parser.add_argument('--queries', type=int, default=20_000, help='Количество запросов')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def random_sites(args: argparse.Namespace, rng: random.Random) -> list[SimpleNamespace]:
+    sites = []
+    for site_id in range(1, args.sites + 1):
+        lat, lon = 55 + rng.uniform(0, args.span), 37 + rng.uniform(0, args.span)
+        size = rng.uniform(50, 500) / 111_320
+        polygon = None
+        if site_id % 2:
+            # Звёздчатый (невыпуклый) многоугольник вокруг центра
+            polygon = [[lat + size * rng.uniform(0.5, 1) * math.sin(angle),
+                        lon + size * rng.uniform(0.5, 1) * math.cos(angle) / math.cos(math.radians(lat))]
+                       for angle in (2 * math.pi * k / args.vertices for k in range(args.vertices))]
+        sites.append(SimpleNamespace(id=site_id, name=f'площадка {site_id}', latitude=lat, longitude=lon,
+                                     radius_m=rng.uniform(20, 200), polygon=polygon))
+    return sites
+
+
+def main(args: argparse.Namespace):
+    from app.misc.geofence import Site, SiteIndex
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    sites = [Site.from_model(obj) for obj in random_sites(args, rng)]
+    index = SiteIndex(sites)
+    print(f'Площадок: {len(index)}, ячеек: {len(index.cells)}, построение {time.perf_counter() - started:.2f} с')
+
+    queries = []
+    for number in range(args.queries):
+        if number % 2:
+            site = rng.choice(sites)
+            queries.append((site.latitude + rng.gauss(0, 0.001), site.longitude + rng.gauss(0, 0.001)))
+        else:
+            queries.append((55 + rng.uniform(0, args.span), 37 + rng.uniform(0, args.span)))
+
+    durations, matched = [], 0
+    for lat, lon in queries:
+        started = time.perf_counter()
+        site = index.match(lat, lon)
+        durations.append(time.perf_counter() - started)
+        matched += site is not None
+    print(f'С индексом: p50 {percentile(durations, 0.5) * 1e6:.1f} мкс, '
+          f'p99 {percentile(durations, 0.99) * 1e6:.1f} мкс, попаданий {matched} из {len(queries)}')
+
+    sample = queries[:max(1, args.queries // 100)]
+    durations, mismatches = [], 0
+    for lat, lon in sample:
+        started = time.perf_counter()
+        inside = [(site.distance_m(lat, lon), site) for site in sites]
+        inside = [(distance, site) for distance, site in inside if distance <= site.radius_m]
+        best = min(inside, key=lambda item: item[0])[1] if inside else None
+        durations.append(time.perf_counter() - started)
+        mismatches += best is not index.match(lat, lon)
+    print(f'Перебором: p50 {percentile(durations, 0.5) * 1e3:.2f} мс ({len(sample)} запросов), '
+          f'расхождений с индексом: {mismatches}')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    configure_environment([1])
+    main(arguments)
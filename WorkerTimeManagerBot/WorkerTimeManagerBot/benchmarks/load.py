@@ -0,0 +1,162 @@
+"""
+Нагрузочный тест бота: настоящий Dispatcher и роутеры из app/handlers против локальной замены Bot API.
+
+N работников параллельно проходят циклы "Начать работу -> геолокация -> позиция -> Завершить работу", а
+администраторы листают списки сессий, работников и дашборд. Бот получает апдейты обычным long polling из
+benchmarks.fake_bot_api, геокодер (Nominatim) отвечает оттуда же с задержкой. БД - временная, рабочая не
+затрагивается. Профиль выполнения берётся из RUNTIME_PROFILE, как у самого бота (сравнение - benchmarks.profiles).
+
+Запуск из корня проекта:
+    python -m benchmarks.load --workers 50 --admins 2 --cycles 3 --api-latency 0.02 --rate-429 0.01
+
+В конце печатается пропускная способность (апдейтов/с) и p50/p99 времени обработки по каждому обработчику.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import configure_environment, prepare_bot, LatencyRecorder
+
+# Между шагами одного пользователя: ThrottlingMiddleware отбрасывает апдейты из одного чата чаще, чем раз в 0.5 с
+DEFAULT_THINK_TIME = 0.6
+FIRST_WORKER_ID = 10_000
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на локальной замене Bot API')
+    parser.add_argument('--workers', type=int, default=20, help='Количество одновременных работников')
+    parser.add_argument('--admins', type=int, default=1, help='Количество администраторов, листающих списки')
+    parser.add_argument('--cycles', type=int, default=2, help='Сколько смен проходит каждый работник')
+    parser.add_argument('--api-latency', type=float, default=0.01, help='Задержка ответа Bot API, с')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Доля ответов 429 Too Many Requests (0..1)')
+    parser.add_argument('--geocoder-latency', type=float, default=0.05, help='Задержка ответа геокодера, с')
+    parser.add_argument('--think-time', type=float, default=DEFAULT_THINK_TIME,
+                        help='Пауза между шагами одного пользователя, с')
+    parser.add_argument('--json-out', help='Сохранить итог (пропускная способность и профиль задержек) в JSON')
+    return parser.parse_args()
+
+
+class LoadDriver:
+    def __init__(self, args: argparse.Namespace, fake_api):
+        self.args = args
+        self.api = fake_api
+        self.latency = LatencyRecorder(on_done=self._on_done)
+        self._update_id = 0
+        self._done: dict[int, asyncio.Future] = {}
+
+    def _on_done(self, update_id: int, handler: str):
+        future = self._done.pop(update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    # --- Апдейты от имени пользователей ---
+
+    async def send(self, user_id: int, **payload):
+        self._update_id += 1
+        update_id = self._update_id
+        future = self._done[update_id] = asyncio.get_running_loop().create_future()
+
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+        if 'callback_data' in payload:
+            message = {'message_id': payload['panel_message_id'], 'date': int(time.time()),
+                       'chat': {'id': user_id, 'type': 'private'}, 'from': {'id': 1, 'is_bot': True,
+                                                                             'first_name': 'Bench bot'},
+                       'text': 'panel'}
+            update = {'update_id': update_id, 'callback_query': {'id': str(update_id), 'from': user,
+                                                                  'chat_instance': str(user_id),
+                                                                  'data': payload['callback_data'],
+                                                                  'message': message}}
+        else:
+            message = {'message_id': update_id, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+                       'from': user, **payload}
+            update = {'update_id': update_id, 'message': message}
+
+        self.api.push_update(update)
+        await asyncio.wait_for(future, timeout=60)
+        await asyncio.sleep(self.args.think_time * random.uniform(0.9, 1.2))
+
+    async def worker(self, user_id: int):
+        await self.send(user_id, text='/start')
+        for cycle in range(self.args.cycles):
+            await self.send(user_id, text='Начать работу')
+            await self.send(user_id, location={'latitude': 55.7 + random.random() / 10,
+                                               'longitude': 37.5 + random.random() / 10})
+            await self.send(user_id, text=f'Позиция {user_id}-{cycle}')
+            await self.send(user_id, text='Завершить работу')
+
+    async def admin(self, user_id: int, stop: asyncio.Event):
+        await self.send(user_id, text='/start')
+        panel_message_id = 1_000_000 + user_id
+        from app.keyboards.callbacks import SessionsList, WorkersList, Dashboard, WorkedTimeReport
+
+        screens = [SessionsList().pack(), SessionsList(page=2).pack(), WorkersList().pack(), Dashboard().pack(),
+                   WorkedTimeReport().pack()]
+        while not stop.is_set():
+            for data in screens:
+                await self.send(user_id, callback_data=data, panel_message_id=panel_message_id)
+
+    async def run(self) -> float:
+        stop = asyncio.Event()
+        admins = [asyncio.create_task(self.admin(i, stop)) for i in range(1, self.args.admins + 1)]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(FIRST_WORKER_ID + i) for i in range(self.args.workers)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*admins)
+        return elapsed
+
+    def report(self, elapsed: float):
+        total = self.latency.total
+        print(f'\nАпдейтов: {total} за {elapsed:.1f} с - {total / elapsed:.1f} апдейтов/с')
+        print(f'Работников: {self.args.workers}, администраторов: {self.args.admins}, смен на работника: '
+              f'{self.args.cycles}, задержка API: {self.args.api_latency * 1000:.0f} мс, доля 429: {self.args.rate_429}')
+
+        self.latency.print_table()
+
+        print('\nВызовы Bot API: ' + ', '.join(f'{method}={count}' for method, count in self.api.calls.most_common()))
+        if self.api.throttled:
+            print('Ответы 429: ' + ', '.join(f'{method}={count}' for method, count in self.api.throttled.items()))
+
+
+async def run(args: argparse.Namespace):
+    # Импорты после configure_environment: настройки читаются при импорте app.misc.config
+    from aiogram import Dispatcher
+
+    from benchmarks.fake_bot_api import FakeBotApi
+    from main import setup_dispatcher
+
+    api = FakeBotApi(latency=args.api_latency, rate_429=args.rate_429, geocoder_latency=args.geocoder_latency)
+    await api.start()
+    bot = await prepare_bot(api.base_url)
+
+    driver = LoadDriver(args, api)
+    dp = setup_dispatcher(Dispatcher())
+    dp.update.outer_middleware(driver.latency)
+
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    try:
+        elapsed = await driver.run()
+    finally:
+        await dp.stop_polling()
+        await polling
+        await api.stop()
+
+    driver.report(elapsed)
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as file:
+            json.dump({'updates': driver.latency.total, 'elapsed': elapsed, 'profile': driver.latency.profile()},
+                      file, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment(list(range(1, arguments.admins + 1)))}')
+    from app.misc import runtime
+
+    print(f'Профиль выполнения: {"performance" if runtime.PERFORMANCE else "default"}')
+    runtime.run(run(arguments))
@@ -0,0 +1,102 @@
+"""
+Поиск сессий рядом с точкой (queries.get_sessions_near) на сотнях тысяч сессий во временной БД.
+
+Сессии разбросаны по нескольким городам, доля активных - --active. Для сравнения тот же поиск выполняется
+без индекса: чтение координат всех подходящих сессий и проверка расстояния в Python.
+
+Запуск из корня проекта:
+    python -m benchmarks.nearby --sessions 300000 --queries 200 --radius 2
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import configure_environment, percentile
+
+CITIES = ((55.7558, 37.6173), (59.9386, 30.3141), (56.8389, 60.6057), (55.0084, 82.9357), (45.0355, 38.9753))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Скорость поиска сессий в радиусе')
+    parser.add_argument('--sessions', type=int, default=300_000, help='Количество сессий')
+    parser.add_argument('--active', type=float, default=0.01, help='Доля незавершённых сессий')
+    parser.add_argument('--queries', type=int, default=200, help='Количество запросов каждого вида')
+    parser.add_argument('--radius', type=float, default=2.0, help='Радиус поиска, км')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+async def fill(args: argparse.Namespace, rng: random.Random):
+    from sqlalchemy import insert
+
+    from app.db import models
+    from app.misc import geohash
+
+    await models.ensure_schema()
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.User), [{'telegram_id': 10_000 + i} for i in range(1, 1001)])
+        started_at = datetime(2026, 1, 1)
+        for start in range(0, args.sessions, 10_000):
+            rows = []
+            for number in range(start, min(args.sessions, start + 10_000)):
+                city_lat, city_lon = rng.choice(CITIES)
+                lat, lon = city_lat + rng.gauss(0, 0.15), city_lon + rng.gauss(0, 0.25)
+                is_ended = rng.random() >= args.active
+                created_at = started_at + timedelta(minutes=number)
+                rows.append(dict(user_id=rng.randint(1, 1000), created_at=created_at, geolocation_latitude=lat,
+                                 geolocation_longitude=lon, geohash=geohash.encode(lat, lon), work_position='bench',
+                                 is_ended=is_ended, ended_date=created_at + timedelta(hours=8) if is_ended else None))
+            await conn.execute(insert(models.WorkSession), rows)
+
+
+async def full_scan(latitude: float, longitude: float, radius_km: float, active_only: bool) -> int:
+    from sqlalchemy import select
+
+    from app.db import models
+    from app.misc.geohash import haversine_km
+
+    query = select(models.WorkSession.id, models.WorkSession.geolocation_latitude,
+                   models.WorkSession.geolocation_longitude)
+    if active_only:
+        query = query.where(models.WorkSession.is_ended == False)
+    async with models.session() as session:
+        return sum(haversine_km(latitude, longitude, lat, lon) <= radius_km
+                   for _, lat, lon in await session.execute(query))
+
+
+async def main(args: argparse.Namespace):
+    from app.db import queries
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    await fill(args, rng)
+    print(f'Сессий: {args.sessions}, заполнение {time.perf_counter() - started:.1f} с')
+
+    points = [(city_lat + rng.gauss(0, 0.1), city_lon + rng.gauss(0, 0.2))
+              for city_lat, city_lon in (rng.choice(CITIES) for _ in range(args.queries))]
+
+    print(f'\n{"":<28}{"p50, мс":>10}{"p99, мс":>10}{"найдено в среднем":>20}')
+    for active_only in (True, False):
+        for name, search in (('индекс geohash', queries.get_sessions_near), ('полный перебор', full_scan)):
+            durations, found = [], 0
+            # Полный перебор по всей истории медленный - для него хватит части запросов
+            sample = points if name != 'полный перебор' or active_only else points[:max(1, len(points) // 10)]
+            for lat, lon in sample:
+                started = time.perf_counter()
+                if search is full_scan:
+                    found += await full_scan(lat, lon, args.radius, active_only)
+                else:
+                    found += len(await search(lat, lon, args.radius, active_only=active_only, limit=10 ** 9))
+                durations.append(time.perf_counter() - started)
+            label = f'{name} ({"активные" if active_only else "история"})'
+            print(f'{label:<28}{percentile(durations, 0.5) * 1000:>10.2f}{percentile(durations, 0.99) * 1000:>10.2f}'
+                  f'{found / len(sample):>20.1f}')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment([1])}')
+    asyncio.run(main(arguments))
@@ -0,0 +1,127 @@
+"""
+Сверка смен по плану с сессиями (app.db.planning.reconcile) на десятках тысяч смен во временной БД.
+
+У каждого работника смена каждый день; часть смен пропущена (неявка), часть сессий начата позже или закончена
+раньше плана, часть работы - вне плана. Для сравнения те же итоги считаются перебором: для каждой смены
+проверяются все сессии её работника.
+
+Запуск из корня проекта:
+    python -m benchmarks.planning --workers 500 --days 60
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, date, timedelta
+
+from benchmarks.common import configure_environment
+
+FIRST_DAY = date(2026, 1, 1)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Скорость сверки плана с сессиями')
+    parser.add_argument('--workers', type=int, default=500, help='Количество работников')
+    parser.add_argument('--days', type=int, default=60, help='Дней в плане (по смене на работника в день)')
+    parser.add_argument('--no-show', type=float, default=0.05, help='Доля смен без сессий')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+async def fill(args: argparse.Namespace, rng: random.Random):
+    from sqlalchemy import insert
+
+    from app.db import models
+
+    await models.ensure_schema()
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.User), [{'telegram_id': 10_000 + i} for i in range(1, args.workers + 1)])
+        plans, sessions = [], []
+        for user_id in range(1, args.workers + 1):
+            for day in range(args.days):
+                starts_at = datetime.combine(FIRST_DAY + timedelta(days=day), datetime.min.time()) \
+                    + timedelta(hours=rng.choice((6, 8, 9, 14)))
+                ends_at = starts_at + timedelta(hours=8)
+                plans.append({'user_id': user_id, 'starts_at': starts_at, 'ends_at': ends_at})
+                if rng.random() < args.no_show:
+                    continue
+                sessions.append(dict(user_id=user_id, created_at=starts_at + timedelta(minutes=rng.randint(-10, 30)),
+                                     ended_date=ends_at + timedelta(minutes=rng.randint(-45, 60)), is_ended=True,
+                                     geolocation_latitude=55.75, geolocation_longitude=37.61, work_position='bench'))
+        for rows, table in ((plans, models.PlannedShift), (sessions, models.WorkSession)):
+            for start in range(0, len(rows), 10_000):
+                await conn.execute(insert(table), rows[start:start + 10_000])
+    return len(plans), len(sessions)
+
+
+async def brute_force(first_day: date, last_day: date, grace: timedelta) -> tuple[int, int, int, int]:
+    """(опозданий, ранних уходов, неявок, секунд вне плана) перебором всех пар смена - сессия работника."""
+    from sqlalchemy import select
+
+    from app.db import models
+    from app.db.rollups import local_offset
+
+    period_start = datetime.combine(first_day, datetime.min.time()) - local_offset()
+    period_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time()) - local_offset()
+    async with models.session() as session:
+        plans = (await session.execute(select(models.PlannedShift.user_id, models.PlannedShift.starts_at,
+                                              models.PlannedShift.ends_at))).all()
+        sessions = (await session.execute(select(models.WorkSession.user_id, models.WorkSession.created_at,
+                                                 models.WorkSession.ended_date))).all()
+
+    late = early = no_shows = unplanned = 0
+    by_user: dict[int, list] = {}
+    for user_id, start, end in sessions:
+        by_user.setdefault(user_id, []).append([start, end, timedelta()])
+    for user_id, starts_at, ends_at in plans:
+        matched = []
+        for item in by_user.get(user_id, []):
+            start, end = max(item[0], starts_at), min(item[1], ends_at)
+            if end > start:
+                item[2] += end - start
+                matched.append((start, end))
+        if not period_start <= starts_at < period_end:
+            continue
+        if not matched:
+            no_shows += 1
+            continue
+        late += min(start for start, _ in matched) - starts_at > grace
+        early += ends_at - max(end for _, end in matched) > grace
+    for items in by_user.values():
+        unplanned += sum(int((end - start - cover).total_seconds()) for start, end, cover in items
+                         if period_start <= start < period_end)
+    return late, early, no_shows, unplanned
+
+
+async def main(args: argparse.Namespace):
+    from app.db import planning
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    plans, sessions = await fill(args, rng)
+    print(f'Смен: {plans}, сессий: {sessions}, заполнение {time.perf_counter() - started:.1f} с')
+
+    first_day, last_day, grace = FIRST_DAY, FIRST_DAY + timedelta(days=args.days - 1), timedelta(minutes=5)
+    started = time.perf_counter()
+    summaries = await planning.reconcile(first_day, last_day, grace)
+    sweep_seconds = time.perf_counter() - started
+    totals = (sum(s.late for s in summaries), sum(s.early_leaves for s in summaries),
+              sum(s.no_shows for s in summaries), sum(s.unplanned_seconds for s in summaries))
+
+    started = time.perf_counter()
+    expected = await brute_force(first_day, last_day, grace)
+    brute_seconds = time.perf_counter() - started
+
+    print(f'\n{"":<24}{"время, с":>10}{"опозданий":>12}{"ранних уходов":>16}{"неявок":>10}{"вне плана, ч":>15}')
+    for name, seconds, (late, early, no_shows, unplanned) in (('заметающая прямая', sweep_seconds, totals),
+                                                               ('перебор', brute_seconds, expected)):
+        print(f'{name:<24}{seconds:>10.2f}{late:>12}{early:>16}{no_shows:>10}{unplanned / 3600:>15.1f}')
+    if totals != expected:
+        print('Итоги не совпадают!')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment([1])}')
+    asyncio.run(main(arguments))
@@ -0,0 +1,53 @@
+"""
+Сравнение профилей выполнения (RUNTIME_PROFILE=default / performance) на нагрузочном тесте benchmarks.load.
+
+Каждый профиль запускается в отдельном процессе с одинаковыми параметрами нагрузки (остальные аргументы передаются
+в benchmarks.load как есть), затем печатается пропускная способность и p50/p99 по обработчикам для обоих режимов.
+
+Запуск из корня проекта:
+    python -m benchmarks.profiles --workers 50 --cycles 2 --api-latency 0.02
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROFILES = ('default', 'performance')
+
+
+def run_load(profile: str, load_args: list[str]) -> dict:
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as file:
+        out = file.name
+    try:
+        subprocess.run([sys.executable, '-m', 'benchmarks.load', *load_args, '--json-out', out], check=True,
+                       env={**os.environ, 'RUNTIME_PROFILE': profile}, stdout=subprocess.DEVNULL)
+        with open(out, encoding='utf-8') as file:
+            return json.load(file)
+    finally:
+        os.remove(out)
+
+
+def main(load_args: list[str]):
+    results = {}
+    for profile in PROFILES:
+        print(f'Профиль {profile}...', flush=True)
+        results[profile] = run_load(profile, load_args)
+
+    print(f'\n{"":<44}' + ''.join(f'{profile:>24}' for profile in PROFILES))
+    print(f'{"апдейтов/с":<44}' + ''.join(f'{result["updates"] / result["elapsed"]:>24.1f}'
+                                          for result in results.values()))
+
+    handlers = sorted(set().union(*(result['profile'] for result in results.values())))
+    print(f'\n{"Обработчик, p50 / p99 мс":<44}' + ''.join(f'{profile:>24}' for profile in PROFILES))
+    for handler in handlers:
+        cells = []
+        for result in results.values():
+            stats = result['profile'].get(handler)
+            cells.append(f'{stats["p50"] * 1000:.1f} / {stats["p99"] * 1000:.1f}' if stats else '-')
+        print(f'{handler:<44}' + ''.join(f'{cell:>24}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
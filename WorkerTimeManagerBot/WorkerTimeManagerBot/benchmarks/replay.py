@@ -0,0 +1,199 @@
+"""
+Воспроизведение записанных апдейтов (RECORD_UPDATES_FILE, см. app.misc.recorder) на временной БД.
+
+Апдейты подаются в настоящий Dispatcher в исходном порядке: с исходными интервалами (--speed 1), ускоренно
+(--speed 10) или подряд без пауз (--speed 0). Апдейты одного чата всегда обрабатываются строго по очереди,
+поэтому итоговое состояние БД не зависит от скорости. Апдейты, которые при записи никуда не попали (в том числе
+отброшенные троттлингом), пропускаются, а троттлинг при воспроизведении выключен.
+
+Проверки (код возврата 1, если что-то не сошлось):
+- --expect-state: итоговое состояние БД совпадает с сохранённым ранее через --save-state;
+- --compare-profile: p50/p99 по обработчикам не хуже сохранённого через --save-profile более чем на --tolerance;
+- обработчик каждого апдейта совпадает с записанным (иначе изменилась маршрутизация).
+
+Пример сравнения двух коммитов:
+    python -m benchmarks.replay updates.jsonl --speed 0 --save-state state.json --save-profile base.json
+    git checkout <новый коммит>
+    python -m benchmarks.replay updates.jsonl --speed 0 --expect-state state.json --compare-profile base.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from collections import defaultdict
+
+from benchmarks.common import configure_environment, prepare_bot, LatencyRecorder
+
+MIN_SAMPLES = 5  # Меньше замеров - сравнение p50/p99 ничего не значит
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Воспроизведение записанных апдейтов на временной БД')
+    parser.add_argument('recording', help='JSONL-файл, записанный через RECORD_UPDATES_FILE')
+    parser.add_argument('--speed', type=float, default=1.0, help='Ускорение (1 - исходный темп, 0 - без пауз)')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Задержка ответа Bot API, с')
+    parser.add_argument('--geocoder-latency', type=float, default=0.0, help='Задержка ответа геокодера, с')
+    parser.add_argument('--save-state', help='Сохранить итоговое состояние БД в файл')
+    parser.add_argument('--expect-state', help='Сравнить итоговое состояние БД с файлом')
+    parser.add_argument('--save-profile', help='Сохранить профиль задержек в файл')
+    parser.add_argument('--compare-profile', help='Сравнить профиль задержек с файлом')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение p50/p99 (0.2 = 20%%)')
+    return parser.parse_args()
+
+
+def read_recording(path: str) -> tuple[dict, list[dict]]:
+    header, records = {}, []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'header' in record:
+                # Файл мог дописываться несколькими запусками бота: учитываем последний заголовок
+                header = record['header']
+            else:
+                records.append(record)
+    records.sort(key=lambda record: record['offset'])
+    return header, records
+
+
+def chat_id(update: dict) -> int:
+    event = update.get('message') or update.get('edited_message') or update.get('callback_query') or {}
+    user = event.get('from') or event.get('chat') or {}
+    return user.get('id', 0)
+
+
+async def database_state() -> dict:
+    """Состояние БД без полей, зависящих от времени воспроизведения (даты начала/конца сессий)."""
+    from sqlalchemy import select
+
+    from app.db import models
+
+    async with models.session() as session:
+        users = (await session.scalars(select(models.User.telegram_id).order_by(models.User.telegram_id))).all()
+        rows = (await session.execute(
+            select(models.User.telegram_id, models.WorkSession.work_position, models.WorkSession.hour_kopecks_rate,
+                   models.WorkSession.is_ended, models.WorkSession.geolocation_latitude,
+                   models.WorkSession.geolocation_longitude)
+            .join(models.User, models.User.id == models.WorkSession.user_id)
+        )).all()
+
+    return {'users': list(users), 'sessions': sorted([list(row) for row in rows], key=repr)}
+
+
+def compare_profiles(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for handler, stats in current.items():
+        base = baseline.get(handler)
+        if base is None or min(base['count'], stats['count']) < MIN_SAMPLES:
+            continue
+        for key in ('p50', 'p99'):
+            if stats[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{handler}: {key} {base[key] * 1000:.1f} -> {stats[key] * 1000:.1f} мс')
+    return regressions
+
+
+async def replay(args: argparse.Namespace, records: list[dict]) -> tuple[list[str], LatencyRecorder, float]:
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+
+    from app.db.audit import audit_writer
+    from benchmarks.fake_bot_api import FakeBotApi
+    from main import setup_dispatcher
+
+    api = FakeBotApi(latency=args.api_latency, geocoder_latency=args.geocoder_latency)
+    await api.start()
+    bot = await prepare_bot(api.base_url)
+
+    replayed_handlers: dict[int, str] = {}
+    latency = LatencyRecorder(on_done=replayed_handlers.__setitem__)
+    dp = setup_dispatcher(Dispatcher(), throttling=False)
+    dp.update.outer_middleware(latency)
+
+    records = [record for record in records if record['handler'] != 'unhandled']
+    chat_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def feed(record: dict, lock: asyncio.Lock):
+        async with lock:
+            await dp.feed_update(bot, Update.model_validate(record['update'], context={'bot': bot}))
+
+    tasks = []
+    try:
+        for record in records:
+            lock = chat_locks[chat_id(record['update'])]
+            if args.speed <= 0:
+                await feed(record, lock)
+                continue
+            delay = started + record['offset'] / args.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Блокировка берётся в порядке создания задач, поэтому очередь внутри одного чата сохраняется
+            tasks.append(asyncio.create_task(feed(record, lock)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+    finally:
+        await audit_writer.close()
+        await bot.session.close()
+        await api.stop()
+
+    mismatches = [f'апдейт {record["update"]["update_id"]}: записан {record["handler"]}, '
+                  f'сейчас {replayed_handlers.get(record["update"]["update_id"], "не обработан")}'
+                  for record in records
+                  if replayed_handlers.get(record['update']['update_id']) != record['handler']]
+    return mismatches, latency, elapsed
+
+
+async def run(args: argparse.Namespace, records: list[dict]) -> int:
+    mismatches, latency, elapsed = await replay(args, records)
+
+    failed = False
+    print(f'\nВоспроизведено апдейтов: {latency.total} за {elapsed:.1f} с - {latency.total / elapsed:.1f} апдейтов/с')
+    latency.print_table()
+
+    if mismatches:
+        failed = True
+        print(f'\nОбработчик изменился у {len(mismatches)} апдейтов:')
+        print('\n'.join(f'  {line}' for line in mismatches[:20]))
+
+    state = await database_state()
+    if args.save_state:
+        with open(args.save_state, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False, indent=1)
+    if args.expect_state:
+        with open(args.expect_state, encoding='utf-8') as file:
+            expected = json.load(file)
+        if expected != state:
+            failed = True
+            print(f'\nСостояние БД отличается от {args.expect_state}: пользователей {len(state["users"])} '
+                  f'(ожидалось {len(expected["users"])}), сессий {len(state["sessions"])} '
+                  f'(ожидалось {len(expected["sessions"])})')
+        else:
+            print('\nСостояние БД совпадает с ожидаемым')
+
+    profile = latency.profile()
+    if args.save_profile:
+        with open(args.save_profile, 'w', encoding='utf-8') as file:
+            json.dump(profile, file, ensure_ascii=False, indent=1)
+    if args.compare_profile:
+        with open(args.compare_profile, encoding='utf-8') as file:
+            regressions = compare_profiles(json.load(file), profile, args.tolerance)
+        if regressions:
+            failed = True
+            print(f'\nЗамедление больше {args.tolerance:.0%}:')
+            print('\n'.join(f'  {line}' for line in regressions))
+        else:
+            print(f'\nЗамедлений больше {args.tolerance:.0%} нет')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    recording_header, recorded = read_recording(arguments.recording)
+    print(f'Временные данные: {configure_environment(recording_header.get("admins", []))}')
+    from app.misc import runtime
+
+    sys.exit(runtime.run(run(arguments, recorded)))
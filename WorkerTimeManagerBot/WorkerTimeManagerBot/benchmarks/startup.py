@@ -0,0 +1,124 @@
+"""
+Время холодного старта бота: импорт main и подготовка к приёму апдейтов (схема БД, дашборд, команды бота).
+
+Импорт измеряется в отдельных процессах (python -X importtime), поэтому кэш модулей не влияет на результат.
+Подготовка измеряется на временной БД и локальной замене Bot API в трёх вариантах:
+- первый запуск: пустая БД, создаются таблицы и регистрируются команды;
+- перезапуск: схема и команды уже на месте (основной сценарий - подъём после падения);
+- прежний путь для сравнения: create_all + set_my_commands при каждом запуске.
+
+Запуск из корня проекта:
+    python -m benchmarks.startup --repeat 5 --api-latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import configure_environment, percentile
+
+# Модули, которые не должны загружаться при старте (только при первом использовании)
+LAZY_MODULES = ('geopy', 'aiohttp.web', 'pyarrow')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Время импорта и запуска бота')
+    parser.add_argument('--repeat', type=int, default=5, help='Количество повторов каждого замера')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых долгих модулей показать')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='Задержка ответа Bot API, с')
+    return parser.parse_args()
+
+
+def measure_import() -> tuple[float, dict[str, tuple[float, float]]]:
+    """Импорт main в новом процессе: (общее время, {модуль: (собственное, с вложенными)}) в секундах."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], env=os.environ,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line.removeprefix('import time:').split('|')
+        modules[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return modules['main'][1], modules
+
+
+def report_import(args: argparse.Namespace):
+    runs = [measure_import() for _ in range(args.repeat)]
+    totals = [total for total, _ in runs]
+    _, modules = min(runs, key=lambda run: run[0])
+
+    print(f'\nИмпорт main: p50 {percentile(totals, 0.5) * 1000:.0f} мс, лучший {min(totals) * 1000:.0f} мс')
+    print(f'\n{"Пакет верхнего уровня":<40}{"с вложенными, мс":>18}')
+    top_level = {}
+    for name, (_, cumulative) in modules.items():
+        root = name.split('.')[0]
+        if root != 'main':
+            top_level[root] = max(top_level.get(root, 0.0), cumulative)
+    for name, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{name:<40}{cumulative * 1000:>18.1f}')
+
+    print(f'\n{"Модуль приложения":<40}{"собственное, мс":>18}')
+    app_modules = [(name, own) for name, (own, _) in modules.items() if name.split('.')[0] in ('app', 'main')]
+    for name, own in sorted(app_modules, key=lambda item: -item[1])[:args.top]:
+        print(f'{name:<40}{own * 1000:>18.1f}')
+
+    loaded = [name for name in LAZY_MODULES if name in modules]
+    print('\nЛенивые зависимости при старте: ' + (f'загружены {", ".join(loaded)}' if loaded else 'не загружаются'))
+
+
+async def measure_startup(args: argparse.Namespace):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import BotCommand
+
+    from app.db import models
+    from app.misc.config import BOT_COMMANDS
+    from app.misc.live_stats import live_stats
+    from benchmarks.common import BENCH_TOKEN
+    from benchmarks.fake_bot_api import FakeBotApi
+    from main import register_commands
+
+    api = FakeBotApi(latency=args.api_latency)
+    await api.start()
+    bot = Bot(BENCH_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+
+    async def new_path():
+        await models.ensure_schema()
+        await asyncio.gather(live_stats.seed(), register_commands(bot))
+
+    async def old_path():
+        await models.create_tables()
+        await live_stats.seed()
+        await bot.set_my_commands([BotCommand(command=cmd, description=desc) for cmd, desc in BOT_COMMANDS.items()])
+
+    async def timed(step) -> float:
+        started = time.perf_counter()
+        await step()
+        return time.perf_counter() - started
+
+    try:
+        first = await timed(new_path)
+        commands_first = api.calls['setMyCommands']
+        restarts = [await timed(new_path) for _ in range(args.repeat)]
+        commands_restarts = api.calls['setMyCommands'] - commands_first
+        old = [await timed(old_path) for _ in range(args.repeat)]
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+    print(f'\n{"Подготовка к приёму апдейтов":<40}{"p50, мс":>10}{"max, мс":>10}')
+    print(f'{"первый запуск (пустая БД)":<40}{first * 1000:>10.1f}{first * 1000:>10.1f}')
+    print(f'{"перезапуск":<40}{percentile(restarts, 0.5) * 1000:>10.1f}{max(restarts) * 1000:>10.1f}')
+    print(f'{"create_all + set_my_commands":<40}{percentile(old, 0.5) * 1000:>10.1f}{max(old) * 1000:>10.1f}')
+    print(f'\nsetMyCommands: при первом запуске {commands_first}, при {args.repeat} перезапусках {commands_restarts}')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment([1])}')
+    report_import(arguments)
+    asyncio.run(measure_startup(arguments))
@@ -0,0 +1,98 @@
+"""
+Счётчик в сообщениях активных смен (app.misc.ticker): тысячи смен на одной фоновой задаче.
+
+Смены во временной БД начаты в случайные моменты последних часов; Bot API и геокодер - локальная замена
+(benchmarks/fake_bot_api.py) с задержкой --api-latency. Счётчик правит сообщения раз в --interval секунд при лимите
+--edits-per-second. Печатается, сколько правок сделано и сколько положено по сетке, на сколько правка опоздала
+относительно своего шага сетки и сколько процессорного времени ушло на одну правку (вместе с Bot API-заменой,
+которая работает в том же процессе).
+
+Запуск из корня проекта:
+    python -m benchmarks.ticker --sessions 5000 --interval 60 --seconds 30
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, UTC
+
+from benchmarks.common import configure_environment, prepare_bot, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Нагрузка на счётчик активных смен')
+    parser.add_argument('--sessions', type=int, default=5000, help='Количество активных смен')
+    parser.add_argument('--interval', type=int, default=60, help='TICKER_INTERVAL_SECONDS')
+    parser.add_argument('--edits-per-second', type=float, default=100.0, help='TICKER_EDITS_PER_SECOND')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='Задержка ответа Bot API, с')
+    parser.add_argument('--seconds', type=float, default=30.0, help='Длительность замера')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def lateness_recorder(interval: int, started: dict[int, float], lateness: list[float]):
+    """Middleware сессии бота: на сколько правка опоздала относительно последнего шага сетки своей смены."""
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    from aiogram.methods import EditMessageText
+
+    class LatenessRecorder(BaseRequestMiddleware):
+        async def __call__(self, make_request, bot, method):
+            if isinstance(method, EditMessageText):
+                lateness.append((time.time() - started[method.message_id]) % interval)
+            return await make_request(bot, method)
+
+    return LatenessRecorder()
+
+
+async def main(args: argparse.Namespace):
+    from sqlalchemy import insert
+
+    from app.db import models
+    from app.misc.ticker import session_ticker
+    from benchmarks.fake_bot_api import FakeBotApi
+
+    rng = random.Random(args.seed)
+    api = FakeBotApi(latency=args.api_latency)
+    await api.start()
+    bot = await prepare_bot(api.base_url)
+    now = datetime.now(UTC).replace(tzinfo=None)
+    starts = [now - timedelta(seconds=rng.uniform(0, 8 * 3600)) for _ in range(args.sessions)]
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.User), [{'telegram_id': 10_000 + i} for i in range(args.sessions)])
+        await conn.execute(insert(models.WorkSession), [
+            dict(user_id=i + 1, created_at=started, geolocation_latitude=55.75, geolocation_longitude=37.6,
+                 work_position='bench', hour_kopecks_rate=50_000, old_message_id=i + 1)
+            for i, started in enumerate(starts)])
+
+    lateness = []
+    bot.session.middleware(lateness_recorder(
+        args.interval, {i + 1: started.replace(tzinfo=UTC).timestamp() for i, started in enumerate(starts)}, lateness))
+    started = time.perf_counter()
+    await session_ticker.start(bot)
+    print(f'Расписание построено за {(time.perf_counter() - started) * 1000:.0f} мс, '
+          f'фоновых задач: 1, смен: {args.sessions}')
+
+    cpu_started = time.process_time()
+    await asyncio.sleep(args.seconds)
+    cpu = time.process_time() - cpu_started
+    await session_ticker.stop()
+    await bot.session.close()
+    await api.stop()
+
+    edits = len(lateness)
+    expected = min(args.sessions * args.seconds / args.interval, args.edits_per_second * args.seconds)
+    print(f'Правок: {edits} (по сетке и лимиту - {expected:.0f})')
+    print(f'Опоздание правки от шага сетки: p50 {percentile(lateness, 0.5) * 1000:.0f} мс, '
+          f'p99 {percentile(lateness, 0.99) * 1000:.0f} мс')
+    print(f'Процессорное время на правку: {cpu / max(edits, 1) * 1e6:.0f} мкс '
+          f'(загрузка процесса {cpu / args.seconds:.0%})')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment([1])}')
+    os.environ['TICKER_INTERVAL_SECONDS'] = str(arguments.interval)
+    os.environ['TICKER_EDITS_PER_SECOND'] = str(arguments.edits_per_second)
+    asyncio.run(main(arguments))
@@ -0,0 +1,83 @@
+"""
+Запись маршрутов смен (app.db.tracks) во временную БД: поток точек трансляции геопозиции от многих работников.
+
+Каждый работник присылает точку раз в --interval секунд (время моделируется, ждать не нужно) и медленно
+движется со случайными остановками. Печатается время обработки точки, доля сохранённых после прореживания,
+размер хранения на точку и время записи пачки; точки одной сессии сверяются после декодирования.
+
+Запуск из корня проекта:
+    python -m benchmarks.tracks --workers 500 --hours 8
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import configure_environment, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Скорость записи маршрутов смен')
+    parser.add_argument('--workers', type=int, default=500, help='Количество работников на смене')
+    parser.add_argument('--hours', type=float, default=8.0, help='Длительность смены, ч')
+    parser.add_argument('--interval', type=int, default=5, help='Как часто приходит точка, с')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
+    from sqlalchemy import insert, func, select
+
+    from app.db import models, tracks
+
+    rng = random.Random(args.seed)
+    await models.ensure_schema()
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.User), [{'telegram_id': 10_000 + i} for i in range(args.workers)])
+        await conn.execute(insert(models.WorkSession), [
+            dict(user_id=i + 1, geolocation_latitude=55.75, geolocation_longitude=37.6, work_position='bench')
+            for i in range(args.workers)])
+
+    tracker = tracks.RouteTracker()
+    positions = {10_000 + i: [55.75 + rng.uniform(-0.05, 0.05), 37.6 + rng.uniform(-0.05, 0.05)]
+                 for i in range(args.workers)}
+    started_at = int(time.time())
+    steps = int(args.hours * 3600 / args.interval)
+    durations, flushes, sent = [], [], []
+
+    for step in range(steps):
+        timestamp = started_at + step * args.interval
+        for telegram_id, position in positions.items():
+            if rng.random() < 0.5:  # Половину времени работник стоит на месте
+                position[0] += rng.gauss(0, 0.00005)
+                position[1] += rng.gauss(0, 0.00008)
+            started = time.perf_counter()
+            await tracker.ingest(telegram_id, timestamp, position[0], position[1])
+            durations.append(time.perf_counter() - started)
+        sent.append(len(positions))
+        # Запись пачки по моделируемому времени, как при TRACK_FLUSH_SECONDS = 120
+        if (step + 1) * args.interval % 120 == 0 or step == steps - 1:
+            started = time.perf_counter()
+            await tracker.flush(force=step == steps - 1)
+            flushes.append(time.perf_counter() - started)
+
+    async with models.session() as session:
+        stored, encoded = (await session.execute(select(func.sum(models.SessionTrack.points),
+                                                        func.sum(models.SessionTrack.encoded_bytes)))).one()
+    total = sum(sent)
+    print(f'Точек пришло: {total}, сохранено после прореживания: {stored} ({stored / total:.1%})')
+    print(f'Обработка точки: p50 {percentile(durations, 0.5) * 1e6:.1f} мкс, '
+          f'p99 {percentile(durations, 0.99) * 1e6:.1f} мкс')
+    print(f'Запись пачки ({args.workers} сессий): p50 {percentile(flushes, 0.5) * 1000:.1f} мс, '
+          f'max {max(flushes) * 1000:.1f} мс')
+    print(f'Хранение: {encoded / stored:.1f} Б на точку (без кодирования - 24 Б: три 8-байтных числа)')
+
+    points = await tracks.load_points(1)
+    print(f'Сессия 1 после декодирования: {len(points)} точек, первая {points[0]}, последняя {points[-1]}')
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    print(f'Временные данные: {configure_environment([1])}')
+    asyncio.run(main(arguments))
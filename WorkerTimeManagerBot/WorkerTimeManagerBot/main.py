@@ -1,4 +1,6 @@
 import asyncio
+import hashlib
+import json
 import logging
 
 from aiogram import Bot, Dispatcher
@@ -6,38 +8,114 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramAPIError
 from aiogram.types import BotCommand
-from pydantic.v1 import ValidationError
+from pydantic import ValidationError
 
-from app.db.models import create_tables
+from app.db.audit import audit_writer
+from app.db.tracks import route_tracker
+from app.db import queries
+from app.db.models import ensure_schema
 from app.handlers import routers
 from app.misc.config import settings, BOT_COMMANDS, private_logger
-from app.misc.middlewares import ThrottlingMiddleware
+from app.misc.live_stats import live_stats
+from app.misc.ticker import session_ticker
+from app.misc.sweeper import session_sweeper
+from app.misc import gazetteer, runtime
+from app.misc.metrics import start_metrics_server
+from app.misc.guard import watchdog
+from app.misc.middlewares import ThrottlingMiddleware, AuditActorMiddleware, MetricsMiddleware, HandlerNameMiddleware, \
+    BotApiMetricsMiddleware, GuardMiddleware, UpdateRecorderMiddleware
+from app.misc.recorder import create_recorder
 
 # Нежелательно использовать из других модулей
 _dp = Dispatcher()
 
 
+def setup_dispatcher(dp: Dispatcher, throttling: bool = True) -> Dispatcher:
+    """
+    Роутеры и middleware бота. Вынесено отдельно, чтобы тот же набор использовали нагрузочные тесты (benchmarks/).
+    :param throttling: False - без ThrottlingMiddleware (воспроизведение записанных апдейтов в ускоренном темпе)
+    """
+    dp.include_routers(*routers)
+    if throttling:
+        dp.message.middleware(ThrottlingMiddleware())
+        dp.callback_query.middleware(ThrottlingMiddleware())
+    # Автор изменений для журнала действий; при остановке дописываем накопленные события
+    dp.update.outer_middleware(AuditActorMiddleware())
+    dp.shutdown.register(audit_writer.close)
+    # Точки маршрутов смен тоже пишутся пачками: при остановке дописываем
+    dp.shutdown.register(route_tracker.close)
+
+    # Время обработки апдейтов, запросов к БД и Bot API; отдаётся на METRICS_PORT (если задан)
+    dp.update.outer_middleware(MetricsMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.edited_message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+    # Только для разработки: лимиты запросов и вызовов Bot API на один апдейт
+    if settings.GUARD_MODE != 'off':
+        dp.update.outer_middleware(GuardMiddleware())
+    # Запись апдейтов для benchmarks/replay.py (если задан RECORD_UPDATES_FILE)
+    if (recorder := create_recorder()) is not None:
+        dp.update.outer_middleware(UpdateRecorderMiddleware(recorder))
+        dp.shutdown.register(recorder.close)
+    return dp
+
+
+async def register_commands(bot: Bot) -> bool:
+    """
+    Вызывает set_my_commands, только если BOT_COMMANDS (или сам бот) изменились с прошлого запуска.
+    :return: True, если команды были отправлены в Telegram
+    """
+    commands_hash = hashlib.sha256(json.dumps([bot.id, BOT_COMMANDS], ensure_ascii=False, sort_keys=True)
+                                   .encode()).hexdigest()
+    if await queries.get_meta('bot_commands_hash') == commands_hash:
+        return False
+
+    await bot.set_my_commands([BotCommand(command=cmd, description=desc) for cmd, desc in BOT_COMMANDS.items()])
+    await queries.set_meta('bot_commands_hash', commands_hash)
+    return True
+
+
 async def main():
     # Устанавливаем уровень логирования: рекомендую "INFO" (стоит по умолчанию)
     logging.basicConfig(level=settings.LOGGING_LEVEL)
 
-    # Создаём БД / Таблицы (если ещё не созданы). Можно удалить, ибо всё равно управляется через alembic
-    await create_tables()
+    # Создаём / обновляем таблицы, только если версия схемы в БД устарела (обычно это один запрос к app_meta)
+    await ensure_schema()
 
     # DefaultBotProperties неизменчивы, ибо в текущей конфигурации смысла настраивать управление столь мелкими деталями
     # нет, это лишь увеличит объёмы кода и усложнит задачу
-    bot = Bot(settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    await bot.set_my_commands([BotCommand(command=cmd, description=desc) for cmd, desc in BOT_COMMANDS.items()])
+    # Сессия (event loop, JSON, пул соединений) зависит от RUNTIME_PROFILE, см. app.misc.runtime
+    bot = Bot(settings.BOT_TOKEN, session=runtime.create_bot_session(),
+              default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(BotApiMetricsMiddleware())
+    # Единственная загрузка данных для дашборда (дальше он обновляется по событиям без запросов к БД) и расписание
+    # счётчиков в сообщениях активных смен строятся параллельно с регистрацией команд - после падения бот должен
+    # подняться как можно быстрее
+    await asyncio.gather(live_stats.seed(), session_ticker.start(bot), register_commands(bot))
+    # Справочник офлайн-геокодера строится заранее, чтобы первая отметка на смене не ждала загрузки файла
+    if settings.GEOCODER_BACKEND == 'offline':
+        await asyncio.to_thread(gazetteer.get_gazetteer)
 
-    _dp.include_routers(*routers)
-    _dp.message.middleware(ThrottlingMiddleware())
-    _dp.callback_query.middleware(ThrottlingMiddleware())
-    await _dp.start_polling(bot)
+    setup_dispatcher(_dp)
+    _dp.shutdown.register(session_ticker.stop)
+    # Закрытие забытых смен: в нескольких копиях бота работает только у владельца аренды
+    session_sweeper.start(bot)
+    _dp.shutdown.register(session_sweeper.stop)
+    # Только для разработки: слежение за блокировками event loop (лимиты на апдейт - в setup_dispatcher)
+    if settings.GUARD_MODE != 'off':
+        watchdog.start()
+        _dp.shutdown.register(watchdog.stop)
+    metrics_runner = await start_metrics_server()
+    try:
+        await _dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        runtime.run(main())
     except KeyboardInterrupt:
         pass
     except ValidationError as e:
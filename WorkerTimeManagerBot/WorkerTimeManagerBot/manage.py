@@ -0,0 +1,206 @@
+"""
+Служебные команды проекта, которые запускаются рядом с ботом (не вместо него).
+
+Пример: python manage.py export --out exports --format parquet
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.misc.config import private_logger, settings
+
+
+async def cmd_export(args: argparse.Namespace):
+    from app.db.export import export_history
+
+    result = await export_history(args.out, args.format, full=args.full, chunk_size=args.chunk_size)
+    private_logger.info(f'Выгрузка в {args.out} завершена: сессий {result["sessions_exported"]}, '
+                        f'пользователей {result["users_exported"]}')
+
+
+async def cmd_rebuild_rollups(args: argparse.Namespace):
+    from app.db import rollups
+    from app.db.models import ensure_schema
+
+    await ensure_schema()
+    mismatches = await rollups.rebuild(check_only=args.check)
+    action = 'Сверка' if args.check else 'Пересборка'
+    private_logger.info(f'{action} rollup-таблиц завершена, расхождений: по часам {mismatches["hourly"]}, '
+                        f'по дням {mismatches["daily"]}')
+
+
+async def cmd_import_sites(args: argparse.Namespace):
+    import json
+
+    from app.db import queries
+    from app.db.models import ensure_schema
+    from app.misc.geofence import sites_from_geojson
+
+    await ensure_schema()
+    with open(args.file, encoding='utf-8') as file:
+        sites = await queries.add_work_sites(sites_from_geojson(json.load(file), args.radius))
+    private_logger.info(f'Добавлено рабочих площадок: {len(sites)} (бот подхватит их в течение '
+                        f'{settings.GEOFENCE_RELOAD_SECONDS} с)')
+
+
+async def cmd_list_sites(args: argparse.Namespace):
+    from app.db import queries
+    from app.db.models import ensure_schema
+
+    await ensure_schema()
+    for site in await queries.get_work_sites():
+        shape = f'многоугольник из {len(site.polygon)} вершин' if site.polygon else 'круг'
+        print(f'{site.id}\t{site.name}\t{shape}, радиус {site.radius_m:.0f} м, '
+              f'{site.latitude:.6f} {site.longitude:.6f}')
+
+
+async def cmd_remove_site(args: argparse.Namespace):
+    from app.db import queries
+
+    if await queries.delete_work_site(args.id):
+        private_logger.info(f'Рабочая площадка {args.id} удалена')
+    else:
+        private_logger.warning(f'Рабочая площадка {args.id} не найдена')
+
+
+async def cmd_set_close_time(args: argparse.Namespace):
+    from app.db import queries
+    from app.db.models import ensure_schema
+    from app.misc.sweeper import parse_minute
+
+    await ensure_schema()
+    minute = None if args.time == 'off' else parse_minute(args.time)
+    target = f'площадки {args.site}' if args.site is not None else f'работника {args.worker}'
+    if await queries.set_close_minute(minute, site_id=args.site, telegram_id=args.worker):
+        private_logger.info(f'Время автоматического закрытия смен {target}: {args.time}')
+    else:
+        private_logger.warning(f'Не удалось задать время закрытия смен {target}: не найдено')
+
+
+async def cmd_check_overlaps(args: argparse.Namespace):
+    from app.db import models, overlaps
+
+    await models.ensure_schema()
+    found = 0
+    async with models.session() as db_session:
+        async for kind, session_id, other_id in overlaps.scan(db_session):
+            found += 1
+            if kind == 'negative':
+                print(f'{session_id}\tконец раньше начала')
+            else:
+                print(f'{session_id}\tпересекается с {other_id}')
+    private_logger.info(f'Проверка пересечений сессий завершена, найдено: {found}')
+
+
+async def cmd_import_shifts(args: argparse.Namespace):
+    from app.db import planning
+    from app.db.models import ensure_schema
+
+    await ensure_schema()
+    try:
+        with open(args.file, encoding='utf-8-sig', newline='') as file:
+            count = await planning.import_shifts(planning.parse_rows(file))
+    except planning.PlanImportError as e:
+        for error in e.errors[:args.max_errors]:
+            print(error)
+        private_logger.warning(f'План из {args.file} не загружен: {e}')
+        return
+    private_logger.info(f'Загружено смен по плану: {count}')
+
+
+async def cmd_reconcile_shifts(args: argparse.Namespace):
+    import csv
+    from datetime import date, timedelta
+
+    from app.db import planning
+    from app.db.models import ensure_schema
+    from app.misc.rendering import format_local
+
+    await ensure_schema()
+    summaries = await planning.reconcile(date.fromisoformat(args.first_day), date.fromisoformat(args.last_day),
+                                         timedelta(minutes=args.grace))
+
+    def hours(seconds: int) -> str:
+        return f'{seconds / 3600:.2f}'
+
+    print('telegram_id\tсмен\tплан, ч\tотработано по плану, ч\tопозданий\tопоздания, ч\tранних уходов\t'
+          'ранние уходы, ч\tнеявок\tвне плана, ч')
+    for summary in summaries:
+        print(f'{summary.telegram_id}\t{summary.shifts}\t{hours(summary.planned_seconds)}\t'
+              f'{hours(summary.worked_seconds)}\t{summary.late}\t{hours(summary.late_seconds)}\t'
+              f'{summary.early_leaves}\t{hours(summary.early_leave_seconds)}\t{summary.no_shows}\t'
+              f'{hours(summary.unplanned_seconds)}')
+
+    if args.details:
+        with open(args.details, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['shift_id', 'telegram_id', 'start', 'end', 'worked_minutes', 'late_minutes',
+                             'early_leave_minutes', 'no_show'])
+            for summary in summaries:
+                writer.writerows([result.shift_id, result.telegram_id, format_local(result.starts_at),
+                                  format_local(result.ends_at), result.worked_seconds // 60,
+                                  result.late_seconds // 60, result.early_leave_seconds // 60, int(result.no_show)]
+                                 for result in summary.results)
+        private_logger.info(f'Результаты по сменам записаны в {args.details}')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Служебные команды WorkerTimeManagerBot')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='Выгрузка users / work_sessions в Parquet или Arrow')
+    export.add_argument('--out', default='exports', help='Папка для выгрузки')
+    export.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    export.add_argument('--full', action='store_true', help='Выгрузить всю историю, игнорируя watermark')
+    export.add_argument('--chunk-size', type=int, default=10_000, help='Количество строк в одном батче')
+    export.set_defaults(handler=cmd_export)
+
+    rebuild = commands.add_parser('rebuild-rollups', help='Пересчитать итоги отработанного времени по часам / дням')
+    rebuild.add_argument('--check', action='store_true', help='Только сверить с текущими итогами, ничего не меняя')
+    rebuild.set_defaults(handler=cmd_rebuild_rollups)
+
+    import_sites = commands.add_parser('import-sites', help='Добавить рабочие площадки из GeoJSON (Polygon / Point)')
+    import_sites.add_argument('file', help='GeoJSON FeatureCollection; свойства name и radius (м) необязательны')
+    import_sites.add_argument('--radius', type=float, default=100.0,
+                              help='Радиус точки / допуск многоугольника в метрах, если не задан в свойствах')
+    import_sites.set_defaults(handler=cmd_import_sites)
+
+    list_sites = commands.add_parser('list-sites', help='Список рабочих площадок')
+    list_sites.set_defaults(handler=cmd_list_sites)
+
+    remove_site = commands.add_parser('remove-site', help='Удалить рабочую площадку')
+    remove_site.add_argument('id', type=int)
+    remove_site.set_defaults(handler=cmd_remove_site)
+
+    close_time = commands.add_parser('set-close-time', help='Время автоматического закрытия смен площадки / работника')
+    target = close_time.add_mutually_exclusive_group(required=True)
+    target.add_argument('--site', type=int, help='ID площадки (см. list-sites)')
+    target.add_argument('--worker', type=int, help='Telegram ID работника (важнее времени площадки)')
+    close_time.add_argument('time', help='ЧЧ:ММ по местному времени (UTC_OFFSET_HOURS) или off')
+    close_time.set_defaults(handler=cmd_set_close_time)
+
+    check_overlaps = commands.add_parser('check-overlaps',
+                                         help='Найти пересекающиеся сессии работников и сессии с концом раньше начала')
+    check_overlaps.set_defaults(handler=cmd_check_overlaps)
+
+    import_shifts = commands.add_parser('import-shifts', help='Загрузить смены по плану из CSV')
+    import_shifts.add_argument('file', help='CSV с заголовком: telegram_id, start, end (местное время '
+                                            'YYYY-MM-DD HH:MM), необязательный site (ID площадки)')
+    import_shifts.add_argument('--max-errors', type=int, default=50, help='Сколько ошибок показать')
+    import_shifts.set_defaults(handler=cmd_import_shifts)
+
+    reconcile = commands.add_parser('reconcile-shifts', help='Сверка смен по плану с сессиями за период')
+    reconcile.add_argument('first_day', help='Первый день периода, YYYY-MM-DD')
+    reconcile.add_argument('last_day', help='Последний день периода включительно, YYYY-MM-DD')
+    reconcile.add_argument('--grace', type=int, default=5, help='Допустимое опоздание / ранний уход, минуты')
+    reconcile.add_argument('--details', help='CSV, куда записать результаты по каждой смене')
+    reconcile.set_defaults(handler=cmd_reconcile_shifts)
+
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=settings.LOGGING_LEVEL)
+    arguments = build_parser().parse_args()
+    asyncio.run(arguments.handler(arguments))
@@ -0,0 +1,11 @@
+"""
+Окружение для тестов: временная БД и логи, тестовый токен, GUARD_MODE=raise.
+Настройки читаются при импорте app, поэтому окружение задаётся здесь, до импорта тестовых модулей.
+"""
+
+import os
+
+from benchmarks.common import configure_environment
+
+configure_environment([1])
+os.environ['GUARD_MODE'] = 'raise'
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, UTC
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Message, Update
+
+from app.db import queries
+from app.db.models import ensure_schema
+from app.misc.config import settings
+from app.misc.guard import BudgetExceeded
+from benchmarks.common import BENCH_TOKEN
+from main import setup_dispatcher
+
+n_plus_one = Router()
+
+
+@n_plus_one.message(Command('n_plus_one'))
+async def workers_one_by_one(message: Message):
+    # Намеренный N+1: по запросу на каждого работника вместо одного запроса на всех
+    for telegram_id in range(settings.GUARD_MAX_QUERIES + 1):
+        await queries.get_user(telegram_id)
+
+
+def command_update(text: str) -> Update:
+    user = {'id': 42, 'is_bot': False, 'first_name': 'Test'}
+    return Update.model_validate({'update_id': 1, 'message': {
+        'message_id': 1, 'date': int(datetime.now(UTC).timestamp()), 'text': text, 'from': user,
+        'chat': {'id': 42, 'type': 'private'}, 'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+    }})
+
+
+def test_n_plus_one_handler_raises_budget_exceeded():
+    async def feed():
+        await ensure_schema()
+        dp = Dispatcher()
+        dp.include_router(n_plus_one)
+        setup_dispatcher(dp, throttling=False)
+        bot = Bot(BENCH_TOKEN)
+        try:
+            await dp.feed_update(bot, command_update('/n_plus_one'))
+        finally:
+            await bot.session.close()
+
+    with pytest.raises(BudgetExceeded, match='запросов к БД'):
+        asyncio.run(feed())